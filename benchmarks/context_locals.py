@@ -0,0 +1,109 @@
+"""
+Compares the cost of accessing ``pecan.request`` (and of per-request state
+setup and teardown) for the ``contextvars``-backed
+:class:`pecan.core.ContextLocal` against ``threading.local``, and against the
+``__getattr__``-based proxy which Pecan used previously.
+
+Usage::
+
+    $ python benchmarks/context_locals.py [--number N]
+"""
+import argparse
+import threading
+import timeit
+
+from webob import Request
+
+import pecan
+from pecan import core, expose
+
+
+def legacy_proxy(local, key):
+    # the proxy which `pecan.core.proxy` used to build
+    class ObjectProxy(object):
+
+        def __getattr__(self, attr):
+            obj = getattr(local, key)
+            return getattr(obj, attr)
+
+    return ObjectProxy()
+
+
+class RootController(object):
+
+    @expose()
+    def index(self):
+        return 'Hello, World!'
+
+    @expose()
+    def attributes(self):
+        # a controller which leans heavily on the context-local proxies
+        for _ in range(100):
+            pecan.request.environ
+            pecan.response.headers
+        return 'Hello, World!'
+
+
+def timed(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def report(name, access, index=None, attributes=None):
+    line = '%-22s %8.1f ns' % (name, access * 1e9)
+    if index is not None:
+        line += ' %12.1f us %12.1f us' % (index * 1e6, attributes * 1e6)
+    print(line)
+
+
+def bench_legacy(number):
+    local = threading.local()
+    local.request = Request.blank('/')
+    request = legacy_proxy(local, 'request')
+    report('legacy threading.local', timed(lambda: request.environ, number))
+
+
+def bench(name, factory, number):
+    app = pecan.Pecan(RootController(), context_local_factory=factory)
+
+    def request(path):
+        environ = Request.blank(path).environ
+        return lambda: Request(environ.copy()).get_response(app)
+
+    # bind a request directly, to time bare attribute access
+    req = Request.blank('/')
+    if isinstance(core.state, core.ContextLocal):
+        token = core.state.bind(request=req)
+    else:
+        core.state.request = req
+    try:
+        access = timed(lambda: pecan.request.environ, number)
+    finally:
+        if isinstance(core.state, core.ContextLocal):
+            core.state.unbind(token)
+        else:
+            del core.state.request
+
+    requests = max(number // 100, 1)
+    report(
+        name,
+        access,
+        timed(request('/'), requests),
+        timed(request('/attributes'), requests)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+
+    print('%-22s %11s %15s %15s' % (
+        '', 'access', 'request', '200 accesses'
+    ))
+    bench_legacy(args.number)
+    bench('threading.local', threading.local, args.number)
+    bench('ContextLocal', core.ContextLocal, args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ from .core import (
     abort, override_template, Pecan, Request, Response, load_app,
     redirect, render, request, response
 )
-from .decorators import expose
+from .decorators import cached, expose
 from .hooks import RequestViewerHook
 
 from .middleware.debug import DebugMiddleware
@@ -22,12 +22,22 @@ import warnings
 
 
 __all__ = [
-    'make_app', 'load_app', 'Pecan', 'Request', 'Response', 'request',
-    'response', 'override_template', 'expose', 'conf', 'set_config', 'render',
-    'abort', 'redirect', 'route'
+    'make_app', 'load_app', 'Pecan', 'AsyncPecan', 'Request', 'Response',
+    'request', 'response', 'override_template', 'expose', 'conf', 'set_config',
+    'render', 'abort', 'redirect', 'route', 'cached'
 ]
 
 
+def __getattr__(name):
+    # `AsyncPecan` (and with it, asyncio) is only imported when it's used
+    if name == 'AsyncPecan':
+        from .asgi import AsyncPecan
+        return AsyncPecan
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name)
+    )
+
+
 def make_app(root, **kw):
     '''
     Utility for creating the Pecan application object.  This function should
@@ -38,7 +48,22 @@ def make_app(root, **kw):
                  "myapp.controller.root.RootController")
     :param static_root: The relative path to a directory containing static
                         files.  Serving static files is only enabled when
-                        debug mode is set.
+                        debug mode is set, or ``serve_static`` is ``True``.
+    :param serve_static: A flag to serve the files in ``static_root`` even
+                         when debug mode isn't set.
+    :param static_options: A dictionary of additional arguments for
+                           :class:`pecan.middleware.static.StaticFileMiddleware`
+                           (e.g., ``cache_max_age``).
+    :param compress_responses: A flag to compress responses with gzip or
+                               deflate, for clients which support it.
+    :param compression_options: A dictionary of additional arguments for
+                                the compression middleware (e.g.,
+                                ``minimum_size``).
+    :param concurrency_limits: A dictionary of arguments for
+                               :class:`pecan.middleware.concurrency.ConcurrencyLimitMiddleware`
+                               (e.g., ``max_concurrency`` and ``routes``),
+                               which limits the number of requests in
+                               progress at once.
     :param debug: A flag to enable debug mode.  This enables the debug
                   middleware and serving static files.
     :param wrap_app: A function or middleware class to wrap the Pecan app.
@@ -52,6 +77,10 @@ def make_app(root, **kw):
     :param logging: A dictionary used to configure logging.  This uses
                     ``logging.config.dictConfig``.
 
+    When ``static_root`` is set, a ``static_url`` function is added to the
+    template namespace, which returns the URL of a static file (using its
+    fingerprinted copy, if ``pecan fingerprint`` has been run).
+
     All other keyword arguments are passed in to the Pecan app constructor.
 
     :returns: a ``Pecan`` object.
@@ -73,6 +102,16 @@ def make_app(root, **kw):
     # Instantiate the WSGI app by passing **kw onward
     app = Pecan(root, **kw)
 
+    # Fingerprinted static files (see `pecan fingerprint`)
+    static_root = kw.get('static_root', None)
+    static_options = dict(kw.get('static_options', {}))
+    if static_root:
+        manifest = middleware.static.StaticManifest(static_root)
+        static_options.setdefault('manifest', manifest)
+        extra_vars = app.renderers.extra_vars
+        if 'static_url' not in extra_vars.namespace:
+            extra_vars.update({'static_url': manifest.url})
+
     # Optionally wrap the app in another WSGI app
     wrap_app = kw.get('wrap_app', None)
     if wrap_app:
@@ -86,8 +125,25 @@ def make_app(root, **kw):
     # Included for internal redirect support
     app = middleware.recursive.RecursiveMiddleware(app)
 
+    # Compress responses (static files take care of their own compression)
+    if kw.get('compress_responses', False):
+        compression_options = kw.get('compression_options', {})
+        if isinstance(compression_options, Config):
+            compression_options = compression_options.to_dict()
+        app = middleware.compression.CompressionMiddleware(
+            app, **compression_options
+        )
+
+    # Shed load rather than letting requests pile up
+    concurrency_limits = kw.get('concurrency_limits', None)
+    if concurrency_limits:
+        if isinstance(concurrency_limits, Config):
+            concurrency_limits = concurrency_limits.to_dict()
+        app = middleware.concurrency.ConcurrencyLimitMiddleware(
+            app, **concurrency_limits
+        )
+
     # When in debug mode, load exception debugging middleware
-    static_root = kw.get('static_root', None)
     if debug:
         debug_kwargs = getattr(conf, 'debug', {})
         debug_kwargs.setdefault('context_injectors', []).append(
@@ -102,11 +158,19 @@ def make_app(root, **kw):
 
         # Support for serving static files (for development convenience)
         if static_root:
-            app = middleware.static.StaticFileMiddleware(app, static_root)
+            app = middleware.static.StaticFileMiddleware(
+                app, static_root, **static_options
+            )
+
+    elif static_root and kw.get('serve_static', False):
+        app = middleware.static.StaticFileMiddleware(
+            app, static_root, **static_options
+        )
 
     elif static_root:
         warnings.warn(
-            "`static_root` is only used when `debug` is True, ignoring",
+            "`static_root` is only used when `debug` or `serve_static` is "
+            "True, ignoring",
             RuntimeWarning
         )
 
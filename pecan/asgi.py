@@ -0,0 +1,595 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import queue
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from webob import Response as WebObResponse, exc
+
+from . import core
+from .core import ContextLocal, Pecan, RoutingState, response
+from .middleware.recursive import (CheckForRecursionMiddleware,
+                                   ForwardRequestException)
+from .util import _cfg
+
+__all__ = ['AsyncPecan']
+
+_END = object()
+
+# the `_Lane` of the request being handled
+_lane = contextvars.ContextVar('pecan.asgi.lane', default=None)
+
+
+def _settle(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class _Lane(object):
+    '''
+    A thread, taken from an application's thread pool the first time it's
+    needed, which runs all of a request's synchronous hooks and its
+    (synchronous) controller, so that they share any thread-local state
+    (such as a ``scoped_session``), as they do with :class:`pecan.Pecan`.
+
+    If a call is abandoned (because the request's deadline passed while it
+    was running), the lane is too, and anything else is run as it would be
+    without one.
+    '''
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.abandoned = False
+        self._calls = None
+
+    async def run(self, func, *args, **kw):
+        loop = asyncio.get_running_loop()
+        if self._calls is None:
+            self._calls = queue.SimpleQueue()
+            loop.run_in_executor(self.executor, self._serve)
+        future = loop.create_future()
+        context = contextvars.copy_context()
+        self._calls.put(
+            (functools.partial(context.run, func, *args, **kw), future, loop)
+        )
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self.abandoned = True
+            raise
+
+    def _serve(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            func, future, loop = call
+            try:
+                result = func()
+            except BaseException as e:
+                loop.call_soon_threadsafe(_settle, future, None, e)
+            else:
+                loop.call_soon_threadsafe(_settle, future, result, None)
+
+    def close(self):
+        # return the thread to the pool
+        if self._calls is not None:
+            self._calls.put(None)
+
+
+class AsyncPecan(Pecan):
+    '''
+    An ASGI implementation of :class:`pecan.Pecan`, which can be served by
+    any ASGI server (e.g., ``uvicorn myapp.app:application``).
+
+    Controllers, hooks and renderers may be written as coroutines (with
+    ``async def``), and will be awaited.  Synchronous controllers and hooks
+    are run in a bounded thread pool so that they don't block the event
+    loop, which means that existing applications can be served unchanged;
+    routing, ``@expose`` configuration and ``RestController`` dispatch all
+    behave exactly as they do for :class:`pecan.Pecan`.  Each request's
+    synchronous hooks and controller are all run on the same thread, so
+    thread-local state set up by a hook (such as a database session bound by
+    :class:`pecan.hooks.TransactionHook`) is seen by the controller and the
+    hooks which run after it.  Synchronous renderers are run on the event
+    loop.
+
+    ``pecan.request`` and ``pecan.response`` are backed by
+    :class:`pecan.core.ContextLocal`, so they're local to the current
+    request's task (and are available to synchronous controllers running in
+    the thread pool).
+
+    Request bodies are received in full before requests are routed (and are
+    written to a temporary file once they're larger than ``spool_threshold``),
+    and are turned away as soon as they're larger than ``max_body_size``.
+    Requests whose client disconnects before sending the whole body are
+    dropped.
+
+    Takes the same arguments as :class:`pecan.Pecan`, and additionally:
+
+    :param thread_pool_size: The maximum number of threads used to run
+                             synchronous controllers.  Defaults to the
+                             ``concurrent.futures.ThreadPoolExecutor``
+                             default.
+    :param executor: A ``concurrent.futures.Executor`` to run synchronous
+                     controllers in, instead of a private thread pool.
+    '''
+
+    # coalesced requests are all handled on the event loop
+    _flight_event = asyncio.Event
+
+    def __new__(cls, *args, **kw):
+        if kw.get('use_context_locals') is False:
+            raise TypeError(
+                '%s requires `use_context_locals` = True' % cls.__name__
+            )
+        return object.__new__(cls)
+
+    def __init__(self, *args, **kw):
+        executor = kw.pop('executor', None)
+        thread_pool_size = kw.pop('thread_pool_size', None)
+        kw.setdefault('context_local_factory', ContextLocal)
+        super(AsyncPecan, self).__init__(*args, **kw)
+
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                thread_pool_size,
+                thread_name_prefix='pecan'
+            )
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        '''
+        Implements the ASGI specification for Pecan applications.
+        '''
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        elif scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type %r' % scope['type'])
+
+        try:
+            body = await self._read_body(scope, receive)
+        except exc.HTTPRequestEntityTooLarge as e:
+            # turned away before the body has been received (or routed)
+            return await self._send_response(
+                e, self._environ(scope, BytesIO()), send
+            )
+        if body is None:
+            # the client went away before sending the whole body
+            return
+        try:
+            environ = self._environ(scope, body)
+            while True:
+                try:
+                    resp = await self.handle(environ)
+                    break
+                except ForwardRequestException as e:
+                    # internal redirects are handled here, rather than by
+                    # `RecursiveMiddleware`
+                    environ = self._forward(environ, e)
+            await self._send_response(resp, environ, send)
+        finally:
+            body.close()
+
+    async def run_sync(self, func, *args, **kw):
+        '''
+        Calls a synchronous function in the application's thread pool (with
+        access to the current request's context locals) and returns its
+        result.  Useful for calling blocking code from an ``async``
+        controller.  While a request is being handled, this is the thread
+        which runs its synchronous hooks and controller.
+        '''
+        lane = _lane.get()
+        if lane is not None and not lane.abandoned:
+            return await lane.run(func, *args, **kw)
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            functools.partial(context.run, func, *args, **kw)
+        )
+
+    async def handle(self, environ):
+        '''
+        Handles a request for a WSGI ``environ`` (built from an ASGI scope),
+        and returns the ``webob.Response`` to send.
+        '''
+        req = self.request_cls(environ)
+        resp = self.response_cls()
+        state = RoutingState(req, resp, self)
+        environ['pecan.locals'] = {
+            'request': req,
+            'response': resp
+        }
+        controller = None
+
+        # track internal redirects
+        internal_redirect = False
+
+        token = core.state.bind(
+            hooks=[],
+            app=self,
+            request=req,
+            response=resp,
+            controller=None,
+            arguments=None
+        )
+        lane = _Lane(self.executor)
+        lane_token = _lane.set(lane)
+        try:
+            try:
+                # add context and environment to the request
+                req.context = environ.get('pecan.recursive.context', {})
+                req.pecan = dict(content_type=None)
+
+                controller, args, kwargs = await self._find_controller(state)
+                if not req.pecan.get('response_ready'):
+                    await self._invoke_controller(
+                        controller, args, kwargs, state
+                    )
+            except Exception as e:
+                # error responses are never cached
+                req.pecan.pop('cache', None)
+
+                # if this is an HTTP Exception, set it as the response
+                if isinstance(e, exc.HTTPException):
+                    self._set_error_response(state, e)
+
+                # note if this is an internal redirect
+                internal_redirect = isinstance(e, ForwardRequestException)
+
+                # if this is not an internal redirect, run error hooks
+                on_error_result = None
+                if not internal_redirect:
+                    on_error_result = await self._handle_hooks(
+                        self.determine_hooks(state.controller),
+                        'on_error',
+                        state,
+                        e
+                    )
+
+                # if the on_error handler returned a Response, use it.
+                if isinstance(on_error_result, WebObResponse):
+                    state.response = on_error_result
+                else:
+                    if not isinstance(e, exc.HTTPException):
+                        raise
+
+                # if this is an HTTP 405, attempt to specify an Allow header
+                if isinstance(e, exc.HTTPMethodNotAllowed) and controller:
+                    allowed_methods = _cfg(controller).get(
+                        'allowed_methods', []
+                    )
+                    if allowed_methods:
+                        state.response.allow = sorted(allowed_methods)
+            finally:
+                # if this is not an internal redirect (or a response which
+                # was already made), run "after" hooks
+                ready = req.pecan.get('response_ready')
+                if not internal_redirect and not ready:
+                    await self._handle_hooks(
+                        self.determine_hooks(state.controller),
+                        'after',
+                        state
+                    )
+
+            # the first chunk of a streamed response might take a while to
+            # produce, so peek at it from the thread pool
+            stream = self._response_stream(state)
+            if stream is not None:
+                await self.run_sync(stream.peek)
+            self._handle_empty_response_body(state)
+            self._set_etag(state)
+            await self._store_cached(state)
+            self._land_flight(state, state.response)
+            self._handle_not_modified(state)
+        finally:
+            # never leave identical requests waiting on one which failed
+            self._land_flight(state, None)
+            _lane.reset(lane_token)
+            lane.close()
+            core.state.unbind(token)
+
+        return state.response
+
+    async def _find_controller(self, state):
+        req = state.request
+        pecan_state = req.pecan
+        pecan_state['started'] = time.monotonic()
+
+        # store the routing path for the current application to allow hooks to
+        # modify it
+        pecan_state['routing_path'] = path = req.path_info
+
+        # handle "on_route" hooks
+        await self._handle_hooks(self.hooks, 'on_route', state)
+
+        controller, args, kwargs = self._resolve_controller(state, path)
+        self._set_deadline(controller, state)
+        core.state.controller = controller
+        core.state.arguments = state.arguments
+
+        # serve cached responses without running any more hooks (or the
+        # controller itself)
+        if await self._load_cached(controller, state):
+            return controller, args, kwargs
+
+        # wait (without blocking the event loop) for an identical request
+        # which is already in progress, and copy its response
+        flight = self._take_off(controller, state)
+        if flight is not None:
+            try:
+                await asyncio.wait_for(
+                    flight.done.wait(),
+                    self._coalesce_wait(state)
+                )
+            except asyncio.TimeoutError:
+                pass
+            if self._copy_flight(flight, state):
+                return controller, args, kwargs
+        self._check_deadline(state, 'routing')
+
+        # handle "before" hooks
+        await self._handle_hooks(
+            self.determine_hooks(controller),
+            'before',
+            state
+        )
+        self._check_deadline(state, 'before hooks')
+        return controller, args, kwargs
+
+    async def _invoke_controller(self, controller, args, kwargs, state):
+        self._drop_unknown_kwargs(controller, kwargs)
+
+        # answer conditional requests without running the controller, if
+        # it can tell us its version up front
+        if self._check_version(controller, args, kwargs, state):
+            return
+
+        # get the result from the controller, keeping blocking controllers
+        # off of the event loop (on the same thread as the request's hooks)
+        if inspect.iscoroutinefunction(controller):
+            result = controller(*args, **kwargs)
+        else:
+            result = self.run_sync(controller, *args, **kwargs)
+        result = await self._until_deadline(state, result, 'the controller')
+        if inspect.isawaitable(result):
+            result = await self._until_deadline(
+                state, result, 'the controller'
+            )
+        self._check_deadline(state, 'the controller')
+
+        # a controller can return the response object which means they've taken
+        # care of filling it out
+        if result is response:
+            return
+        elif isinstance(result, WebObResponse):
+            state.response = result
+            return
+
+        raw_namespace = result
+        template = self._select_template(controller, state)
+
+        # if there is a template, render it
+        if template:
+            result = self._render_template(controller, template, result, state)
+            if inspect.isawaitable(result):
+                result = await result
+            self._check_deadline(state, 'rendering')
+
+        self._set_response_body(state, template, raw_namespace, result)
+
+    async def _load_cached(self, controller, state):
+        entry = self._cache_entry(controller, state)
+        if entry is None:
+            return False
+        backend, key, _ = entry
+        return self._use_cached_response(
+            state, entry, await self._cache_call(backend, 'get', key)
+        )
+
+    async def _store_cached(self, state):
+        stored = self._cacheable_response(state)
+        if stored is not None:
+            backend, key, value, ttl = stored
+            await self._cache_call(backend, 'set', key, value, ttl)
+
+    async def _cache_call(self, backend, name, *args):
+        # caches which aren't kept in memory (such as a `SQLiteCache`) are
+        # used from the thread pool, so that they don't block the event loop
+        method = getattr(backend, name)
+        if getattr(backend, 'blocking', True):
+            return await self.run_sync(method, *args)
+        return method(*args)
+
+    async def _until_deadline(self, state, awaitable, phase):
+        # awaitables which run past the request's deadline are cancelled (or,
+        # if they're running in the thread pool, abandoned)
+        remaining = self._remaining(state)
+        if remaining is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            self._deadline_exceeded(state, phase)
+
+    async def _handle_hooks(self, hooks, hook_type, *args):
+        core.state.hooks = hooks
+        lane = _lane.get()
+        for hook in self._phase_hooks(hooks, hook_type):
+            method = getattr(hook, hook_type)
+            if lane is None or lane.abandoned or \
+                    inspect.iscoroutinefunction(method):
+                result = method(*args)
+            else:
+                # run synchronous hooks on the request's thread, along with
+                # its controller
+                result = await lane.run(method, *args)
+            if inspect.isawaitable(result):
+                result = await result
+            # on_error hooks can choose to return a Response, which will
+            # be used instead of the standard error pages.
+            if hook_type == 'on_error' and isinstance(result, WebObResponse):
+                return result
+
+    async def _read_body(self, scope, receive):
+        '''
+        Receives a request's body, which is written to a temporary file once
+        it's larger than the spool threshold (rather than held in memory).
+        Bodies larger than the application's ``max_body_size`` are turned
+        away with ``413 Request Entity Too Large`` as soon as that's known.
+        Returns ``None`` if the client disconnects before sending all of it.
+        '''
+        limit = self.max_body_size
+        if limit is not None:
+            for name, value in scope.get('headers', []):
+                if name.lower() == b'content-length' and \
+                        value.isdigit() and int(value) > limit:
+                    raise exc.HTTPRequestEntityTooLarge(
+                        'The request body is larger than %s bytes.' % limit
+                    )
+
+        threshold = self.spool_threshold
+        if threshold is None:
+            threshold = self.request_cls.request_body_tempfile_limit
+        body = tempfile.SpooledTemporaryFile(max_size=threshold)
+        size = 0
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    body.close()
+                    return None
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    raise exc.HTTPRequestEntityTooLarge(
+                        'The request body is larger than %s bytes.' % limit
+                    )
+                body.write(chunk)
+                if not message.get('more_body', False):
+                    return body
+        except BaseException:
+            body.close()
+            raise
+
+    def _environ(self, scope, body):
+        script_name = scope.get('root_path', '')
+        path_info = scope['path']
+        if script_name and path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        server = scope.get('server') or ('localhost', 80)
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path_info.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'asgi.scope': scope,
+            'pecan.recursive.script_name': script_name
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+            environ['REMOTE_PORT'] = str(scope['client'][1])
+
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+            value = value.decode('latin-1')
+            if name in environ:
+                value = environ[name] + ',' + value
+            environ[name] = value
+
+        # the body has already been read in full (even if it was chunked),
+        # and can be rewound, so WebOb never needs to copy it
+        environ['CONTENT_LENGTH'] = str(body.tell())
+        environ['webob.is_body_seekable'] = True
+        body.seek(0)
+        return environ
+
+    def _forward(self, environ, e):
+        # replay the forward through the same middleware factory (and loop
+        # detection) that `RecursiveMiddleware` uses, capturing the environ
+        # that it would have passed on to the application
+        forwarded = []
+
+        def capture(environ, start_response):
+            forwarded.append(environ)
+
+        CheckForRecursionMiddleware(e.factory(capture), environ)(
+            environ,
+            None
+        )
+        return forwarded[0]
+
+    async def _send_response(self, resp, environ, send):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        app_iter = resp(environ, start_response)
+        try:
+            status, headers = started
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers
+                ]
+            })
+            if isinstance(app_iter, (list, tuple)):
+                await send({
+                    'type': 'http.response.body',
+                    'body': b''.join(app_iter)
+                })
+                return
+
+            # other iterables might block, so pull them from the thread pool
+            iterator = iter(app_iter)
+            while True:
+                chunk = await self.run_sync(next, iterator, _END)
+                if chunk is _END:
+                    break
+                if chunk:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True
+                    })
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._owns_executor:
+                    self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
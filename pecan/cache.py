@@ -0,0 +1,388 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+__all__ = [
+    'LRUCache', 'TTLCache', 'SQLiteStore', 'SQLiteCache', 'cache_from_config'
+]
+
+
+class LRUCache(object):
+    '''
+    A thread-safe, size-bounded mapping which evicts its least recently used
+    entries first.  Hits, misses and evictions are counted, and reported by
+    :meth:`stats`.
+
+    :param maxsize: The maximum number of entries to keep.
+    '''
+
+    # whether reading or writing entries blocks (e.g., on I/O), and so
+    # shouldn't be done from an event loop
+    blocking = False
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored for ``key`` (marking it as the most recently
+        used entry), or ``default`` if there isn't one.
+        '''
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        '''
+        Stores ``value`` for ``key``, evicting the least recently used
+        entries if the cache has grown beyond ``maxsize``.
+        '''
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        '''
+        Returns a dictionary of the cache's ``hits``, ``misses``,
+        ``evictions``, current ``size`` and ``maxsize``.
+        '''
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                size=len(self._data),
+                maxsize=self.maxsize
+            )
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TTLCache(LRUCache):
+    '''
+    An :class:`LRUCache` whose entries can expire.  This is the default
+    backend for :func:`pecan.decorators.cached`; any object which implements
+    the same ``get``, ``set``, ``delete``, ``clear`` and ``stats`` methods
+    can be used in its place.  :class:`pecan.AsyncPecan` uses backends from
+    its thread pool unless they set ``blocking = False``.
+
+    :param maxsize: The maximum number of entries to keep.
+    '''
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored for ``key``, or ``default`` if there isn't
+        one (or it has expired).
+        '''
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        '''
+        Stores ``value`` for ``key``, optionally expiring it after ``ttl``
+        seconds.
+        '''
+        expires = None
+        if ttl is not None:
+            expires = time.monotonic() + ttl
+        super(TTLCache, self).set(key, (expires, value))
+
+
+class SQLiteStore(object):
+    '''
+    A base class for state which is kept in a local SQLite database file, and
+    shared by every process that opens it.  Subclasses list the statements
+    which create their tables in ``schema``.
+
+    :param path: The path to the database file (which is created if it
+                 doesn't exist).
+    :param timeout: The number of seconds to wait for another process's
+                    write to finish before giving up.
+    '''
+
+    blocking = True
+
+    schema = ()
+
+    def __init__(self, path, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # create the database up front, so that misconfiguration is
+        # reported at startup
+        self._connection()
+
+    def _connection(self):
+        # connections can't be shared across threads, or carried over into
+        # forked processes
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                # (each connection is only used by the thread which opened
+                # it, but can be closed by any thread)
+                check_same_thread=False
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.schema:
+                conn.execute(statement)
+            local.connection = conn
+            local.pid = os.getpid()
+            with self._connections_lock:
+                self._connections.append((local.pid, conn))
+        return local.connection
+
+    @contextmanager
+    def _transaction(self):
+        # a write transaction, which other processes wait for
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        '''
+        Closes every connection this process has opened to the database
+        (from any thread).  New connections are opened if it's used again.
+        '''
+        pid = os.getpid()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for owner, conn in connections:
+            # connections inherited from a parent process are left alone
+            if owner == pid:
+                conn.close()
+
+
+class SQLiteCache(SQLiteStore):
+    '''
+    A cache stored in a local SQLite database file, which is shared by every
+    process that opens it (such as the workers of ``gunicorn_pecan``), so
+    that a value stored by one of them is a hit for all of them.  Implements
+    the same interface as :class:`TTLCache`.
+
+    Values can be responses (as the ``(status, headerlist, body)`` tuples
+    which :func:`pecan.decorators.cached` stores), ``bytes``, or anything
+    else which can be encoded as JSON (``TypeError`` is raised for anything
+    which can't).  They're stored as plain columns, and never unpickled, so
+    that the database file can't be used to run code in the application.
+
+    Each value is stored in a single transaction, so readers never see
+    partial writes.  Expired entries are purged as new ones are stored,
+    after which the entries which were stored longest ago are evicted until
+    there are no more than ``maxsize`` (reading an entry doesn't count as
+    using it, so that reads never have to wait for a write lock).  Hits,
+    misses and evictions are counted per process.
+
+    :param path: The path to the database file (which is created if it
+                 doesn't exist).
+    :param maxsize: The maximum number of entries to keep.
+    :param timeout: The number of seconds to wait for another process's
+                    write to finish before giving up.
+    '''
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS pecan_cache ('
+        'key TEXT PRIMARY KEY, status TEXT, data TEXT, body BLOB, '
+        'expires REAL, stored REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS pecan_cache_expires '
+        'ON pecan_cache (expires)',
+        'CREATE INDEX IF NOT EXISTS pecan_cache_stored '
+        'ON pecan_cache (stored)'
+    )
+
+    def __init__(self, path, maxsize=1024, timeout=5):
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        super(SQLiteCache, self).__init__(path, timeout)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @staticmethod
+    def _encode(value):
+        # returns the (status, data, body) columns for a value
+        if isinstance(value, tuple) and len(value) == 3 and \
+                isinstance(value[0], str) and isinstance(value[2], bytes):
+            status, headerlist, body = value
+            return status, json.dumps([list(h) for h in headerlist]), body
+        if isinstance(value, bytes):
+            return None, None, value
+        return None, json.dumps(value), None
+
+    @staticmethod
+    def _decode(status, data, body):
+        if status is not None:
+            return status, [tuple(h) for h in json.loads(data)], body
+        if data is not None:
+            return json.loads(data)
+        return body
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored for ``key``, or ``default`` if there isn't
+        one (or it has expired).
+        '''
+        row = self._connection().execute(
+            'SELECT status, data, body FROM pecan_cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return self._decode(*row)
+
+    def set(self, key, value, ttl=None):
+        '''
+        Stores ``value`` for ``key``, optionally expiring it after ``ttl``
+        seconds.
+        '''
+        status, data, body = self._encode(value)
+        now = time.time()
+        expires = None
+        if ttl is not None:
+            expires = now + ttl
+
+        with self._transaction() as conn:
+            conn.execute(
+                'DELETE FROM pecan_cache WHERE expires <= ?', (now,)
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO pecan_cache '
+                '(key, status, data, body, expires, stored) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, status, data, body, expires, now)
+            )
+            evicted = conn.execute(
+                'DELETE FROM pecan_cache WHERE key IN ('
+                'SELECT key FROM pecan_cache ORDER BY stored DESC '
+                'LIMIT -1 OFFSET ?)',
+                (self.maxsize,)
+            ).rowcount
+
+        if evicted > 0:
+            with self._lock:
+                self.evictions += evicted
+
+    def delete(self, key):
+        self._connection().execute(
+            'DELETE FROM pecan_cache WHERE key = ?', (key,)
+        )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM pecan_cache')
+
+    def stats(self):
+        '''
+        Returns a dictionary of this process's ``hits``, ``misses`` and
+        ``evictions``, and the cache's current ``size`` and ``maxsize``.
+        '''
+        size = len(self)
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                size=size,
+                maxsize=self.maxsize
+            )
+
+    def __contains__(self, key):
+        return self._connection().execute(
+            'SELECT 1 FROM pecan_cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM pecan_cache'
+        ).fetchone()[0]
+
+
+#: The cache backends which can be named in configuration
+BACKENDS = {
+    'memory': TTLCache,
+    'sqlite': SQLiteCache
+}
+
+
+def cache_from_config(config):
+    '''
+    Creates a cache from a dictionary of configuration (such as
+    ``pecan.conf.app.response_cache``), which names its ``backend`` (one of
+    ``memory`` or ``sqlite``, defaulting to ``memory``) along with any
+    arguments for it, e.g.::
+
+        response_cache = {
+            'backend': 'sqlite',
+            'path': '/var/tmp/myapp-cache.db',
+            'maxsize': 10000
+        }
+    '''
+    if hasattr(config, 'to_dict'):
+        config = config.to_dict()
+    options = dict(config)
+    backend = options.pop('backend', 'memory')
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            'Unknown cache backend %r (expected one of: %s)' % (
+                backend, ', '.join(sorted(BACKENDS))
+            )
+        )
+    return cls(**options)
@@ -2,3 +2,4 @@ from .base import CommandRunner, BaseCommand  # noqa
 from .serve import ServeCommand  # noqa
 from .shell import ShellCommand  # noqa
 from .create import CreateCommand  # noqa
+from .fingerprint import FingerprintCommand  # noqa
@@ -0,0 +1,31 @@
+"""
+Fingerprint command for Pecan.
+"""
+from __future__ import print_function
+
+from pecan.commands import BaseCommand
+
+
+class FingerprintCommand(BaseCommand):
+    """
+    Fingerprints the static files of a Pecan web application.
+
+    Copies each file in the configured ``app.static_root`` to a name which
+    includes a hash of its contents, and writes a manifest of the copies,
+    which the ``static_url`` template helper uses to refer to them.
+    """
+
+    def run(self, args):
+        super(FingerprintCommand, self).run(args)
+        from pecan import conf, set_config
+        from pecan.middleware.static import fingerprint
+
+        set_config(args.config_file, overwrite=True)
+        static_root = getattr(conf.app, 'static_root', None)
+        if not static_root:
+            raise RuntimeError('`app.static_root` is not configured')
+
+        manifest = fingerprint(static_root)
+        for path in sorted(manifest):
+            print('%s -> %s' % (path, manifest[path]))
+        print('Fingerprinted %d files in %s' % (len(manifest), static_root))
@@ -1,4 +1,5 @@
 import inspect
+from collections import namedtuple
 
 import urllib.parse as urlparse  # noqa
 from urllib.parse import quote, unquote_plus  # noqa
@@ -11,13 +12,10 @@ def is_bound_method(ob):
     return inspect.ismethod(ob) and ob.__self__ is not None
 
 
-def getargspec(func):
-    import sys
-    if sys.version_info < (3, 5):
-        return inspect.getargspec(func)
+ArgSpec = namedtuple('ArgSpec', 'args varargs keywords defaults')
+
 
-    from collections import namedtuple
-    ArgSpec = namedtuple('ArgSpec', 'args varargs keywords defaults')
+def getargspec(func):
     args, varargs, keywords, defaults = inspect.getfullargspec(func)[:4]
     return ArgSpec(args=args, varargs=varargs, keywords=keywords,
                    defaults=defaults)
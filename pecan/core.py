@@ -1,22 +1,30 @@
+from collections.abc import Iterator
+from contextvars import ContextVar, copy_context
+from functools import lru_cache
 from inspect import Arguments
-from itertools import chain, tee
+from itertools import chain
 from mimetypes import guess_type, add_type
 from os.path import splitext
+from time import monotonic
+import hashlib
 import logging
-import operator
 import sys
+import threading
 import types
 
 from webob import (Request as WebObRequest, Response as WebObResponse, exc,
                    acceptparse)
 from webob.multidict import NestedMultiDict
 
-from .compat import urlparse, izip, is_bound_method as ismethod
-from .jsonify import encode as dumps
+from .cache import LRUCache, TTLCache, cache_from_config
+from .compat import urlparse, is_bound_method as ismethod
+from .configuration import Config
+from .hooks import HookChain
+from .jsonify import encode as dumps, decode as loads, set_backend
 from .secure import handle_security
 from .templating import RendererFactory
 from .routing import lookup_controller, NonCanonicalPath
-from .util import _cfg, getargspec
+from .util import _cfg, getargspec, ArgumentBinder
 from .middleware.recursive import ForwardRequestException
 
 
@@ -26,6 +34,32 @@ add_type('application/json', '.json', True)
 state = None
 logger = logging.getLogger(__name__)
 
+ERROR_CONTENT_TYPES = ('text/plain', 'text/html', 'application/json')
+
+# the headers which are kept for ``304 Not Modified`` responses
+NOT_MODIFIED_HEADERS = (
+    'cache-control', 'content-location', 'date', 'etag', 'expires',
+    'last-modified', 'set-cookie', 'vary'
+)
+
+
+@lru_cache(maxsize=1024)
+def negotiate_content_type(accept, offers):
+    '''
+    Returns the content type in ``offers`` which best matches the raw
+    ``Accept`` header value ``accept``, or ``None`` if none of them are
+    acceptable.  Results are cached, since clients tend to send a small
+    number of distinct ``Accept`` headers.
+
+    :param accept: The raw value of the ``Accept`` header.
+    :param offers: A tuple of content types, in order of preference.
+    '''
+    offers = acceptparse.create_accept_header(accept).acceptable_offers(
+        offers
+    )
+    if offers:
+        return offers[0][0]
+
 
 class RoutingState(object):
 
@@ -39,6 +73,74 @@ class RoutingState(object):
         self.arguments = arguments
 
 
+class _Flight(object):
+    '''
+    A request to a controller exposed with ``coalesce=True``, which identical
+    requests wait for (on ``done``) and then take a copy of the ``response``
+    of.
+    '''
+
+    __slots__ = ('done', 'response', 'followers')
+
+    def __init__(self, done):
+        self.done = done
+        self.response = None
+        self.followers = 0
+
+
+class ContextLocal(object):
+    '''
+    A drop-in replacement for ``threading.local`` which is backed by a
+    :class:`contextvars.ContextVar`, so that attributes are local to the
+    current thread, asyncio task or greenlet (and are carried into thread
+    pools which run callables in a copy of the current context).  This is
+    the default context local for :class:`pecan.Pecan`.
+    '''
+
+    __slots__ = ('_var',)
+
+    def __init__(self):
+        object.__setattr__(self, '_var', ContextVar('pecan.state'))
+
+    def bind(self, **attrs):
+        '''
+        Binds a new namespace (populated with ``attrs``) to the current
+        context, and returns a token which can be passed to :meth:`unbind` to
+        restore the previous one.
+        '''
+        return self._var.set(types.SimpleNamespace(**attrs))
+
+    def unbind(self, token):
+        self._var.reset(token)
+
+    def _namespace(self):
+        try:
+            return self._var.get()
+        except LookupError:
+            namespace = types.SimpleNamespace()
+            self._var.set(namespace)
+            return namespace
+
+    @property
+    def __dict__(self):
+        try:
+            return vars(self._var.get())
+        except LookupError:
+            return {}
+
+    def __getattr__(self, name):
+        try:
+            return getattr(self._var.get(), name)
+        except LookupError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        setattr(self._namespace(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._namespace(), name)
+
+
 class Request(WebObRequest):
 
     def __getattribute__(self, name):
@@ -53,6 +155,113 @@ class Response(WebObResponse):
     pass
 
 
+class ResponseStream(object):
+    '''
+    A WSGI ``app_iter`` which streams the chunks of an iterable (such as a
+    generator returned by a controller) as they're produced, encoding any
+    ``str`` chunks with ``charset``.  The iterable is closed when the server
+    closes the response.
+
+    The iterable is run in a copy of the context it was created in, so that
+    ``pecan.request`` and ``pecan.response`` are still available to it while
+    it's streamed (after the request has otherwise been handled, and ``after``
+    hooks have run).
+
+    :param iterable: The iterable of ``bytes`` (or ``str``) chunks to stream.
+    :param charset: The encoding for ``str`` chunks.  Defaults to UTF-8.
+    '''
+
+    def __init__(self, iterable, charset=None):
+        self.iterable = iterable
+        self.charset = charset or 'utf-8'
+        self._iterator = iter(iterable)
+        self._peeked = []
+        self._exhausted = False
+        self._context = copy_context()
+
+    def peek(self):
+        '''
+        Returns ``True`` if the iterable produces any chunks, reading (and
+        holding on to) at most one chunk to find out.
+        '''
+        if not self._peeked and not self._exhausted:
+            for chunk in self._iterator:
+                self._peeked.append(chunk)
+                break
+            else:
+                self._exhausted = True
+        return bool(self._peeked)
+
+    def _chunks(self):
+        peeked, self._peeked = self._peeked, []
+        yield from peeked
+        run, iterator = self._context.run, self._iterator
+        while True:
+            try:
+                yield run(next, iterator)
+            except StopIteration:
+                return
+
+    def __iter__(self):
+        charset = self.charset
+        for chunk in self._chunks():
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            yield chunk
+
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self._context.run(self.iterable.close)
+
+
+class LimitedInput(object):
+    '''
+    Wraps a request's ``wsgi.input`` when the length of its body isn't known
+    in advance (e.g., when it's sent with chunked transfer encoding), and
+    ends the request with ``413 Request Entity Too Large`` as soon as more
+    than ``limit`` bytes of it have been read.
+
+    :param stream: The ``wsgi.input`` stream to wrap.
+    :param limit: The maximum number of bytes which can be read.
+    '''
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.consumed = 0
+
+    def _count(self, data):
+        self.consumed += len(data)
+        if self.consumed > self.limit:
+            raise exc.HTTPRequestEntityTooLarge(
+                'The request body is larger than %s bytes.' % self.limit
+            )
+        return data
+
+    def _remaining(self, size):
+        # read no more than one byte past the limit
+        if size is None or size < 0:
+            size = max(self.limit - self.consumed + 1, 1)
+        return size
+
+    def read(self, size=-1):
+        return self._count(self.stream.read(self._remaining(size)))
+
+    def readline(self, size=-1):
+        return self._count(self.stream.readline(self._remaining(size)))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def _get_state():
+    return state
+
+
+# returns the namespace which holds the current request's state
+_current = _get_state
+
+
 def proxy(key):
     class ObjectProxy(object):
 
@@ -63,11 +272,17 @@ def proxy(key):
             "`use_context_locals` = True."
         )
 
-        def __getattr__(self, attr):
+        def __getattribute__(self, attr):
+            # attributes of the proxy itself are resolved as usual; anything
+            # else is looked up directly on the proxied object (overriding
+            # `__getattribute__`, rather than `__getattr__`, saves a failed
+            # lookup on every access)
+            if attr in proxy_attributes:
+                return object.__getattribute__(self, attr)
             try:
-                obj = getattr(state, key)
-            except AttributeError:
-                raise self.explanation_
+                obj = getattr(_current(), key)
+            except (AttributeError, LookupError):
+                raise explanation
             return getattr(obj, attr)
 
         def __setattr__(self, attr, value):
@@ -82,6 +297,8 @@ def proxy(key):
             obj = getattr(state, key)
             return dir(obj)
 
+    proxy_attributes = frozenset(dir(ObjectProxy))
+    explanation = ObjectProxy.explanation_
     return ObjectProxy()
 
 
@@ -219,12 +436,18 @@ class PecanBase(object):
         ['text/plain']
     )
 
+    # what coalesced requests wait on
+    _flight_event = threading.Event
+
     def __init__(self, root, default_renderer='mako',
                  template_path='templates', hooks=lambda: [],
                  custom_renderers=None, extra_template_vars=None,
                  force_canonical=True, guess_content_type_from_ext=True,
                  context_local_factory=None, request_cls=Request,
-                 response_cls=Response, **kw):
+                 response_cls=Response, route_cache_size=0,
+                 json_backend=None, response_cache=None, etag=False,
+                 request_timeout=None, max_body_size=None,
+                 spool_threshold=None, coalesce_timeout=30, **kw):
         if isinstance(root, str):
             root = self.__translate_root__(root)
 
@@ -238,14 +461,47 @@ class PecanBase(object):
         if callable(hooks):
             hooks = hooks()
 
-        self.hooks = list(sorted(
-            hooks,
-            key=operator.attrgetter('priority')
-        ))
+        self.hooks = HookChain(hooks)
+        self._hook_chains = {}
         self.template_path = template_path
         self.force_canonical = force_canonical
         self.guess_content_type_from_ext = guess_content_type_from_ext
 
+        # memoized (controller, remainder) pairs for static routes
+        self.route_cache = None
+        if route_cache_size:
+            self.route_cache = LRUCache(route_cache_size)
+
+        # the default store for responses to ``@cached`` controllers
+        if response_cache is None:
+            response_cache = TTLCache(1024)
+        elif isinstance(response_cache, (dict, Config)):
+            response_cache = cache_from_config(response_cache)
+        self.response_cache = response_cache
+
+        # generate ETags for (and answer conditional requests to) every
+        # controller which doesn't set ``etag`` itself
+        self.etag = etag
+
+        # the number of seconds requests have to be handled in (unless their
+        # controller sets its own ``timeout``)
+        self.request_timeout = request_timeout
+
+        # the largest request body (in bytes) controllers accept, unless they
+        # set their own ``max_body_size``, and the size past which bodies are
+        # spooled to temporary files, rather than held in memory
+        self.max_body_size = max_body_size
+        self.spool_threshold = spool_threshold
+
+        # requests to ``coalesce`` controllers which are in progress, and the
+        # longest identical requests wait for one
+        self.coalesce_timeout = coalesce_timeout
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+        if json_backend is not None:
+            set_backend(json_backend)
+
     def __translate_root__(self, item):
         '''
         Creates a root controller instance from a string root, e.g.,
@@ -277,9 +533,21 @@ class PecanBase(object):
         :param node: The node, such as a root controller object.
         :param path: The path to look up on this node.
         '''
+        cache = self.route_cache if node is self.root else None
+        if cache is not None:
+            key = (req.method, path)
+            resolved = cache.get(key)
+            if resolved is not None:
+                return resolved[0], list(resolved[1])
+
         path = path.split('/')[1:]
         try:
             node, remainder = lookup_controller(node, path, req)
+            # routes which never touched a `_lookup`, `_default`, `_route`
+            # or a security check always resolve the same way
+            if cache is not None and \
+                    not req.pecan.pop('dynamic_route', False):
+                cache.set(key, (node, tuple(remainder)))
             return node, remainder
         except NonCanonicalPath as e:
             if self.force_canonical and \
@@ -308,12 +576,14 @@ class PecanBase(object):
         if controller:
             controller_hooks = _cfg(controller).get('hooks', [])
             if controller_hooks:
-                return list(
-                    sorted(
-                        chain(controller_hooks, self.hooks),
-                        key=operator.attrgetter('priority')
+                # merge and sort these once per controller
+                key = getattr(controller, '__func__', controller)
+                hooks = self._hook_chains.get(key)
+                if hooks is None:
+                    hooks = self._hook_chains[key] = HookChain(
+                        chain(controller_hooks, self.hooks)
                     )
-                )
+                return hooks
         return self.hooks
 
     def handle_hooks(self, hooks, hook_type, *args):
@@ -324,75 +594,91 @@ class PecanBase(object):
                           ``on_error``, and ``on_route``.
         :param *args: Arguments to pass to the hooks.
         '''
-        if hook_type not in ['before', 'on_route']:
-            hooks = reversed(hooks)
-
-        for hook in hooks:
+        for hook in self._phase_hooks(hooks, hook_type):
             result = getattr(hook, hook_type)(*args)
             # on_error hooks can choose to return a Response, which will
             # be used instead of the standard error pages.
             if hook_type == 'on_error' and isinstance(result, WebObResponse):
                 return result
 
+    def _phase_hooks(self, hooks, hook_type):
+        # only call the hooks which implement this phase
+        phases = getattr(hooks, 'phases', None)
+        if phases is not None:
+            hooks = phases.get(hook_type, hooks)
+
+        if hook_type not in ['before', 'on_route']:
+            hooks = reversed(hooks)
+        return hooks
+
+    def get_binder(self, controller, argspec):
+        '''
+        Returns the :class:`~pecan.util.ArgumentBinder` for a controller,
+        reusing the one compiled by ``@expose`` when it matches ``argspec``.
+        '''
+        binder = _cfg(controller).get('binder')
+        if binder is None or binder.argspec is not argspec:
+            binder = ArgumentBinder(argspec)
+        return binder
+
+    def get_params(self, req):
+        '''
+        Returns the GET/POST parameters for a request as a ``MultiDict``,
+        decoding JSON request bodies.
+        '''
+        if req.method == 'GET':
+            return req.GET
+        elif req.content_type in ('application/json',
+                                  'application/javascript'):
+            try:
+                body = req.body
+                if req.charset.lower() not in ('utf-8', 'utf8'):
+                    body = req.text
+                data = loads(body)
+                if not isinstance(data, dict):
+                    raise TypeError('%s is not a dict' % data)
+                return NestedMultiDict(req.GET, data)
+            except (TypeError, ValueError):
+                pass
+        return req.params
+
     def get_args(self, state, all_params, remainder, argspec, im_self):
         '''
         Determines the arguments for a controller based upon parameters
         passed the argument specification for the controller.
         '''
-        args = []
-        varargs = []
-        kwargs = dict()
-        valid_args = argspec.args[:]
-        if ismethod(state.controller) or im_self:
-            valid_args.pop(0)  # pop off `self`
+        binder = self.get_binder(state.controller, argspec)
         pecan_state = state.request.pecan
 
         remainder = [x for x in remainder if x]
 
-        if im_self is not None:
-            args.append(im_self)
-
         # grab the routing args from nested REST controllers
         if 'routing_args' in pecan_state:
             remainder = pecan_state['routing_args'] + list(remainder)
             del pecan_state['routing_args']
 
-        # handle positional arguments
-        if valid_args and remainder:
-            args.extend(remainder[:len(valid_args)])
-            remainder = remainder[len(valid_args):]
-            valid_args = valid_args[len(args):]
-
-        # handle wildcard arguments
-        if [i for i in remainder if i]:
-            if not argspec[1]:
-                abort(404)
-            varargs.extend(remainder)
-
-        # get the default positional arguments
-        if argspec[3]:
-            defaults = dict(izip(argspec[0][-len(argspec[3]):], argspec[3]))
-        else:
-            defaults = dict()
-
-        # handle positional GET/POST params
-        for name in valid_args:
-            if name in all_params:
-                args.append(all_params.pop(name))
-            elif name in defaults:
-                args.append(defaults[name])
-            else:
-                break
+        return binder.bind(
+            all_params,
+            remainder,
+            im_self,
+            bool(ismethod(state.controller) or im_self)
+        )
 
-        # handle wildcard GET/POST params
-        if argspec[2]:
-            for name, value in iter(all_params.items()):
-                if name not in argspec[0]:
-                    kwargs[name] = value
+    def render(self, template, namespace):
+        renderer, template = self._get_renderer(template)
+        return renderer.render(template, namespace)
 
-        return args, varargs, kwargs
+    def stream(self, template, namespace):
+        '''
+        Renders a template as an iterable of chunks, for renderers which
+        support streaming (and as a single string for those which don't).
+        '''
+        renderer, template = self._get_renderer(template)
+        if hasattr(renderer, 'stream'):
+            return renderer.stream(template, namespace)
+        return renderer.render(template, namespace)
 
-    def render(self, template, namespace):
+    def _get_renderer(self, template):
         if template == 'json':
             renderer = self.renderers.get('json', self.template_path)
         elif ':' in template:
@@ -411,7 +697,7 @@ class PecanBase(object):
                 self.default_renderer,
                 self.template_path
             )
-        return renderer.render(template, namespace)
+        return renderer, template
 
     def find_controller(self, state):
         '''
@@ -420,6 +706,13 @@ class PecanBase(object):
         # get a sorted list of hooks, by priority (no controller hooks yet)
         req = state.request
         pecan_state = req.pecan
+        pecan_state['started'] = monotonic()
+
+        # turn away oversized bodies before any hooks (or routing, which can
+        # look at request parameters) can read them
+        if self.spool_threshold is not None:
+            req.request_body_tempfile_limit = self.spool_threshold
+        self._limit_body(req, self.max_body_size)
 
         # store the routing path for the current application to allow hooks to
         # modify it
@@ -428,6 +721,70 @@ class PecanBase(object):
         # handle "on_route" hooks
         self.handle_hooks(self.hooks, 'on_route', state)
 
+        controller, args, kwargs = self._resolve_controller(state, path)
+        self._set_deadline(controller, state)
+
+        # serve cached responses without running any more hooks (or the
+        # controller itself)
+        if self._load_cached_response(controller, state):
+            return controller, args, kwargs
+
+        # wait for an identical request which is already in progress, and
+        # copy its response
+        flight = self._take_off(controller, state)
+        if flight is not None:
+            flight.done.wait(self._coalesce_wait(state))
+            if self._copy_flight(flight, state):
+                return controller, args, kwargs
+        self._check_deadline(state, 'routing')
+
+        # handle "before" hooks
+        self.handle_hooks(self.determine_hooks(controller), 'before', state)
+        self._check_deadline(state, 'before hooks')
+
+        return controller, args, kwargs
+
+    def _set_deadline(self, controller, state):
+        # the request's deadline is set by its controller's ``timeout`` (or
+        # the application's ``request_timeout``), counting from its start
+        timeout = _cfg(controller).get('timeout', self.request_timeout)
+        pecan_state = state.request.pecan
+        if timeout is not None:
+            pecan_state['deadline'] = pecan_state['started'] + timeout
+
+    def _remaining(self, state):
+        # the number of seconds left before the request's deadline, if it
+        # has one
+        deadline = state.request.pecan.get('deadline')
+        if deadline is not None:
+            return max(deadline - monotonic(), 0)
+
+    def _check_deadline(self, state, phase):
+        '''
+        Ends the request with ``504 Gateway Timeout`` if its deadline has
+        passed (once ``phase`` of handling it has finished).
+        '''
+        deadline = state.request.pecan.get('deadline')
+        if deadline is not None and monotonic() >= deadline:
+            self._deadline_exceeded(state, phase)
+
+    def _deadline_exceeded(self, state, phase):
+        logger.warning(
+            'Request for %s exceeded its deadline during %s',
+            state.request.path,
+            phase
+        )
+        raise exc.HTTPGatewayTimeout('The request took too long to handle.')
+
+    def _resolve_controller(self, state, path):
+        '''
+        Routes ``path`` to a controller, negotiates the response content type
+        and binds the controller's arguments.  Returns a tuple of
+        ``(controller, args, kwargs)``.
+        '''
+        req = state.request
+        pecan_state = req.pecan
+
         # lookup the controller, respecting content-type as requested
         # by the file extension on the URI
         pecan_state['extension'] = None
@@ -469,7 +826,7 @@ class PecanBase(object):
         if not pecan_state['content_type']:
             # attempt to find a best match based on accept headers (if they
             # exist)
-            accept = getattr(req.accept, 'header_value', '*/*') or '*/*'
+            accept = req.environ.get('HTTP_ACCEPT') or '*/*'
             if accept == '*/*' or (
                     accept.startswith('text/html,') and
                     list(content_types.keys()) in self.SIMPLEST_CONTENT_TYPES):
@@ -478,15 +835,11 @@ class PecanBase(object):
                     'text/html'
                 )
             else:
-                best_default = None
-                accept_header = acceptparse.create_accept_header(accept)
-                offers = accept_header.acceptable_offers(
-                    list(content_types.keys())
-                )
-                if offers:
-                    # If content type matches exactly use matched type
-                    best_default = offers[0][0]
-                else:
+                offers = cfg.get('offers')
+                if offers is None:
+                    offers = tuple(content_types)
+                best_default = negotiate_content_type(accept, offers)
+                if best_default is None:
                     # If content type doesn't match exactly see if something
                     # matches when not using parameters
                     for k in content_types.keys():
@@ -521,56 +874,69 @@ class PecanBase(object):
             )
             raise exc.HTTPNotFound
 
-        # fetch any parameters
-        if req.method == 'GET':
-            params = req.GET
-        elif req.content_type in ('application/json',
-                                  'application/javascript'):
-            try:
-                if not isinstance(req.json, dict):
-                    raise TypeError('%s is not a dict' % req.json)
-                params = NestedMultiDict(req.GET, req.json)
-            except (TypeError, ValueError):
-                params = req.params
+        # controllers can lower (but not raise) the application's limit on
+        # the size of request bodies, which has already been applied
+        self._limit_body(req, cfg.get('max_body_size'))
+
+        # fetch any parameters, unless the controller's signature means that
+        # they can't be used (in which case the body is left untouched for
+        # the controller to read itself)
+        binder = self.get_binder(controller, cfg['argspec'])
+        if binder.consumes_params(
+            [x for x in remainder if x],
+            im_self,
+            bool(ismethod(controller) or im_self)
+        ):
+            params = self.get_params(req).mixed()
         else:
-            params = req.params
+            params = {}
 
         # fetch the arguments for the controller
         args, varargs, kwargs = self.get_args(
             state,
-            params.mixed(),
+            params,
             remainder,
             cfg['argspec'],
             im_self
         )
         state.arguments = Arguments(args, varargs, kwargs)
 
-        # handle "before" hooks
-        self.handle_hooks(self.determine_hooks(controller), 'before', state)
-
         return controller, args + varargs, kwargs
 
+    def _limit_body(self, req, limit):
+        '''
+        Ends the request with ``413 Request Entity Too Large`` if its body is
+        larger than ``limit`` bytes, and makes sure that bodies of unknown
+        length can't be read past it.
+        '''
+        if limit is None:
+            return
+        length = req.content_length
+        if length is None:
+            stream = req.environ['wsgi.input']
+            if isinstance(stream, LimitedInput):
+                stream.limit = min(stream.limit, limit)
+            else:
+                req.environ['wsgi.input'] = LimitedInput(stream, limit)
+        elif length > limit:
+            raise exc.HTTPRequestEntityTooLarge(
+                'The request body is larger than %s bytes.' % limit
+            )
+
     def invoke_controller(self, controller, args, kwargs, state):
         '''
         The main request handler for Pecan applications.
         '''
-        cfg = _cfg(controller)
-        content_types = cfg.get('content_types', {})
-        req = state.request
-        resp = state.response
-        pecan_state = req.pecan
+        self._drop_unknown_kwargs(controller, kwargs)
 
-        # If a keyword is supplied via HTTP GET or POST arguments, but the
-        # function signature does not allow it, just drop it (rather than
-        # generating a TypeError).
-        argspec = getargspec(controller)
-        keys = kwargs.keys()
-        for key in keys:
-            if key not in argspec.args and not argspec.keywords:
-                kwargs.pop(key)
+        # answer conditional requests without running the controller, if
+        # it can tell us its version up front
+        if self._check_version(controller, args, kwargs, state):
+            return
 
         # get the result from the controller
         result = controller(*args, **kwargs)
+        self._check_deadline(state, 'the controller')
 
         # a controller can return the response object which means they've taken
         # care of filling it out
@@ -581,8 +947,33 @@ class PecanBase(object):
             return
 
         raw_namespace = result
+        template = self._select_template(controller, state)
+
+        # if there is a template, render it
+        if template:
+            result = self._render_template(controller, template, result, state)
+            self._check_deadline(state, 'rendering')
+
+        self._set_response_body(state, template, raw_namespace, result)
+
+    def _drop_unknown_kwargs(self, controller, kwargs):
+        # If a keyword is supplied via HTTP GET or POST arguments, but the
+        # function signature does not allow it, just drop it (rather than
+        # generating a TypeError).
+        binder = _cfg(controller).get('binder')
+        if binder is None:
+            binder = ArgumentBinder(getargspec(controller))
+        if not binder.keywords:
+            for key in list(kwargs):
+                if key not in binder.names:
+                    kwargs.pop(key)
+
+    def _select_template(self, controller, state):
+        cfg = _cfg(controller)
+        pecan_state = state.request.pecan
 
         # pull the template out based upon content type and handle overrides
+        content_types = cfg.get('content_types', {})
         template = content_types.get(pecan_state['content_type'])
 
         # check if for controller override of template
@@ -596,11 +987,20 @@ class PecanBase(object):
             pecan_state['content_type']
         )
 
-        # if there is a template, render it
-        if template:
-            if template == 'json':
-                pecan_state['content_type'] = 'application/json'
-            result = self.render(template, result)
+        if template == 'json':
+            pecan_state['content_type'] = 'application/json'
+        return template
+
+    def _render_template(self, controller, template, namespace, state):
+        content_type = state.request.pecan['content_type']
+        if content_type in _cfg(controller).get('stream', ()):
+            return self.stream(template, namespace)
+        return self.render(template, namespace)
+
+    def _set_response_body(self, state, template, raw_namespace, result):
+        req = state.request
+        resp = state.response
+        pecan_state = req.pecan
 
         # If we are in a test request put the namespace where it can be
         # accessed directly
@@ -610,6 +1010,14 @@ class PecanBase(object):
             testing_variables['template_name'] = template
             testing_variables['controller_output'] = result
 
+        # stream iterators (such as generators) to the client as they're
+        # consumed, rather than buffering them
+        if isinstance(result, Iterator):
+            if pecan_state['content_type']:
+                resp.content_type = pecan_state['content_type']
+            resp.app_iter = ResponseStream(result, resp.charset)
+            return
+
         # set the body content
         if result and isinstance(result, str):
             resp.text = result
@@ -620,21 +1028,204 @@ class PecanBase(object):
             # set the content type
             resp.content_type = pecan_state['content_type']
 
+    def _load_cached_response(self, controller, state):
+        '''
+        Looks up the cached response for a ``GET`` or ``HEAD`` request to a
+        controller decorated with :func:`pecan.decorators.cached`.  Returns
+        ``True`` (having set it as the response) on a hit.  On a miss, notes
+        where the response should be stored once it's been produced.
+        '''
+        entry = self._cache_entry(controller, state)
+        if entry is None:
+            return False
+        backend, key, cfg = entry
+        return self._use_cached_response(state, entry, backend.get(key))
+
+    def _cache_entry(self, controller, state):
+        '''
+        Returns the ``(backend, key, cfg)`` a ``GET`` or ``HEAD`` request to
+        a controller decorated with :func:`pecan.decorators.cached` is
+        cached under, or ``None`` if it isn't cached.
+        '''
+        cfg = _cfg(controller).get('cache')
+        req = state.request
+        if cfg is None or req.method not in ('GET', 'HEAD'):
+            return None
+
+        # responses in each negotiated content type are cached separately
+        key = cfg['key'](req) if cfg['key'] else req.url
+        key = '\n'.join(
+            [key, req.pecan['content_type'] or ''] +
+            [req.headers.get(name, '') for name in cfg['vary']]
+        )
+        backend = cfg['backend']
+        if backend is None:
+            backend = self.response_cache
+        return backend, key, cfg
+
+    def _use_cached_response(self, state, entry, cached):
+        # sets the response looked up for a cache entry, or (on a miss)
+        # notes where it should be stored once it's been produced
+        if cached is None:
+            state.request.pecan['cache'] = entry
+            return False
+        self._replay_response(state, cached)
+        return True
+
+    def _take_off(self, controller, state):
+        '''
+        For ``GET`` requests to controllers exposed with ``coalesce=True``,
+        returns the :class:`_Flight` of an identical request (by URL and
+        negotiated content type) which is already in progress.  Otherwise,
+        returns ``None`` (and this request is the one which others will wait
+        for, if it's coalesced).
+
+        Requests which wait skip ``before`` and ``after`` hooks (including
+        any which authenticate or authorize them), and the key ignores
+        ``Authorization`` and ``Cookie`` headers, so controllers whose
+        responses depend on who's asking must never be coalesced.
+        '''
+        req = state.request
+        if req.method != 'GET' or not _cfg(controller).get('coalesce'):
+            return None
+
+        key = (req.url, req.pecan['content_type'])
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = _Flight(self._flight_event())
+                req.pecan['flight'] = key
+                return None
+            flight.followers += 1
+            return flight
+
+    def _coalesce_wait(self, state):
+        # how long to wait for an identical request: until this one's
+        # deadline, but for no more than ``coalesce_timeout`` (after which
+        # it's handled as usual, in case that request has hung)
+        timeout, remaining = self.coalesce_timeout, self._remaining(state)
+        if remaining is not None and (timeout is None or remaining < timeout):
+            return remaining
+        return timeout
+
+    def _copy_flight(self, flight, state):
+        '''
+        Sets a copy of a finished :class:`_Flight`'s response as the
+        response.  Returns ``False`` if it didn't produce one which can be
+        shared, in which case the request should be handled as usual.
+        '''
+        if flight.response is None:
+            return False
+        self._replay_response(state, flight.response)
+        return True
+
+    def _replay_response(self, state, stored):
+        '''
+        Sets a response from a stored ``(status, headerlist, body)`` tuple as
+        the response, which doesn't need any more hooks (or the controller)
+        to be run.
+        '''
+        status, headerlist, body = stored
+        state.response = self.response_cls(
+            status=status,
+            headerlist=list(headerlist),
+            body=body
+        )
+        state.request.pecan['response_ready'] = True
+
+    def _land_flight(self, state, resp):
+        '''
+        Releases the requests waiting for this one (if it's a coalesced
+        request), sharing ``resp`` with them if it's possible to.
+        '''
+        key = state.request.pecan.pop('flight', None)
+        if key is None:
+            return
+        with self._flights_lock:
+            flight = self._flights.pop(key)
+        # (error pages are generated as they're sent, per request, and
+        # whether a response is modified depends on the request)
+        if resp is not None and flight.followers and \
+                not isinstance(resp, exc.HTTPException) and \
+                resp.status_int != 304 and \
+                isinstance(resp.app_iter, (list, tuple)) and \
+                'Set-Cookie' not in resp.headers:
+            flight.response = (resp.status, resp.headerlist[:], resp.body)
+        flight.done.set()
+
+    def _store_cached_response(self, state):
+        '''
+        Stores the response to a ``GET`` request which missed the cache, if
+        it can be reused.
+        '''
+        stored = self._cacheable_response(state)
+        if stored is not None:
+            backend, key, value, ttl = stored
+            backend.set(key, value, ttl)
+
+    def _cacheable_response(self, state):
+        '''
+        Returns the ``(backend, key, value, ttl)`` to store the response to a
+        ``GET`` request which missed the cache under, or ``None`` if it can't
+        be reused.
+        '''
+        cache = state.request.pecan.get('cache')
+        if cache is None:
+            return None
+        backend, key, cfg = cache
+        resp = state.response
+        if cfg['vary']:
+            vary = list(resp.vary or ())
+            vary.extend(name for name in cfg['vary'] if name not in vary)
+            resp.vary = vary
+
+        if state.request.method != 'GET' or resp.status_int != 200:
+            return None
+        if not isinstance(resp.app_iter, (list, tuple)):
+            return None
+        if 'Set-Cookie' in resp.headers:
+            return None
+        cache_control = resp.cache_control
+        if cache_control.private or cache_control.no_store:
+            return None
+
+        return (
+            backend,
+            key,
+            (resp.status, resp.headerlist[:], resp.body),
+            cfg['ttl']
+        )
+
+    def _response_stream(self, state):
+        '''
+        Returns the :class:`ResponseStream` (wrapping the iterator, e.g., a
+        generator, if need be) of a ``200`` response which is streamed and
+        whose length isn't known, and so has to be peeked at to find out if
+        it has any content.  Otherwise, returns ``None``.
+        '''
+        resp = state.response
+        if resp.status_int != 200 or resp.content_length:
+            return None
+        app_iter = resp.app_iter
+        if not isinstance(app_iter, (ResponseStream, Iterator)):
+            return None
+        if not isinstance(app_iter, ResponseStream):
+            app_iter = resp.app_iter = ResponseStream(app_iter, resp.charset)
+        return app_iter
+
     def _handle_empty_response_body(self, state):
         # Enforce HTTP 204 for responses which contain no body
         if state.response.status_int == 200:
-            # If the response is a generator...
-            if isinstance(state.response.app_iter, types.GeneratorType):
-                # Split the generator into two so we can peek at one of them
-                # and determine if there is any response body content
-                a, b = tee(state.response.app_iter)
-                try:
-                    next(a)
-                except StopIteration:
-                    # If we hit StopIteration, the body is empty
+            app_iter = state.response.app_iter
+            # If the response is streamed from an iterator (e.g., a
+            # generator)...
+            if isinstance(app_iter, (ResponseStream, Iterator)):
+                # ...and its length isn't known, peek at the first chunk to
+                # determine if there is any response body content
+                stream = self._response_stream(state)
+                if stream is not None and not stream.peek():
+                    # If the iterator is exhausted, the body is empty
                     state.response.status = 204
-                finally:
-                    state.response.app_iter = b
             else:
                 text = None
                 if state.response.charset:
@@ -653,6 +1244,90 @@ class PecanBase(object):
         if state.response.status_int in (204, 304):
             state.response.content_type = None
 
+    def _etag_option(self, state):
+        # the ``etag`` setting for the controller handling the request
+        if state.request.method not in ('GET', 'HEAD') or \
+                state.controller is None:
+            return False
+        return _cfg(state.controller).get('etag', self.etag)
+
+    def _check_version(self, controller, args, kwargs, state):
+        '''
+        Calls the ``etag`` version callable of a controller (with the
+        controller's arguments), and returns ``True`` (having made the
+        response a ``304 Not Modified``) if the request's ``If-None-Match``
+        matches it.
+        '''
+        version = _cfg(controller).get('etag')
+        if not callable(version) or \
+                state.request.method not in ('GET', 'HEAD'):
+            return False
+        version = version(*args, **kwargs)
+        if version is None:
+            return False
+        version = state.request.pecan['etag'] = str(version)
+        if version in state.request.if_none_match:
+            state.response.etag = version
+            self._not_modified(state)
+            return True
+        return False
+
+    def _set_etag(self, state):
+        '''
+        Adds an ``ETag`` to a successful response from a controller with
+        ``etag`` enabled: the version its ``etag`` callable returned, or a
+        hash of the response body (unless it's streamed).
+        '''
+        resp = state.response
+        if resp.status_int != 200 or resp.etag is not None or \
+                not self._etag_option(state):
+            return
+        version = state.request.pecan.get('etag')
+        if version is not None:
+            resp.etag = version
+        elif isinstance(resp.app_iter, (list, tuple)) and resp.body:
+            resp.etag = hashlib.blake2b(resp.body, digest_size=16).hexdigest()
+
+    def _handle_not_modified(self, state):
+        # answer requests whose ``If-None-Match`` matches the response
+        resp = state.response
+        if resp.status_int == 200 and resp.etag is not None and \
+                self._etag_option(state) and \
+                resp.etag in state.request.if_none_match:
+            self._not_modified(state)
+
+    def _not_modified(self, state):
+        # replace the response with a ``304 Not Modified``, keeping the
+        # headers which apply to the response the client already has
+        state.response = self.response_cls(
+            status=304,
+            headerlist=[
+                (name, value) for name, value in state.response.headerlist
+                if name.lower() in NOT_MODIFIED_HEADERS
+            ]
+        )
+
+    def _set_error_response(self, state, e):
+        # if the client asked for JSON, do our best to provide it
+        environ = state.request.environ
+        best_match = negotiate_content_type(
+            environ.get('HTTP_ACCEPT') or '*/*',
+            ERROR_CONTENT_TYPES
+        )
+        state.response = e
+        if best_match == 'application/json':
+            json_body = dumps({
+                'code': e.status_int,
+                'title': e.title,
+                'description': e.detail
+            })
+            if isinstance(json_body, str):
+                e.text = json_body
+            else:
+                e.body = json_body
+            state.response.content_type = best_match
+        environ['pecan.original_exception'] = e
+
     def __call__(self, environ, start_response):
         '''
         Implements the WSGI specification for Pecan applications, utilizing
@@ -672,72 +1347,70 @@ class PecanBase(object):
         # track internal redirects
         internal_redirect = False
 
-        # handle the request
         try:
-            # add context and environment to the request
-            req.context = environ.get('pecan.recursive.context', {})
-            req.pecan = dict(content_type=None)
-
-            controller, args, kwargs = self.find_controller(state)
-            self.invoke_controller(controller, args, kwargs, state)
-        except Exception as e:
-            # if this is an HTTP Exception, set it as the response
-            if isinstance(e, exc.HTTPException):
-                # if the client asked for JSON, do our best to provide it
-                accept_header = acceptparse.create_accept_header(
-                    getattr(req.accept, 'header_value', '*/*') or '*/*')
-                offers = accept_header.acceptable_offers(
-                    ('text/plain', 'text/html', 'application/json'))
-                best_match = offers[0][0] if offers else None
-                state.response = e
-                if best_match == 'application/json':
-                    json_body = dumps({
-                        'code': e.status_int,
-                        'title': e.title,
-                        'description': e.detail
-                    })
-                    if isinstance(json_body, str):
-                        e.text = json_body
-                    else:
-                        e.body = json_body
-                    state.response.content_type = best_match
-                environ['pecan.original_exception'] = e
-
-            # note if this is an internal redirect
-            internal_redirect = isinstance(e, ForwardRequestException)
-
-            # if this is not an internal redirect, run error hooks
-            on_error_result = None
-            if not internal_redirect:
-                on_error_result = self.handle_hooks(
-                    self.determine_hooks(state.controller),
-                    'on_error',
-                    state,
-                    e
-                )
+            # handle the request
+            try:
+                # add context and environment to the request
+                req.context = environ.get('pecan.recursive.context', {})
+                req.pecan = dict(content_type=None)
+
+                controller, args, kwargs = self.find_controller(state)
+                if not req.pecan.get('response_ready'):
+                    self.invoke_controller(controller, args, kwargs, state)
+            except Exception as e:
+                # error responses are never cached
+                req.pecan.pop('cache', None)
+
+                # if this is an HTTP Exception, set it as the response
+                if isinstance(e, exc.HTTPException):
+                    self._set_error_response(state, e)
+
+                # note if this is an internal redirect
+                internal_redirect = isinstance(e, ForwardRequestException)
+
+                # if this is not an internal redirect, run error hooks
+                on_error_result = None
+                if not internal_redirect:
+                    on_error_result = self.handle_hooks(
+                        self.determine_hooks(state.controller),
+                        'on_error',
+                        state,
+                        e
+                    )
 
-            # if the on_error handler returned a Response, use it.
-            if isinstance(on_error_result, WebObResponse):
-                state.response = on_error_result
-            else:
-                if not isinstance(e, exc.HTTPException):
-                    raise
-
-            # if this is an HTTP 405, attempt to specify an Allow header
-            if isinstance(e, exc.HTTPMethodNotAllowed) and controller:
-                allowed_methods = _cfg(controller).get('allowed_methods', [])
-                if allowed_methods:
-                    state.response.allow = sorted(allowed_methods)
-        finally:
-            # if this is not an internal redirect, run "after" hooks
-            if not internal_redirect:
-                self.handle_hooks(
-                    self.determine_hooks(state.controller),
-                    'after',
-                    state
-                )
+                # if the on_error handler returned a Response, use it.
+                if isinstance(on_error_result, WebObResponse):
+                    state.response = on_error_result
+                else:
+                    if not isinstance(e, exc.HTTPException):
+                        raise
+
+                # if this is an HTTP 405, attempt to specify an Allow header
+                if isinstance(e, exc.HTTPMethodNotAllowed) and controller:
+                    allowed_methods = _cfg(controller).get(
+                        'allowed_methods', []
+                    )
+                    if allowed_methods:
+                        state.response.allow = sorted(allowed_methods)
+            finally:
+                # if this is not an internal redirect (or a response which was
+                # already made), run "after" hooks
+                ready = req.pecan.get('response_ready')
+                if not internal_redirect and not ready:
+                    self.handle_hooks(
+                        self.determine_hooks(state.controller),
+                        'after',
+                        state
+                    )
 
-        self._handle_empty_response_body(state)
+            self._handle_empty_response_body(state)
+            self._set_etag(state)
+            self._store_cached_response(state)
+            self._land_flight(state, state.response)
+            self._handle_not_modified(state)
+        finally:
+            # never leave identical requests waiting on one which failed
+            self._land_flight(state, None)
 
         # get the response
         return state.response(environ, start_response)
@@ -745,36 +1418,34 @@ class PecanBase(object):
 
 class ExplicitPecan(PecanBase):
 
-    def get_args(self, state, all_params, remainder, argspec, im_self):
+    def get_binder(self, controller, argspec):
         # When comparing the argspec of the method to GET/POST params,
         # ignore the implicit (req, resp) at the beginning of the function
         # signature
-        if hasattr(state.controller, '__self__'):
-            _repr = '.'.join((
-                state.controller.__self__.__class__.__module__,
-                state.controller.__self__.__class__.__name__,
-                state.controller.__name__
-            ))
-        else:
-            _repr = '.'.join((
-                state.controller.__module__,
-                state.controller.__name__
-            ))
-
-        signature_error = TypeError(
-            'When `use_context_locals` is `False`, pecan passes an explicit '
-            'reference to the request and response as the first two arguments '
-            'to the controller.\nChange the `%s` signature to accept exactly '
-            '2 initial arguments (req, resp)' % _repr
-        )
+        binder = super(ExplicitPecan, self).get_binder(controller, argspec)
         try:
-            positional = argspec.args[:]
-            positional.pop(1)  # req
-            positional.pop(1)  # resp
-            argspec = argspec._replace(args=positional)
+            return binder.explicit()
         except IndexError:
-            raise signature_error
+            if hasattr(controller, '__self__'):
+                _repr = '.'.join((
+                    controller.__self__.__class__.__module__,
+                    controller.__self__.__class__.__name__,
+                    controller.__name__
+                ))
+            else:
+                _repr = '.'.join((
+                    controller.__module__,
+                    controller.__name__
+                ))
+
+            raise TypeError(
+                'When `use_context_locals` is `False`, pecan passes an '
+                'explicit reference to the request and response as the first '
+                'two arguments to the controller.\nChange the `%s` signature '
+                'to accept exactly 2 initial arguments (req, resp)' % _repr
+            )
 
+    def get_args(self, state, all_params, remainder, argspec, im_self):
         args, varargs, kwargs = super(ExplicitPecan, self).get_args(
             state, all_params, remainder, argspec, im_self
         )
@@ -814,11 +1485,59 @@ class Pecan(PecanBase):
                             the content type to return.
     :param use_context_locals: When `True`, `pecan.request` and
                                `pecan.response` will be available as
-                               thread-local references.
+                               context-local references.
+    :param context_local_factory: A callable which returns the object used to
+                                  store context-local state.  Defaults to
+                                  :class:`pecan.core.ContextLocal`.
     :param request_cls: Can be used to specify a custom `pecan.request` object.
                         Defaults to `pecan.Request`.
     :param response_cls: Can be used to specify a custom `pecan.response`
                          object.  Defaults to `pecan.Response`.
+    :param route_cache_size: The number of resolved routes (keyed by request
+                             method and path) to memoize.  Routes which pass
+                             through a ``_lookup``, ``_default``, ``_route``
+                             or a secured controller are never memoized.
+                             Defaults to 0 (disabled).
+    :param json_backend: The name of the library to encode and decode JSON
+                         with (``json`` or ``orjson``), or a
+                         :class:`pecan.jsonify.JSONBackend`.  Note that this
+                         applies to the whole process.  Defaults to the
+                         standard library.
+    :param etag: When ``True``, every controller (unless it's exposed with
+                 ``etag=False``) generates ``ETag`` headers for its responses,
+                 and answers ``GET`` requests whose ``If-None-Match``
+                 matches with ``304 Not Modified``.  Defaults to ``False``.
+    :param request_timeout: The number of seconds requests have to be
+                            handled in (unless their controller is exposed
+                            with its own ``timeout``), after which they end
+                            with ``504 Gateway Timeout``.  Deadlines are
+                            checked between each phase of handling a
+                            request.  Defaults to ``None`` (no deadline).
+    :param max_body_size: The largest request body (in bytes) which the
+                          application accepts (controllers can be exposed
+                          with a lower ``max_body_size``).  Larger requests
+                          end with ``413 Request Entity Too Large`` before
+                          any hooks run or any of their body is read.
+                          Defaults to ``None`` (no limit).
+    :param spool_threshold: The size (in bytes) past which request bodies
+                            (including multipart uploads) are spooled to
+                            temporary files as they're read, rather than
+                            held in memory.  Defaults to WebOb's
+                            ``request_body_tempfile_limit`` (10KB).
+    :param response_cache: The cache which stores the responses of
+                           controllers decorated with
+                           :func:`pecan.decorators.cached` (unless they
+                           specify their own), or a dictionary of
+                           configuration for one (see
+                           :func:`pecan.cache.cache_from_config`).  Defaults
+                           to a :class:`pecan.cache.TTLCache` of 1024
+                           responses.
+    :param coalesce_timeout: The longest (in seconds) a request to a
+                             controller exposed with ``coalesce=True`` waits
+                             for an identical one, after which it's handled
+                             as usual.  ``None`` waits for as long as it
+                             takes (or until the request's deadline).
+                             Defaults to 30.
     '''
 
     def __new__(cls, *args, **kw):
@@ -833,6 +1552,20 @@ class Pecan(PecanBase):
         super(Pecan, self).__init__(*args, **kw)
 
     def __call__(self, environ, start_response):
+        if isinstance(state, ContextLocal):
+            # bind (and later reset) a single context variable, rather than
+            # setting and deleting each attribute individually
+            token = state.bind(
+                hooks=[],
+                app=self,
+                controller=None,
+                arguments=None
+            )
+            try:
+                return super(Pecan, self).__call__(environ, start_response)
+            finally:
+                state.unbind(token)
+
         try:
             state.hooks = []
             state.app = self
@@ -848,19 +1581,27 @@ class Pecan(PecanBase):
             del state.app
 
     def init_context_local(self, local_factory):
-        global state
+        global state, _current
         if local_factory is None:
-            from threading import local as local_factory
+            local_factory = ContextLocal
         state = local_factory()
 
+        # `pecan.request` and `pecan.response` read the current namespace
+        # straight out of the context variable when they can
+        if isinstance(state, ContextLocal):
+            _current = state._var.get
+        else:
+            _current = _get_state
+
     def find_controller(self, _state):
-        state.request = _state.request
-        state.response = _state.response
+        local = _current()
+        local.request = _state.request
+        local.response = _state.response
         controller, args, kw = super(Pecan, self).find_controller(_state)
-        state.controller = controller
-        state.arguments = _state.arguments
+        local.controller = controller
+        local.arguments = _state.arguments
         return controller, args, kw
 
     def handle_hooks(self, hooks, *args, **kw):
-        state.hooks = hooks
+        _current().hooks = hooks
         return super(Pecan, self).handle_hooks(hooks, *args, **kw)
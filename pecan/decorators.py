@@ -1,10 +1,10 @@
 from inspect import getmembers, isclass, isfunction
 
-from .util import _cfg, getargspec
+from .util import _cfg, getargspec, ArgumentBinder
 
 __all__ = [
     'expose', 'transactional', 'accept_noncanonical', 'after_commit',
-    'after_rollback'
+    'after_rollback', 'cached'
 ]
 
 
@@ -44,6 +44,48 @@ def expose(template=None,
                   the function itself, but this can be used to resolve paths
                   which are not valid Python function names, e.g., if you
                   wanted to route a function to `some-special-path'.
+    :param stream: A boolean which, when ``True``, streams the rendered
+                   template to the client as it's generated (for renderers
+                   which support it, such as Jinja and Genshi), rather than
+                   rendering it in full first.
+    :param coalesce: A boolean which, when ``True``, coalesces concurrent
+                     ``GET`` requests for the same URL (and negotiated
+                     content type): while one of them is being handled,
+                     identical requests wait for it (for up to the
+                     application's ``coalesce_timeout``), and then receive
+                     a copy of its response (unless it was streamed or set
+                     a cookie) without running any ``before`` or ``after``
+                     hooks (including any which authenticate them) or the
+                     controller.  Requests are matched regardless of their
+                     ``Authorization`` and ``Cookie`` headers, so never use
+                     this for authenticated controllers, or any whose
+                     responses depend on who is asking for them.
+    :param etag: When ``True``, adds an ``ETag`` (a hash of the response
+                 body) to successful responses to ``GET`` and ``HEAD``
+                 requests, and answers requests whose ``If-None-Match``
+                 matches it with ``304 Not Modified``.  Can also be a
+                 callable, which is passed the controller's arguments and
+                 returns a version (e.g., a row's revision) to use as the
+                 ``ETag``; it's called before the controller, so that a
+                 ``304`` can be returned without running it at all.
+                 ``False`` disables the application's ``etag`` setting for
+                 this controller.
+    :param timeout: The number of seconds requests to this controller have
+                    to be handled in (overriding the application's
+                    ``request_timeout``; ``None`` disables it), after which
+                    they end with ``504 Gateway Timeout``.  The deadline is
+                    checked after routing, ``before`` hooks, the
+                    controller and rendering (but not after ``after``
+                    hooks, which may have committed its work); with
+                    :class:`pecan.AsyncPecan`, controllers which are still
+                    running when it passes are cancelled (or abandoned, if
+                    they're running in the thread pool).
+    :param max_body_size: The largest request body (in bytes) this
+                          controller accepts, which can only lower the
+                          application's ``max_body_size``.  Larger requests
+                          end with ``413 Request Entity Too Large`` once
+                          they've been routed, before their parameters are
+                          parsed.
     '''
 
     content_type = kw.get('content_type', 'text/html')
@@ -72,6 +114,19 @@ def expose(template=None,
         cfg['content_type'] = content_type
         cfg.setdefault('template', []).append(template)
         cfg.setdefault('content_types', {})[content_type] = template
+        if kw.get('stream'):
+            # the content types which should be rendered as a stream
+            cfg.setdefault('stream', set()).add(content_type)
+        if kw.get('coalesce'):
+            cfg['coalesce'] = True
+        if 'etag' in kw:
+            cfg['etag'] = kw['etag']
+        if 'timeout' in kw:
+            cfg['timeout'] = kw['timeout']
+        if 'max_body_size' in kw:
+            cfg['max_body_size'] = kw['max_body_size']
+        # the offered content types, for content negotiation
+        cfg['offers'] = tuple(cfg['content_types'])
 
         # handle generic controllers
         if generic:
@@ -85,8 +140,10 @@ def expose(template=None,
             cfg['allowed_methods'] = []
             f.when = when_for(f)
 
-        # store the arguments for this controller method
+        # store the arguments for this controller method, along with a
+        # binder which maps request arguments onto them
         cfg['argspec'] = getargspec(f)
+        cfg['binder'] = ArgumentBinder(cfg['argspec'])
 
         return f
 
@@ -173,3 +230,42 @@ def accept_noncanonical(func):
 
     _cfg(func)['accept_noncanonical'] = True
     return func
+
+
+def cached(ttl=60, vary=(), key=None, backend=None):
+    '''
+    Caches the responses of a controller method to ``GET`` (and ``HEAD``)
+    requests.  A cached response is served as soon as the request has been
+    routed, without running any ``before`` or ``after`` hooks or the
+    controller itself.  Only successful (``200``) responses which aren't
+    streamed, don't set cookies and aren't marked ``private`` or ``no-store``
+    are cached.
+
+    Since cached responses skip ``before`` hooks (including any which
+    authenticate or authorize requests), and responses are cached regardless
+    of the requests' ``Authorization`` and ``Cookie`` headers (unless they're
+    named in ``vary`` or used by ``key``), never cache authenticated
+    controllers, or any whose responses depend on who is asking for them.
+
+    :param ttl: The number of seconds to cache responses for.  ``None``
+                caches them until they're evicted.
+    :param vary: The names of request headers (e.g., ``('Accept',)``) whose
+                 values responses are cached separately for.
+    :param key: A callable which is passed the request and returns the string
+                to cache its response under.  Defaults to the request's URL.
+                Responses are always cached separately for each negotiated
+                content type.
+    :param backend: The cache to store responses in (see
+                    :class:`pecan.cache.TTLCache`).  Defaults to the
+                    application's ``response_cache``.
+    '''
+
+    def deco(f):
+        _cfg(f)['cache'] = dict(
+            ttl=ttl,
+            vary=tuple(vary),
+            key=key,
+            backend=backend
+        )
+        return f
+    return deco
@@ -1,15 +1,18 @@
 import builtins
+import math
+import operator
 import types
 import sys
 from inspect import getmembers
 
-from webob.exc import HTTPFound
+from webob.exc import HTTPFound, HTTPTooManyRequests
 
+from .ratelimit import TokenBuckets
 from .util import iscontroller, _cfg
 
 __all__ = [
     'PecanHook', 'TransactionHook', 'HookController',
-    'RequestViewerHook'
+    'RequestViewerHook', 'RateLimitHook'
 ]
 
 
@@ -127,6 +130,39 @@ class PecanHook(object):
         return
 
 
+HOOK_PHASES = ('on_route', 'before', 'after', 'on_error')
+
+
+def _implements(hook, phase):
+    '''
+    Returns ``False`` if a hook just inherits the no-op implementation of
+    ``phase`` from :class:`PecanHook`.
+    '''
+    if phase in getattr(hook, '__dict__', ()):
+        return True
+    return getattr(type(hook), phase, None) is not getattr(PecanHook, phase)
+
+
+class HookChain(list):
+    '''
+    A list of hooks, sorted by priority, which also keeps track of which of
+    those hooks actually implement each phase (``on_route``, ``before``,
+    ``after`` and ``on_error``), so that hooks which inherit
+    :class:`PecanHook`'s no-op methods can be skipped.
+
+    :param hooks: An iterable of hooks.
+    '''
+
+    def __init__(self, hooks=()):
+        super(HookChain, self).__init__(
+            sorted(hooks, key=operator.attrgetter('priority'))
+        )
+        self.phases = dict(
+            (phase, [hook for hook in self if _implements(hook, phase)])
+            for phase in HOOK_PHASES
+        )
+
+
 class TransactionHook(PecanHook):
     '''
     :param start: A callable that will bind to a writable database and
@@ -373,3 +409,78 @@ class RequestViewerHook(PecanHook):
         '''
         str_hooks = [str(i).split()[0].strip('<') for i in hooks]
         return [i.split('.')[-1] for i in str_hooks if '.' in i]
+
+
+class RateLimitHook(PecanHook):
+    '''
+    :param rate: The number of requests per second each client may make (on
+                 average).
+    :param burst: The number of requests a client may make at once (after
+                  being idle).  Defaults to ``rate`` (or ``1``, if that's
+                  lower).
+    :param key: A callable which is passed the request and returns the key
+                (e.g., an API token) to limit its rate by, or ``None`` to not
+                limit it.
+    :param header: The name of a request header (e.g., ``X-Api-Key``) to
+                   limit the rate of requests by, for requests which have it.
+    :param store: The token buckets to use (see :mod:`pecan.ratelimit`).
+                  Defaults to an in-process
+                  :class:`~pecan.ratelimit.TokenBuckets`.  Under
+                  :class:`pecan.AsyncPecan`, stores which block (such as
+                  :class:`~pecan.ratelimit.SQLiteTokenBuckets`) are used
+                  from its thread pool, rather than the event loop.
+
+    Limits the rate of requests from each client with a token bucket,
+    rejecting requests beyond it with ``429 Too Many Requests`` and a
+    ``Retry-After`` header.  Requests are checked in ``on_route``, before
+    they're routed or their parameters are parsed, so that rejecting them
+    costs very little.  By default, clients are identified by their IP
+    address (i.e., ``REMOTE_ADDR``).
+
+    For more detailed documentation about this hook, please see
+    :ref:`ratelimithook`
+    '''
+
+    def __init__(self, rate, burst=None, key=None, header=None, store=None):
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        if burst is not None and burst < 1:
+            raise ValueError('burst must be at least 1')
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.key = key
+        self.header = header
+        self.store = store if store is not None else TokenBuckets()
+
+    def get_key(self, request):
+        '''
+        Returns the key to limit the rate of a request by, or ``None`` to not
+        limit it.
+        '''
+        if self.key is not None:
+            return self.key(request)
+        if self.header is not None:
+            value = request.headers.get(self.header)
+            if value:
+                return '%s:%s' % (self.header, value)
+        return request.remote_addr
+
+    def on_route(self, state):
+        key = self.get_key(state.request)
+        if key is None:
+            return
+        run_sync = getattr(state.app, 'run_sync', None)
+        if run_sync is not None and getattr(self.store, 'blocking', False):
+            # keep stores which block off of AsyncPecan's event loop
+            return self._take_in_thread_pool(run_sync, key)
+        self._check(self.store.take(key, self.rate, self.burst))
+
+    async def _take_in_thread_pool(self, run_sync, key):
+        wait = await run_sync(self.store.take, key, self.rate, self.burst)
+        self._check(wait)
+
+    def _check(self, wait):
+        if wait:
+            raise HTTPTooManyRequests(
+                headers=[('Retry-After', str(max(int(math.ceil(wait)), 1)))]
+            )
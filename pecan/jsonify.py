@@ -1,7 +1,16 @@
+import dataclasses
+import enum
+import json
+import uuid
+import warnings
+from collections.abc import Iterator
 from datetime import datetime, date
 from decimal import Decimal
 from functools import singledispatch
 from json import JSONEncoder
+from json.encoder import encode_basestring_ascii
+from keyword import iskeyword
+from operator import attrgetter
 
 from webob.multidict import MultiDict
 
@@ -91,38 +100,112 @@ class GenericJSON(JSONEncoder):
             # but only in recent versions
             return float(obj)
         elif is_saobject(obj):
-            props = {}
-            for key in obj.__dict__:
-                if not key.startswith('_sa_'):
-                    props[key] = getattr(obj, key)
-            return props
+            return _encode_saobject(obj)
         elif isinstance(obj, ResultProxy):
-            props = dict(rows=list(obj), count=obj.rowcount)
-            if props['count'] < 0:
-                props['count'] = len(props['rows'])
-            return props
+            return _encode_result_proxy(obj)
         elif isinstance(obj, LegacyCursorResult):
-            rows = [dict(row._mapping) for row in obj.fetchall()]
-            return {'count': len(rows), 'rows': rows}
+            return _encode_legacy_result(obj)
         elif isinstance(obj, LegacyRow):
-            return dict(obj._mapping)
+            return _encode_legacy_row(obj)
         elif isinstance(obj, RowProxy):
-            if obj.__class__.__name__ == 'Row':
-                # SQLAlchemy 2.0 support
-                obj = obj._mapping
-            return dict(obj)
+            return _encode_row(obj)
         elif isinstance(obj, MultiDict):
             return obj.mixed()
         else:
             return JSONEncoder.default(self, obj)
 
 
+def _call_json(obj):
+    return obj.__json__()
+
+
+def _encode_saobject(obj):
+    props = {}
+    for key in obj.__dict__:
+        if not key.startswith('_sa_'):
+            props[key] = getattr(obj, key)
+    return props
+
+
+def _encode_result_proxy(obj):
+    props = dict(rows=list(obj), count=obj.rowcount)
+    if props['count'] < 0:
+        props['count'] = len(props['rows'])
+    return props
+
+
+def _encode_legacy_result(obj):
+    rows = [dict(row._mapping) for row in obj.fetchall()]
+    return {'count': len(rows), 'rows': rows}
+
+
+def _encode_legacy_row(obj):
+    return dict(obj._mapping)
+
+
+def _encode_row(obj):
+    if obj.__class__.__name__ == 'Row':
+        # SQLAlchemy 2.0 support
+        obj = obj._mapping
+    return dict(obj)
+
+
 _default = GenericJSON()
 
 
+def _class_encoder(cls):
+    # the branch of `GenericJSON.default` which handles instances of `cls`,
+    # when that can be decided from the class alone
+    if callable(getattr(cls, '__json__', None)):
+        return _call_json
+    elif issubclass(cls, (date, datetime)):
+        return str
+    elif issubclass(cls, Decimal):
+        return float
+    elif is_saobject(cls):
+        return _encode_saobject
+    elif issubclass(cls, ResultProxy):
+        return _encode_result_proxy
+    elif issubclass(cls, LegacyCursorResult):
+        return _encode_legacy_result
+    elif issubclass(cls, LegacyRow):
+        return _encode_legacy_row
+    elif issubclass(cls, RowProxy):
+        return _encode_row
+    elif issubclass(cls, MultiDict):
+        return MultiDict.mixed
+
+
+# encoders for each type, resolved the first time it's encoded (and reset
+# whenever a new `jsonify` rule is registered)
+_encoders = {}
+
+
+def _resolve_encoder(cls):
+    rule = jsonify.dispatch(cls)
+    if rule is not _jsonify_default:
+        return rule
+    # fall back to `GenericJSON.default`'s (per-instance) checks for
+    # anything else
+    return _class_encoder(cls) or _default.default
+
+
 def with_when_type(f):
     # Add some backwards support for simplegeneric's API
-    f.when_type = f.register
+    register = f.register
+
+    def register_and_reset(cls, func=None):
+        global _overrides_orjson
+        registered = register(cls, func)
+        if func is None and registered is not cls:
+            # `register(cls)` (for a type, or a union of them) returns a
+            # decorator; the rule is registered when it's applied
+            return lambda func: register_and_reset(cls, func)
+        _encoders.clear()
+        _overrides_orjson = None
+        return registered
+
+    f.register = f.when_type = register_and_reset
     return f
 
 
@@ -132,13 +215,370 @@ def jsonify(obj):
     return _default.default(obj)
 
 
+_jsonify_default = jsonify.dispatch(object)
+
+
 class GenericFunctionJSON(GenericJSON):
     def default(self, obj):
-        return jsonify(obj)
+        cls = obj.__class__
+        try:
+            encoder = _encoders[cls]
+        except KeyError:
+            encoder = _encoders[cls] = _resolve_encoder(cls)
+        return encoder(obj)
 
 
 _instance = GenericFunctionJSON()
 
 
+#
+# backends
+#
+
+class JSONBackend(object):
+    '''
+    Encodes and decodes JSON with the standard library's :mod:`json` module.
+    This is the default backend.
+
+    Subclasses can use a different library, but should apply the ``jsonify``
+    rules (with ``_instance.default``) to any types the library doesn't
+    support natively.
+    '''
+    name = 'json'
+
+    #: The item and key separators :meth:`encode` uses, which
+    #: :func:`iterencode` uses, too.
+    separators = (', ', ': ')
+
+    def encode(self, obj):
+        return _instance.encode(obj)
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+# types which orjson encodes itself, without consulting ``default`` (and so
+# any ``jsonify`` rules for them), unlike the standard library
+_ORJSON_NATIVE = (uuid.UUID, enum.Enum)
+
+# whether a ``jsonify`` rule has been registered for one of them (worked out
+# when it's next needed)
+_overrides_orjson = None
+
+
+def _rules_override_orjson():
+    global _overrides_orjson
+    if _overrides_orjson is None:
+        _overrides_orjson = any(
+            cls is not object and issubclass(cls, _ORJSON_NATIVE)
+            for cls in jsonify.registry
+        )
+    return _overrides_orjson
+
+
+class OrjsonBackend(JSONBackend):
+    '''
+    Encodes and decodes JSON with `orjson <https://github.com/ijl/orjson>`_.
+
+    Dates, datetimes and dataclasses are still encoded with the ``jsonify``
+    rules, and anything orjson rejects (such as integers larger than 64 bits)
+    is encoded by the standard library instead (with the same separators).
+    orjson encodes UUIDs and enums itself, so once a ``jsonify`` rule has
+    been registered for either, everything is encoded by the standard
+    library, so that the rule still applies.
+    '''
+    name = 'orjson'
+    separators = (',', ':')
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.options = (
+            orjson.OPT_NON_STR_KEYS |
+            orjson.OPT_PASSTHROUGH_DATETIME |
+            orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+        self._fallback = GenericFunctionJSON(
+            separators=self.separators,
+            ensure_ascii=False
+        )
+
+    def encode(self, obj):
+        if _rules_override_orjson():
+            return self._fallback.encode(obj)
+        try:
+            encoded = self.orjson.dumps(
+                obj,
+                default=_instance.default,
+                option=self.options
+            )
+        except self.orjson.JSONEncodeError:
+            return self._fallback.encode(obj)
+        return encoded.decode('utf-8')
+
+    def decode(self, data):
+        return self.orjson.loads(data)
+
+
+_backends = {
+    'json': JSONBackend,
+    'orjson': OrjsonBackend
+}
+
+_backend = JSONBackend()
+
+
+def set_backend(backend):
+    '''
+    Selects the backend used by :func:`encode` and :func:`decode` (and so by
+    the ``json`` renderer and for decoding JSON request bodies), for the
+    whole process.
+
+    :param backend: The name of a backend (``json`` or ``orjson``), or a
+                    :class:`JSONBackend` instance.  If the library for a named
+                    backend isn't installed, a warning is issued and the
+                    standard library is used instead.
+    '''
+    global _backend
+    if isinstance(backend, str):
+        if backend not in _backends:
+            raise ValueError('Unknown JSON backend %r' % backend)
+        try:
+            backend = _backends[backend]()
+        except ImportError:
+            warnings.warn(
+                'The %r JSON backend is not installed; falling back to the '
+                'standard library' % backend,
+                RuntimeWarning
+            )
+            backend = JSONBackend()
+    _backend = backend
+    return backend
+
+
+def get_backend():
+    '''
+    Returns the :class:`JSONBackend` currently in use.
+    '''
+    return _backend
+
+
 def encode(obj):
-    return _instance.encode(obj)
+    return _backend.encode(obj)
+
+
+def decode(data):
+    return _backend.decode(data)
+
+
+def _field_names(cls):
+    if dataclasses.is_dataclass(cls):
+        return [field.name for field in dataclasses.fields(cls)]
+    names = []
+    for klass in reversed(cls.__mro__):
+        slots = klass.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in ('__dict__', '__weakref__') and name not in names:
+                names.append(name)
+    if not names:
+        raise TypeError(
+            '%s does not define __slots__ or dataclass fields; pass the '
+            'names of the fields to encode explicitly' % cls.__name__
+        )
+    return names
+
+
+def _attribute_name(cls, name):
+    # private names are mangled with the name of the class which defines
+    # them (which, for a slot, may be one of ``cls``'s base classes)
+    if not name.startswith('__') or name.endswith('__'):
+        return name
+    for klass in cls.__mro__:
+        mangled = '_%s%s' % (klass.__name__.lstrip('_'), name)
+        if mangled in klass.__dict__:
+            return mangled
+    return '_%s%s' % (cls.__name__.lstrip('_'), name)
+
+
+def register_fields(cls=None, fields=None):
+    '''
+    Registers a ``jsonify`` rule for ``cls``, which encodes its instances as
+    a dictionary of the named attributes (fetched with a single
+    :func:`operator.attrgetter`).  These rules avoid the per-attribute
+    introspection of a hand-written (or generic) rule, so they're
+    considerably faster for classes which are serialized in bulk.  Can be
+    used as a class decorator::
+
+        @register_fields
+        @dataclasses.dataclass
+        class Point:
+            x: int
+            y: int
+
+    :param cls: The class to register a rule for.
+    :param fields: The names of the attributes to encode.  Defaults to the
+                   class's dataclass fields, or its ``__slots__`` (including
+                   those of its base classes).
+    '''
+    if cls is None:
+        return lambda cls: register_fields(cls, fields)
+
+    names = tuple(fields if fields is not None else _field_names(cls))
+    for name in names:
+        if not name.isidentifier() or iskeyword(name):
+            raise ValueError('%r is not a valid attribute name' % name)
+    attrs = [_attribute_name(cls, name) for name in names]
+
+    if len(attrs) == 1:
+        name, getter = names[0], attrgetter(attrs[0])
+
+        def encode_fields(obj):
+            return {name: getter(obj)}
+    elif attrs:
+        getter = attrgetter(*attrs)
+
+        def encode_fields(obj):
+            return dict(zip(names, getter(obj)))
+    else:
+        def encode_fields(obj):
+            return {}
+
+    encode_fields.__name__ = encode_fields.__qualname__ = (
+        'jsonify_%s' % cls.__name__
+    )
+    jsonify.register(cls, encode_fields)
+    return cls
+
+
+#
+# streaming
+#
+
+def _stream_key(key):
+    # mirrors the handling of non-string keys in `json.JSONEncoder`
+    if isinstance(key, str):
+        pass
+    elif isinstance(key, float):
+        key = encode(key)
+    elif key is True:
+        key = 'true'
+    elif key is False:
+        key = 'false'
+    elif key is None:
+        key = 'null'
+    elif isinstance(key, int):
+        key = int.__repr__(key)
+    else:
+        raise TypeError(
+            'keys must be str, int, float, bool or None, '
+            'not %s' % key.__class__.__name__
+        )
+    return encode_basestring_ascii(key)
+
+
+def _stream_rows(result, batch_size, counter):
+    fetchmany = getattr(result, 'fetchmany', None)
+    if fetchmany is None:
+        for row in result:
+            counter[0] += 1
+            yield row
+        return
+    while True:
+        rows = fetchmany(batch_size)
+        if not rows:
+            break
+        counter[0] += len(rows)
+        yield from rows
+
+
+def _streamable(obj):
+    # objects with a custom `jsonify` rule are always encoded by that rule
+    return isinstance(obj, (Iterator, ResultProxy)) and \
+        jsonify.dispatch(obj.__class__) is _jsonify_default
+
+
+_NESTED = (dict, list, tuple, Iterator, ResultProxy)
+
+
+def _stream(obj, batch_size, separators):
+    item_separator, key_separator = separators
+    if isinstance(obj, dict):
+        if not any(isinstance(v, _NESTED) for v in obj.values()):
+            # flat objects are encoded in one go
+            yield encode(obj)
+            return
+        separator = '{'
+        for key, value in obj.items():
+            yield separator + _stream_key(key) + key_separator
+            yield from _stream(value, batch_size, separators)
+            separator = item_separator
+        yield '}'
+    elif isinstance(obj, (list, tuple)):
+        if not any(isinstance(v, _NESTED) for v in obj):
+            yield encode(obj)
+            return
+        yield from _stream_items(obj, batch_size, separators)
+    elif not _streamable(obj):
+        yield encode(obj)
+    elif isinstance(obj, ResultProxy):
+        # stream the rows in batches, and count them as they're fetched
+        counter = [0]
+        yield '{"rows"' + key_separator
+        yield from _stream_items(
+            _stream_rows(obj, batch_size, counter),
+            batch_size,
+            separators
+        )
+        count = obj.rowcount
+        if count < 0:
+            count = counter[0]
+        yield '%s"count"%s%d}' % (item_separator, key_separator, count)
+    else:
+        yield from _stream_items(obj, batch_size, separators)
+
+
+def _stream_items(items, batch_size, separators):
+    separator = '['
+    for value in items:
+        if isinstance(value, _NESTED):
+            yield separator
+            yield from _stream(value, batch_size, separators)
+        else:
+            yield separator + encode(value)
+        separator = separators[0]
+    yield '[]' if separator == '[' else ']'
+
+
+def iterencode(obj, chunk_size=16384, batch_size=1000):
+    '''
+    Encodes ``obj`` as ``JSON`` incrementally, yielding ``str`` chunks of
+    about ``chunk_size`` characters, so that large results can be streamed
+    without ever being held in memory in full.  The output is laid out like
+    :func:`encode`'s, with the current backend's ``separators`` (so it's
+    compact with ``orjson``), and decodes to the same value.
+
+    Dictionaries, lists and tuples are encoded item by item.  Iterators
+    (such as generators) are encoded as lists, and SQLAlchemy
+    ``ResultProxy`` objects have their rows fetched ``batch_size`` at a time
+    (with their ``count`` determined once all of the rows have been
+    encoded).  Everything else is encoded with :func:`encode`, so ``jsonify``
+    rules apply as usual.
+
+    :param obj: The object to encode.
+    :param chunk_size: The approximate size of each chunk, in characters.
+    :param batch_size: The number of rows to fetch from a ``ResultProxy`` at
+                       a time.
+    '''
+    chunk = []
+    size = 0
+    for piece in _stream(obj, batch_size, _backend.separators):
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
@@ -1,3 +1,5 @@
+from . import compression
+from . import concurrency
 from . import errordocument
 from . import recursive
 from . import static
@@ -0,0 +1,211 @@
+import zlib
+
+from .static import COMPRESSIBLE_TYPES
+
+# the wbits argument for each content-coding's zlib container
+ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+
+def _choose_encoding(accept_encoding, encodings=('gzip', 'deflate')):
+    '''
+    Returns the first of ``encodings`` which an ``Accept-Encoding`` header
+    allows (preferring those with higher quality values), or ``None``.
+    '''
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name == 'x-gzip':
+            name = 'gzip'
+        qualities[name] = q
+
+    best, best_q = None, 0
+    for encoding in encodings:
+        q = qualities.get(encoding, qualities.get('*', 0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressedIterable(object):
+    '''
+    Compresses the chunks of a WSGI application's response as they're
+    produced.  Responses which are streamed (i.e., anything other than a list
+    or tuple of chunks) are flushed after every chunk, so that clients
+    receive each one as soon as it's available.
+
+    :param app_iter: The application's response iterable.
+    :param compressor: A list which holds the ``zlib`` compression object to
+                       use, once the application has called
+                       ``start_response`` (chunks are passed through as they
+                       are while it's empty).
+    :param stream: Whether to flush the compressor after every chunk.
+    '''
+
+    def __init__(self, app_iter, compressor, stream=False):
+        self.app_iter = app_iter
+        self.compressor = compressor
+        self.stream = stream
+
+    def __iter__(self):
+        for chunk in self.app_iter:
+            if not self.compressor:
+                yield chunk
+                continue
+            if not chunk:
+                continue
+            compressor = self.compressor[0]
+            data = compressor.compress(chunk)
+            if self.stream:
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        if self.compressor:
+            yield self.compressor[0].flush()
+
+    def close(self):
+        if hasattr(self.app_iter, 'close'):
+            self.app_iter.close()
+
+
+class CompressionMiddleware(object):
+    '''
+    Compresses responses with gzip or deflate (depending on the request's
+    ``Accept-Encoding``) as they're sent, including streamed responses.
+
+    Only successful responses of compressible types (and at least
+    ``minimum_size`` bytes, when their length is known) are compressed.
+    Responses which are already encoded, partial (``206``) or can't have a
+    body (``204``, ``304`` or responses to ``HEAD`` requests) are sent as
+    they are, but responses which could be compressed are always marked with
+    ``Vary: Accept-Encoding``.
+
+    :param app: The application to wrap.
+    :param minimum_size: The minimum size (in bytes) of responses to
+                         compress.
+    :param compressible_types: The content types (or prefixes, like
+                               ``text/``) of responses to compress.
+    :param compress_level: The ``zlib`` compression level (1 to 9).
+    :param encodings: The content-codings to use, in order of preference.
+    '''
+
+    def __init__(self, app, minimum_size=512,
+                 compressible_types=COMPRESSIBLE_TYPES, compress_level=6,
+                 encodings=('gzip', 'deflate')):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressible_types = tuple(compressible_types)
+        self.compress_level = compress_level
+        self.encodings = tuple(e for e in encodings if e in ENCODINGS)
+
+    def __call__(self, environ, start_response):
+        encoding = _choose_encoding(
+            environ.get('HTTP_ACCEPT_ENCODING', ''),
+            self.encodings
+        )
+        compressor = []
+        started = []
+
+        def compressing_start_response(status, headers, exc_info=None):
+            started.append(status)
+            if not self.is_compressible(status, headers):
+                return start_response(status, headers, exc_info)
+
+            headers = self.vary(headers)
+            if encoding is None:
+                return start_response(status, headers, exc_info)
+
+            headers = [
+                (name, value) for name, value in headers
+                if name.lower() not in ('content-length', 'content-encoding')
+            ]
+            headers.append(('Content-Encoding', encoding))
+            for i, (name, value) in enumerate(headers):
+                # this is a different representation of the resource, so
+                # its ETag can only be a weak one
+                if name.lower() == 'etag' and not value.startswith('W/'):
+                    headers[i] = (name, 'W/' + value)
+
+            compressor[:] = [zlib.compressobj(
+                self.compress_level, zlib.DEFLATED, ENCODINGS[encoding]
+            )]
+            write = start_response(status, headers, exc_info)
+
+            def compressing_write(data):
+                write(compressor[0].compress(data))
+            return compressing_write
+
+        app_iter = self.app(environ, compressing_start_response)
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            # the headers for HEAD are the same as they would be for GET, but
+            # there's no body to compress
+            return app_iter
+        if started and not compressor:
+            return app_iter
+        # the application may not call `start_response` until its response
+        # is iterated over, so the compressor is looked up lazily
+        return CompressedIterable(
+            app_iter,
+            compressor,
+            stream=not isinstance(app_iter, (list, tuple))
+        )
+
+    def is_compressible(self, status, headers):
+        '''
+        Determines whether a response (identified by its status and headers)
+        can be compressed.
+        '''
+        try:
+            code = int(status.split(' ', 1)[0])
+        except ValueError:
+            return False
+        if code < 200 or code in (204, 206, 304):
+            return False
+
+        content_type = ''
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                if value.strip().lower() not in ('', 'identity'):
+                    return False
+            elif name == 'content-type':
+                content_type = value.split(';', 1)[0].strip().lower()
+            elif name == 'content-length':
+                try:
+                    if int(value) < self.minimum_size:
+                        return False
+                except ValueError:
+                    return False
+            elif name == 'cache-control':
+                if 'no-transform' in value.lower():
+                    return False
+        return bool(content_type) and content_type.startswith(
+            self.compressible_types
+        )
+
+    def vary(self, headers):
+        '''
+        Adds ``Accept-Encoding`` to a response's ``Vary`` header.
+        '''
+        headers = list(headers)
+        for i, (name, value) in enumerate(headers):
+            if name.lower() == 'vary':
+                fields = [v.strip().lower() for v in value.split(',')]
+                if 'accept-encoding' not in fields and '*' not in fields:
+                    headers[i] = (name, value + ', Accept-Encoding')
+                return headers
+        headers.append(('Vary', 'Accept-Encoding'))
+        return headers
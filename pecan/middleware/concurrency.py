@@ -0,0 +1,194 @@
+import threading
+from time import monotonic
+
+from webob import exc
+
+
+class Budget(object):
+    '''
+    A limit on the number of requests which can be in progress at once,
+    which counts the requests it ``admitted``, ``queued`` (i.e., made to wait
+    for a slot) and ``shed`` (i.e., turned away).
+
+    :param limit: The maximum number of requests in progress.
+    '''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = self.queued = self.shed = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    def acquire(self, deadline):
+        '''
+        Takes a slot, waiting until ``deadline`` (in terms of
+        ``time.monotonic``) for one to become free.  Returns ``False`` if
+        none did.
+        '''
+        with self._cond:
+            if self.in_flight >= self.limit:
+                self.queued += 1
+                while self.in_flight >= self.limit:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self._cond.wait(remaining)
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            # wake every waiter (which each check for a free slot and their
+            # own deadline), so that the wakeup can't be lost to one which
+            # has been shed
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                limit=self.limit,
+                in_flight=self.in_flight,
+                admitted=self.admitted,
+                queued=self.queued,
+                shed=self.shed
+            )
+
+
+class ReleasingIterable(object):
+    '''
+    Passes through a response's body, releasing the request's slots once it
+    has been sent (i.e., when the server closes it).
+    '''
+
+    def __init__(self, app_iter, release):
+        self.app_iter = app_iter
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            self.release()
+
+
+class ConcurrencyLimitMiddleware(object):
+    '''
+    Limits the number of requests which are in progress at once, for the
+    whole application and for individual path prefixes (e.g., to stop a
+    slow ``/reports`` endpoint from tying up every worker).
+
+    Requests which arrive when there's no room for them wait briefly (for up
+    to ``queue_timeout`` seconds) for a slot to become free, and are then
+    turned away with ``503 Service Unavailable`` and a ``Retry-After``
+    header, rather than piling up behind slow requests.  The counts of
+    admitted, queued and shed requests are reported by :meth:`stats`, and
+    the middleware is available to the application as
+    ``environ['pecan.concurrency']``.
+
+    :param app: The application to wrap.
+    :param max_concurrency: The maximum number of requests in progress
+                            across the application (or ``None`` for no
+                            limit).
+    :param routes: A dictionary of path prefixes (e.g., ``/reports``) to the
+                   maximum number of requests in progress for the paths
+                   beneath them.  The longest matching prefix applies.
+    :param queue_timeout: The number of seconds a request waits for a slot
+                          before it's turned away.
+    :param retry_after: The value (in seconds) of the ``Retry-After`` header
+                        of ``503`` responses.
+    '''
+
+    def __init__(self, app, max_concurrency=None, routes=None,
+                 queue_timeout=0.1, retry_after=1):
+        self.app = app
+        self.budget = None
+        if max_concurrency:
+            self.budget = Budget(max_concurrency)
+        self.routes = dict(
+            (prefix.rstrip('/') or '/', Budget(limit))
+            for prefix, limit in dict(routes or {}).items()
+        )
+        # check the longest prefixes first
+        self._prefixes = sorted(self.routes, key=len, reverse=True)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+    def __call__(self, environ, start_response):
+        environ['pecan.concurrency'] = self
+        deadline = monotonic() + self.queue_timeout
+
+        budgets = []
+        route = self.route_budget(environ.get('PATH_INFO') or '/')
+        # wait for the route's (narrower) budget first, so that requests
+        # queued for a busy route don't hold on to application-wide slots
+        for budget in (route, self.budget):
+            if budget is None:
+                continue
+            if not budget.acquire(deadline):
+                for acquired in budgets:
+                    acquired.release()
+                return self.shed(environ, start_response)
+            budgets.append(budget)
+
+        if not budgets:
+            return self.app(environ, start_response)
+
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                for budget in budgets:
+                    budget.release()
+
+        try:
+            app_iter = self.app(environ, start_response)
+        except Exception:
+            release()
+            raise
+        if isinstance(app_iter, (list, tuple)):
+            # the response has been produced in full, and only needs to be
+            # sent
+            release()
+            return app_iter
+        return ReleasingIterable(app_iter, release)
+
+    def route_budget(self, path):
+        '''
+        Returns the :class:`Budget` for the longest prefix of ``path``, or
+        ``None``.
+        '''
+        for prefix in self._prefixes:
+            if prefix == '/' or path == prefix or \
+                    path.startswith(prefix + '/'):
+                return self.routes[prefix]
+        return None
+
+    def shed(self, environ, start_response):
+        '''
+        Turns a request away with ``503 Service Unavailable``.
+        '''
+        resp = exc.HTTPServiceUnavailable(
+            'The server is too busy to handle this request.',
+            headers=[('Retry-After', str(self.retry_after))]
+        )
+        return resp(environ, start_response)
+
+    def stats(self):
+        '''
+        Returns the counters of the application-wide budget (as ``global``,
+        if there is one) and of each route's (in ``routes``).
+        '''
+        stats = dict(routes=dict(
+            (prefix, budget.stats()) for prefix, budget in self.routes.items()
+        ))
+        if self.budget is not None:
+            stats['global'] = self.budget.stats()
+        return stats
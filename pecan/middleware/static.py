@@ -5,11 +5,31 @@ This code is adapted from the Werkzeug project, under the BSD license.
 :license: BSD, see LICENSE for more details.
 """
 
+import hashlib
+import json
 import os
 import mimetypes
+import shutil
+import stat
+import zlib
 from datetime import datetime
-from datetime import timezone
-from time import gmtime
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+from time import gmtime, monotonic
+
+from ..cache import LRUCache
+
+MANIFEST_NAME = 'static-manifest.json'
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml'
+)
 
 
 class FileWrapper(object):
@@ -89,9 +109,208 @@ def http_date(timestamp=None):
     return _dump_date(timestamp, ' ')
 
 
+def _parse_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _parse_range(value, size):
+    """Parses a ``Range`` header for a file of `size` bytes into a
+    ``(start, end)`` pair (with an exclusive end), or returns ``None`` if the
+    header can't be honored and the whole file should be sent instead.
+    Returns ``(None, None)`` if the range can't be satisfied.
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        # only a single byte range is supported
+        return None
+    first, sep, last = spec.strip().partition('-')
+    try:
+        if not sep:
+            return None
+        elif not first:
+            # the final `last` bytes
+            length = int(last)
+            if length <= 0:
+                return None, None
+            return max(size - length, 0), size
+        start = int(first)
+        end = int(last) + 1 if last else None
+    except ValueError:
+        return None
+    if start < 0 or (end is not None and end <= start):
+        return None
+    if start >= size:
+        return None, None
+    return start, min(end or size, size)
+
+
+class _RangeWrapper(FileWrapper):
+    """Yields at most `length` bytes of a file, starting at `start`."""
+
+    def __init__(self, file, start, length, buffer_size=8192):
+        super(_RangeWrapper, self).__init__(file, buffer_size)
+        self.file.seek(start)
+        self.remaining = length
+
+    def __next__(self):
+        if self.remaining <= 0:
+            raise StopIteration()
+        data = self.file.read(min(self.buffer_size, self.remaining))
+        if not data:
+            raise StopIteration()
+        self.remaining -= len(data)
+        return data
+
+
+def _accepts_gzip(accept_encoding):
+    """Returns whether an ``Accept-Encoding`` header allows gzip."""
+    accepted = None
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+        if name not in ('gzip', 'x-gzip', '*'):
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name != '*':
+            # an explicit gzip takes precedence over *
+            return q > 0
+        accepted = q > 0
+    return bool(accepted)
+
+
+class _StaticFile(object):
+    """The (cached) details of a file which can be served."""
+
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'mime_type',
+                 'cache_control', 'data', 'gzipped', 'compressible',
+                 'validators', 'headers')
+
+    def __init__(self, path, size, mtime, etag, mime_type, cache_control,
+                 encoding=None, vary=False, data=None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.etag = etag
+        self.mime_type = mime_type
+        self.cache_control = cache_control
+        self.data = data
+        # a precompressed version of the file
+        self.gzipped = None
+        self.compressible = False
+        # the headers which are also sent with a 304
+        self.validators = [
+            ('Cache-Control', cache_control),
+            ('Last-Modified', http_date(mtime)),
+            ('ETag', etag)
+        ]
+        if vary:
+            self.validators.append(('Vary', 'Accept-Encoding'))
+        self.headers = self.validators + [
+            ('Content-Type', mime_type),
+            ('Accept-Ranges', 'bytes')
+        ]
+        if encoding:
+            self.headers.append(('Content-Encoding', encoding))
+
+
+def fingerprint(directory, manifest_name=MANIFEST_NAME, hash_length=12):
+    """Copies each file under `directory` to a name which includes a hash
+    of its contents (e.g., ``css/app.css`` to ``css/app.0123456789ab.css``),
+    and writes a manifest of the copies (which :class:`StaticManifest`
+    reads).
+
+    Precompressed ``.gz`` siblings are copied along with the file they
+    belong to.  Copies from previous runs are left in place, so pages which
+    refer to them keep working.
+
+    :param directory: the directory of static files.
+    :param manifest_name: the name of the manifest (in `directory`).
+    :param hash_length: the number of hex digits of the hash to use.
+    :returns: the manifest, a dictionary of paths to fingerprinted paths.
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.relpath(os.path.join(root, name), directory)
+            paths.append(path.replace(os.sep, '/'))
+    all_paths = set(paths)
+
+    manifest = {}
+    for path in paths:
+        if path == manifest_name or (
+                path.endswith('.gz') and path[:-3] in all_paths):
+            continue
+
+        filename = os.path.join(directory, path)
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()[:hash_length]
+
+        if '.%s.' % digest in path + '.':
+            # a copy from a previous run
+            continue
+        base, ext = os.path.splitext(path)
+        fingerprinted = '%s.%s%s' % (base, digest, ext)
+        # copies keep the original's mtime, so that precompressed files
+        # aren't considered stale
+        shutil.copy2(filename, os.path.join(directory, fingerprinted))
+        if path + '.gz' in all_paths:
+            shutil.copy2(
+                filename + '.gz',
+                os.path.join(directory, fingerprinted + '.gz')
+            )
+        manifest[path] = fingerprinted
+
+    with open(os.path.join(directory, manifest_name), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class StaticManifest(object):
+    """The manifest of fingerprinted static files written by
+    :func:`fingerprint` (or the ``pecan fingerprint`` command).  Its
+    :meth:`url` method is available in templates as ``static_url`` when
+    ``static_root`` is configured.
+
+    :param directory: the directory of static files.
+    :param prefix: the URL which `directory` is served from.
+    :param manifest_name: the name of the manifest (in `directory`).
+    """
+
+    def __init__(self, directory, prefix='/', manifest_name=MANIFEST_NAME):
+        self.prefix = prefix
+        self.paths = {}
+        filename = os.path.join(directory, manifest_name)
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                self.paths = json.load(f)
+        self.fingerprinted = frozenset(self.paths.values())
+
+    def url(self, path):
+        """Returns the URL of a static file, which is its fingerprinted copy
+        if there is one.
+
+        :param path: the path of the file, relative to the static directory.
+        """
+        path = path.lstrip('/')
+        return self.prefix + self.paths.get(path, path)
+
+
 class StaticFileMiddleware(object):
-    """A WSGI middleware that provides static content for development
-    environments.
+    """A WSGI middleware that provides static content.
 
     Currently the middleware does not support non ASCII filenames.  If the
     encoding on the file system happens to be the encoding of the URI it may
@@ -102,37 +321,231 @@ class StaticFileMiddleware(object):
     module.  If it's unable to figure out the charset it will fall back
     to `fallback_mimetype`.
 
+    Conditional requests (``If-None-Match`` and ``If-Modified-Since``) are
+    answered with ``304 Not Modified``, and single byte ranges (including
+    ``If-Range``) are supported.  The results of looking up files are cached
+    for `stat_ttl` seconds, small files are kept in memory, and larger files
+    are sent with the WSGI server's ``wsgi.file_wrapper`` (which typically
+    uses ``sendfile``) when it's available.
+
+    Clients which accept gzip are sent a precompressed sibling of the file
+    (e.g., ``app.js.gz`` for ``app.js``) if there is one.  Otherwise, files
+    of compressible types are compressed once, and the compressed version is
+    kept in memory (until the file changes).
+
+    Fingerprinted files listed in a :class:`StaticManifest` are sent with
+    ``Cache-Control: public, max-age=31536000, immutable``, so that clients
+    never revalidate them.
+
     :param app: the application to wrap.  If you don't want to wrap an
                 application you can pass it :exc:`NotFound`.
     :param directory: the directory to serve up.
     :param fallback_mimetype: the fallback mimetype for unknown files.
+    :param cache_max_age: if set, the number of seconds clients may cache
+                          files for (as ``Cache-Control: max-age``).
+    :param stat_ttl: the number of seconds to cache the results of looking up
+                     a path (including paths which don't exist) for.  ``0``
+                     disables the cache.
+    :param stat_cache_size: the maximum number of paths to cache lookups for.
+    :param memory_cache_size: the maximum number of small files to keep in
+                              memory.  ``0`` disables the cache.
+    :param memory_cache_file_size: the maximum size (in bytes) of files to
+                                   keep in memory.
+    :param serve_precompressed: whether to serve precompressed ``.gz``
+                                siblings of files.
+    :param compress_cache_size: the maximum number of compressed files to
+                                keep in memory.  ``0`` disables compression
+                                of files without a precompressed sibling.
+    :param compress_min_size: the minimum size (in bytes) of files to
+                              compress.
+    :param compress_max_size: the maximum size (in bytes) of files to
+                              compress.
+    :param compressible_types: the mimetypes (or mimetype prefixes, like
+                               ``text/``) of the files to compress.
+    :param manifest: a :class:`StaticManifest` of fingerprinted files.
     """
 
-    def __init__(self, app, directory, fallback_mimetype='text/plain'):
+    def __init__(self, app, directory, fallback_mimetype='text/plain',
+                 cache_max_age=None, stat_ttl=1, stat_cache_size=1024,
+                 memory_cache_size=128, memory_cache_file_size=64 * 1024,
+                 serve_precompressed=True, compress_cache_size=128,
+                 compress_min_size=256, compress_max_size=1024 * 1024,
+                 compressible_types=COMPRESSIBLE_TYPES, manifest=None):
         self.app = app
         self.loader = self.get_directory_loader(directory)
         self.fallback_mimetype = fallback_mimetype
-
-    def _opener(self, filename):
-        return lambda: (
-            open(filename, 'rb'),
-            datetime.fromtimestamp(
-                os.path.getmtime(filename),
-                tz=timezone.utc
-            ),
-            int(os.path.getsize(filename))
-        )
+        self.cache_control = 'public'
+        if cache_max_age is not None:
+            self.cache_control = 'public, max-age=%d' % cache_max_age
+        self.stat_ttl = stat_ttl
+        self.stat_cache = LRUCache(stat_cache_size)
+        self.memory_cache = None
+        if memory_cache_size:
+            self.memory_cache = LRUCache(memory_cache_size)
+        self.memory_cache_file_size = memory_cache_file_size
+        self.serve_precompressed = serve_precompressed
+        self.compress_cache = None
+        if compress_cache_size:
+            self.compress_cache = LRUCache(compress_cache_size)
+        self.compress_min_size = compress_min_size
+        self.compress_max_size = compress_max_size
+        self.compressible_types = tuple(compressible_types)
+        self.immutable = frozenset()
+        if manifest is not None:
+            self.immutable = manifest.fingerprinted
 
     def get_directory_loader(self, directory):
         def loader(path):
             path = path or directory
             if path is not None:
                 path = os.path.join(directory, path)
-            if os.path.isfile(path):
-                return os.path.basename(path), self._opener(path)
+            try:
+                st = os.stat(path)
+            except (OSError, ValueError):
+                return None, None
+            if stat.S_ISREG(st.st_mode):
+                return path, st
             return None, None
         return loader
 
+    def find_file(self, path):
+        """Returns the :class:`_StaticFile` for a (sanitized) path, or
+        ``None`` if there isn't a file to serve there.
+        """
+        if self.stat_ttl:
+            now = monotonic()
+            cached = self.stat_cache.get(path)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+
+        static_file = None
+        filename, st = self.loader(path)
+        if filename is not None:
+            mime_type = (
+                mimetypes.guess_type(filename)[0] or self.fallback_mimetype
+            )
+            cache_control = self.cache_control
+            if path in self.immutable:
+                cache_control = IMMUTABLE_CACHE_CONTROL
+            gzipped = None
+            if self.serve_precompressed:
+                gz_filename, gz_st = self.loader(path + '.gz')
+                # ignore stale precompressed files
+                if gz_filename is not None and gz_st.st_mtime >= st.st_mtime:
+                    gzipped = self._static_file(
+                        gz_filename, gz_st, mime_type, cache_control,
+                        encoding='gzip', vary=True
+                    )
+            compressible = (
+                self.compress_cache is not None and
+                mime_type.startswith(self.compressible_types) and
+                self.compress_min_size <= st.st_size <= self.compress_max_size
+            )
+            static_file = self._static_file(
+                filename, st, mime_type, cache_control,
+                vary=gzipped is not None or compressible
+            )
+            static_file.gzipped = gzipped
+            static_file.compressible = compressible
+
+        if self.stat_ttl:
+            self.stat_cache.set(path, (now + self.stat_ttl, static_file))
+        return static_file
+
+    def _static_file(self, filename, st, mime_type, cache_control, **kw):
+        return _StaticFile(
+            filename,
+            st.st_size,
+            int(st.st_mtime),
+            '"%x-%x"' % (st.st_mtime_ns, st.st_size),
+            mime_type,
+            cache_control,
+            **kw
+        )
+
+    def gzip_file(self, static_file):
+        """Returns the gzipped version of a file: its precompressed sibling,
+        a (cached) compressed copy, or the file itself if it shouldn't be
+        compressed.
+        """
+        if static_file.gzipped is not None:
+            return static_file.gzipped
+        if not static_file.compressible:
+            return static_file
+
+        key = (static_file.path, static_file.etag)
+        compressed = self.compress_cache.get(key)
+        if compressed is None:
+            with open(static_file.path, 'rb') as f:
+                data = f.read()
+            # a gzip (rather than zlib) wrapper
+            compressor = zlib.compressobj(
+                9, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+            data = compressor.compress(data) + compressor.flush()
+            if len(data) < static_file.size:
+                compressed = _StaticFile(
+                    static_file.path,
+                    len(data),
+                    static_file.mtime,
+                    static_file.etag[:-1] + '-gzip"',
+                    static_file.mime_type,
+                    static_file.cache_control,
+                    encoding='gzip',
+                    vary=True,
+                    data=data
+                )
+            else:
+                # not worth it
+                compressed = static_file
+            self.compress_cache.set(key, compressed)
+        return compressed
+
+    def is_not_modified(self, environ, static_file):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = [
+                etag.strip() for etag in if_none_match.split(',')
+            ]
+            return '*' in etags or any(
+                etag == static_file.etag or etag[2:] == static_file.etag
+                for etag in etags
+            )
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            timestamp = _parse_date(if_modified_since)
+            return timestamp is not None and static_file.mtime <= timestamp
+        return False
+
+    def get_range(self, environ, static_file):
+        range_header = environ.get('HTTP_RANGE')
+        if not range_header:
+            return None
+        if_range = environ.get('HTTP_IF_RANGE')
+        if if_range:
+            if if_range.startswith(('"', 'W/')):
+                if if_range != static_file.etag:
+                    return None
+            elif _parse_date(if_range) != static_file.mtime:
+                return None
+        return _parse_range(range_header, static_file.size)
+
+    def read_file(self, static_file):
+        """Returns the contents of a small file from the in-memory cache
+        (reading it into the cache first if needed), or ``None`` for files
+        which shouldn't be kept in memory.
+        """
+        if (self.memory_cache is None or
+                static_file.size > self.memory_cache_file_size):
+            return None
+        cached = self.memory_cache.get(static_file.path)
+        if cached is not None and cached[0] == static_file.etag:
+            return cached[1]
+        with open(static_file.path, 'rb') as f:
+            data = f.read()
+        self.memory_cache.set(static_file.path, (static_file.etag, data))
+        return data
+
     def __call__(self, environ, start_response):
         # sanitize the path for non unix systems
         cleaned_path = environ.get('PATH_INFO', '').strip('/')
@@ -142,23 +555,51 @@ class StaticFileMiddleware(object):
         path = '/'.join([''] + [x for x in cleaned_path.split('/')
                                 if x and x != '..'])
 
-        # attempt to find a loader for the file
-        real_filename, file_loader = self.loader(path[1:])
-        if file_loader is None:
+        # attempt to find the file
+        static_file = self.find_file(path[1:])
+        if static_file is None:
             return self.app(environ, start_response)
-
-        # serve the file with the appropriate name if we found it
-        guessed_type = mimetypes.guess_type(real_filename)
-        mime_type = guessed_type[0] or self.fallback_mimetype
-        f, mtime, file_size = file_loader()
+        if _accepts_gzip(environ.get('HTTP_ACCEPT_ENCODING', '')):
+            static_file = self.gzip_file(static_file)
 
         headers = [('Date', http_date())]
-        headers.append(('Cache-Control', 'public'))
-        headers.extend((
-            ('Content-Type', mime_type),
-            ('Content-Length', str(file_size)),
-            ('Last-Modified', http_date(mtime))
-        ))
-
-        start_response('200 OK', headers)
+        if self.is_not_modified(environ, static_file):
+            headers.extend(static_file.validators)
+            start_response('304 Not Modified', headers)
+            return []
+        headers.extend(static_file.headers)
+
+        status = '200 OK'
+        start, end = 0, static_file.size
+        byte_range = self.get_range(environ, static_file)
+        if byte_range is not None:
+            start, end = byte_range
+            if start is None:
+                headers.extend((
+                    ('Content-Range', 'bytes */%d' % static_file.size),
+                    ('Content-Length', '0')
+                ))
+                start_response('416 Range Not Satisfiable', headers)
+                return []
+            status = '206 Partial Content'
+            headers.append(('Content-Range', 'bytes %d-%d/%d' % (
+                start, end - 1, static_file.size
+            )))
+        headers.append(('Content-Length', str(end - start)))
+
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            start_response(status, headers)
+            return []
+
+        data = static_file.data
+        if data is None:
+            data = self.read_file(static_file)
+        if data is not None:
+            start_response(status, headers)
+            return FileWrapper(BytesIO(data[start:end]), max(end - start, 1))
+
+        f = open(static_file.path, 'rb')
+        start_response(status, headers)
+        if byte_range is not None:
+            return _RangeWrapper(f, start, end - start)
         return wrap_file(environ, f)
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .cache import SQLiteStore
+
+__all__ = ['TokenBuckets', 'SQLiteTokenBuckets']
+
+
+def _refill(tokens, updated, now, rate, burst, cost):
+    # returns the bucket's tokens after (trying to) take ``cost`` of them,
+    # and the number of seconds until it could have (or 0, if it did)
+    tokens = min(burst, tokens + max(now - updated, 0) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0
+    return tokens, (cost - tokens) / rate
+
+
+class TokenBuckets(object):
+    '''
+    In-process token buckets, for :class:`pecan.hooks.RateLimitHook`.
+
+    Buckets are split between ``shards``, each with its own lock, so that
+    concurrent requests rarely wait for each other.  Each shard keeps its
+    most recently used buckets (an evicted bucket is simply refilled).
+
+    :param maxsize: The maximum number of buckets to keep.
+    :param shards: The number of independently locked shards.
+    '''
+
+    # whether ``take`` blocks (e.g., on I/O), and so shouldn't be called from
+    # an event loop
+    blocking = False
+
+    def __init__(self, maxsize=65536, shards=16):
+        self._shards = [
+            (threading.Lock(), OrderedDict()) for _ in range(shards)
+        ]
+        self._shard_size = max(maxsize // shards, 1)
+
+    def take(self, key, rate, burst, cost=1):
+        '''
+        Takes ``cost`` tokens from the bucket for ``key``, which holds up to
+        ``burst`` tokens and is refilled with ``rate`` tokens per second.
+        Returns ``0`` if there were enough, and otherwise the number of
+        seconds until there would be.
+        '''
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            tokens, updated = buckets.pop(key, (burst, now))
+            tokens, wait = _refill(tokens, updated, now, rate, burst, cost)
+            buckets[key] = (tokens, now)
+            if len(buckets) > self._shard_size:
+                buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteTokenBuckets(SQLiteStore):
+    '''
+    Token buckets kept in a local SQLite database file, which are shared by
+    every process that opens it (such as the workers of ``gunicorn_pecan``),
+    so that a client's requests are limited no matter which worker handles
+    them.  Implements the same interface as :class:`TokenBuckets`.
+
+    Each request updates its bucket in a single transaction, so requests are
+    serialized (across processes) while they do.  Full buckets are purged
+    periodically.
+
+    :param path: The path to the database file (which is created if it
+                 doesn't exist).
+    :param timeout: The number of seconds to wait for another process's
+                    write to finish before giving up.
+    :param purge_interval: The number of updates (per process) between
+                           purges.
+    '''
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS pecan_buckets ('
+        'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+        'full REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS pecan_buckets_full '
+        'ON pecan_buckets (full)'
+    )
+
+    def __init__(self, path, timeout=5, purge_interval=1000):
+        self.purge_interval = purge_interval
+        self._updates = 0
+        super(SQLiteTokenBuckets, self).__init__(path, timeout)
+
+    def take(self, key, rate, burst, cost=1):
+        '''
+        Takes ``cost`` tokens from the bucket for ``key``, which holds up to
+        ``burst`` tokens and is refilled with ``rate`` tokens per second.
+        Returns ``0`` if there were enough, and otherwise the number of
+        seconds until there would be.
+        '''
+        now = time.time()
+        self._updates += 1
+        with self._transaction() as conn:
+            if self._updates % self.purge_interval == 0:
+                conn.execute(
+                    'DELETE FROM pecan_buckets WHERE full <= ?', (now,)
+                )
+            row = conn.execute(
+                'SELECT tokens, updated FROM pecan_buckets WHERE key = ?',
+                (key,)
+            ).fetchone()
+            tokens, updated = row or (burst, now)
+            tokens, wait = _refill(tokens, updated, now, rate, burst, cost)
+            conn.execute(
+                'INSERT OR REPLACE INTO pecan_buckets '
+                '(key, tokens, updated, full) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (burst - tokens) / rate)
+            )
+        return wait
@@ -2,15 +2,20 @@ import logging
 import re
 import warnings
 from inspect import getmembers, ismethod
+from types import FunctionType
 
 from webob import exc
 
-from .secure import handle_security, cross_boundary
+from .secure import handle_security, cross_boundary, _SecuredAttribute
 from .util import iscontroller, getargspec, _cfg
 
-__all__ = ['lookup_controller', 'find_object', 'route']
+__all__ = ['lookup_controller', 'find_object', 'route', 'reset_route_nodes']
 __observed_controllers__ = set()
 __custom_routes__ = {}
+__route_nodes__ = {}
+
+# attributes which pecan probes for on every object it traverses
+_SPECIAL_ATTRIBUTES = frozenset(('index', '_default', '_lookup', '_route'))
 
 logger = logging.getLogger(__name__)
 
@@ -139,12 +144,15 @@ def lookup_controller(obj, remainder, request=None):
         try:
             obj, remainder = find_object(obj, remainder, notfound_handlers,
                                          request)
+            if obj._pecan.get('secured', False):
+                _mark_dynamic(request)
             handle_security(obj)
             return obj, remainder
         except (exc.HTTPNotFound, exc.HTTPMethodNotAllowed,
                 PecanNotFound) as e:
             if isinstance(e, PecanNotFound):
                 e = exc.HTTPNotFound()
+            _mark_dynamic(request)
             while notfound_handlers:
                 name, obj, remainder = notfound_handlers.pop()
                 if name == '_default':
@@ -184,13 +192,164 @@ def handle_lookup_traversal(obj, args):
             return result
 
 
+class _RouteNode(object):
+    '''
+    A compiled, per-class summary of a controller, used by
+    :func:`find_object` to avoid probing every traversed object for
+    ``index``, ``_default``, ``_lookup`` and ``_route``, and for custom path
+    segments.
+
+    Classes which resolve attributes dynamically (via ``__getattr__``,
+    a custom ``__getattribute__``, or descriptors such as ``property`` for
+    one of the special names) can't be summarized statically and are flagged
+    as ``dynamic``; traversal falls through to plain attribute lookups for
+    them.
+    '''
+
+    __slots__ = (
+        'exposed', 'secured', 'dynamic', 'legacy_route', 'custom_routes',
+        'version'
+    )
+
+    def __init__(self, obj):
+        cls = type(obj)
+        self.version = _class_version(cls)
+        self.exposed = set()
+        self.secured = _static_lookup(cls, '_pecan') is not None
+        self.legacy_route = None
+        self.dynamic = (
+            hasattr(cls, '__getattr__') or
+            getattr(cls, '__getattribute__', None) is not
+            object.__getattribute__
+        )
+        for name in _SPECIAL_ATTRIBUTES:
+            value = _static_lookup(cls, name)
+            if value is None:
+                continue
+            if not isinstance(value, FunctionType) and \
+                    hasattr(type(value), '__get__'):
+                # properties, classmethods, and other descriptors can
+                # produce a different value per instance
+                self.dynamic = True
+            elif iscontroller(value):
+                self.exposed.add(name)
+
+        _detect_custom_path_segments(obj)
+        self.custom_routes = dict(
+            (route, key)
+            for (klass, route), key in list(__custom_routes__.items())
+            if klass is obj.__class__
+        )
+
+
+def reset_route_nodes(cls=None):
+    '''
+    Forgets what's been compiled about a controller class (or, by default,
+    every class): its :class:`_RouteNode` and custom path segments.  These
+    are rebuilt automatically when attributes are added to or removed from
+    a controller class, or when its ``index``, ``_default``, ``_lookup`` or
+    ``_route`` is replaced; call this after replacing one of its other
+    methods with one which has a different custom path segment.
+    Applications with a ``route_cache_size`` should clear their
+    ``route_cache`` after changing a controller class, too.
+
+    :param cls: The controller class to forget.
+    '''
+    if cls is None:
+        __route_nodes__.clear()
+        __custom_routes__.clear()
+        __observed_controllers__.clear()
+        return
+    __route_nodes__.pop(cls, None)
+    for key in [k for k in list(__custom_routes__) if k[0] is cls]:
+        __custom_routes__.pop(key, None)
+    __observed_controllers__.discard(cls)
+
+
+def _static_lookup(cls, name):
+    for base in cls.__mro__:
+        if name in base.__dict__:
+            return base.__dict__[name]
+
+
+def _class_version(cls):
+    '''
+    Returns a cheap fingerprint of a class's namespace (and its bases'),
+    which changes when attributes are added to or removed from any of them,
+    or when one of their special attributes is replaced.
+    '''
+    return tuple(
+        (len(d), d.get('index'), d.get('_default'), d.get('_lookup'),
+         d.get('_route'), d.get('_pecan'))
+        for d in map(vars, cls.__mro__[:-1])
+    )
+
+
+def _route_node(obj):
+    '''
+    Returns the compiled :class:`_RouteNode` for an object's class, building
+    it on first sight (and again whenever the class has been changed).
+    '''
+    cls = type(obj)
+    node = __route_nodes__.get(cls)
+    if node is None or node.version != _class_version(cls):
+        if node is not None:
+            reset_route_nodes(cls)
+        node = __route_nodes__[cls] = _RouteNode(obj)
+    return node
+
+
+def _static_node(obj, node):
+    '''
+    Returns ``node`` if it accurately describes ``obj``, or ``None`` when
+    the object's special attributes can't be determined statically.
+    '''
+    if node.dynamic:
+        return None
+    # instance attributes shadow anything found on the class
+    attrs = getattr(obj, '__dict__', None)
+    if attrs and not (
+        _SPECIAL_ATTRIBUTES.isdisjoint(attrs) and '_pecan' not in attrs
+    ):
+        return None
+    return node
+
+
+def _exposed_attribute(obj, node, name):
+    if node is not None and name not in node.exposed:
+        return None
+    value = getattr(obj, name, None)
+    if iscontroller(value):
+        return value
+
+
+def _mark_dynamic(request):
+    '''
+    Flags the current request's route as one which passed through a dynamic
+    handler (``_lookup``, ``_default``, ``_route``, a security check, or
+    a controller which can't be compiled), and so can't be memoized.
+    '''
+    pecan_state = getattr(request, 'pecan', None)
+    if pecan_state is not None:
+        pecan_state['dynamic_route'] = True
+
+
+def _is_legacy_route(route, node):
+    if node is not None and node.legacy_route is not None:
+        return node.legacy_route
+    legacy = len(getargspec(route).args) == 2
+    if node is not None:
+        node.legacy_route = legacy
+    return legacy
+
+
 def find_object(obj, remainder, notfound_handlers, request):
     '''
     'Walks' the url path in search of an action for which a controller is
     implemented and returns that controller object along with what's left
     of the remainder.
     '''
-    prev_obj = None
+    prev_obj = prev_node = None
     while True:
         if obj is None:
             raise PecanNotFound
@@ -198,38 +357,45 @@ def find_object(obj, remainder, notfound_handlers, request):
             if getattr(obj, 'custom_route', None) is None:
                 return obj, remainder
 
-        _detect_custom_path_segments(obj)
+        node = _route_node(obj)
 
         if remainder:
-            custom_route = __custom_routes__.get((obj.__class__, remainder[0]))
+            custom_route = node.custom_routes.get(remainder[0])
             if custom_route:
                 return getattr(obj, custom_route), remainder[1:]
 
+        node = _static_node(obj, node)
+        if node is None or node.secured:
+            _mark_dynamic(request)
+
         # are we traversing to another controller
-        cross_boundary(prev_obj, obj)
+        if prev_node is None or prev_node.secured or \
+                isinstance(obj, _SecuredAttribute):
+            cross_boundary(prev_obj, obj)
         try:
             next_obj, rest = remainder[0], remainder[1:]
             if next_obj == '':
-                index = getattr(obj, 'index', None)
-                if iscontroller(index):
+                index = _exposed_attribute(obj, node, 'index')
+                if index is not None:
                     return index, rest
         except IndexError:
             # the URL has hit an index method without a trailing slash
-            index = getattr(obj, 'index', None)
-            if iscontroller(index):
+            index = _exposed_attribute(obj, node, 'index')
+            if index is not None:
                 raise NonCanonicalPath(index, [])
 
-        default = getattr(obj, '_default', None)
-        if iscontroller(default):
+        default = _exposed_attribute(obj, node, '_default')
+        if default is not None:
             notfound_handlers.append(('_default', default, remainder))
 
-        lookup = getattr(obj, '_lookup', None)
-        if iscontroller(lookup):
+        lookup = _exposed_attribute(obj, node, '_lookup')
+        if lookup is not None:
             notfound_handlers.append(('_lookup', lookup, remainder))
 
-        route = getattr(obj, '_route', None)
-        if iscontroller(route):
-            if len(getargspec(route).args) == 2:
+        route = _exposed_attribute(obj, node, '_route')
+        if route is not None:
+            _mark_dynamic(request)
+            if _is_legacy_route(route, node):
                 warnings.warn(
                     (
                         "The function signature for %s.%s._route is changing "
@@ -251,7 +417,7 @@ def find_object(obj, remainder, notfound_handlers, request):
             raise PecanNotFound
 
         prev_remainder = remainder
-        prev_obj = obj
+        prev_obj, prev_node = obj, node
         remainder = rest
         try:
             obj = getattr(obj, next_obj, None)
@@ -273,9 +439,8 @@ def _detect_custom_path_segments(obj):
     if obj.__class__.__module__ == '__builtin__':
         return
 
-    attrs = set(dir(obj))
-
     if obj.__class__ not in __observed_controllers__:
+        attrs = set(dir(obj))
         for key, val in getmembers(obj):
             if iscontroller(val) and isinstance(
                 getattr(val, 'custom_route', None),
@@ -1,5 +1,5 @@
 from .compat import escape
-from .jsonify import encode
+from .jsonify import encode, iterencode
 
 _builtin_renderers = {}
 error_formatters = []
@@ -22,6 +22,12 @@ class JsonRenderer(object):
         '''
         return encode(namespace)
 
+    def stream(self, template_path, namespace):
+        '''
+        Implements ``JSON`` rendering as a stream of encoded chunks.
+        '''
+        return iterencode(namespace)
+
     # TODO: add error formatter for json (pass it through json lint?)
 
 
@@ -51,6 +57,14 @@ try:
             stream = tmpl.generate(**self.extra_vars.make_ns(namespace))
             return stream.render('html')
 
+        def stream(self, template_path, namespace):
+            '''
+            Implements ``Genshi`` rendering as a stream of serialized chunks.
+            '''
+            tmpl = self.loader.load(template_path)
+            stream = tmpl.generate(**self.extra_vars.make_ns(namespace))
+            return stream.serialize('html')
+
     _builtin_renderers['genshi'] = GenshiRenderer
 
     def format_genshi_error(exc_value):
@@ -158,6 +172,13 @@ try:
             '''
             template = self.env.get_template(template_path)
             return template.render(self.extra_vars.make_ns(namespace))
+
+        def stream(self, template_path, namespace):
+            '''
+            Implements ``Jinja`` rendering as a stream of chunks.
+            '''
+            template = self.env.get_template(template_path)
+            return template.generate(self.extra_vars.make_ns(namespace))
     _builtin_renderers['jinja'] = JinjaRenderer
 
     def format_jinja_error(exc_value):
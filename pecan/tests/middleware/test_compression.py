@@ -0,0 +1,239 @@
+import gzip
+import json
+import zlib
+
+from webob import Request
+from webtest import TestApp
+
+from pecan import expose, make_app, response
+from pecan.configuration import conf_from_dict
+from pecan.middleware.compression import (CompressionMiddleware,
+                                          _choose_encoding)
+from pecan.tests import PecanTestCase
+
+
+def raw_app(status='200 OK', headers=None, body=(b'x' * 1000,)):
+    if headers is None:
+        headers = [('Content-Type', 'text/plain')]
+
+    def app(environ, start_response):
+        start_response(status, list(headers))
+        return list(body)
+    return app
+
+
+class TestChooseEncoding(PecanTestCase):
+
+    def test_choose_encoding(self):
+        for value, expected in (
+            ('gzip', 'gzip'),
+            ('gzip, deflate, br', 'gzip'),
+            ('deflate', 'deflate'),
+            ('x-gzip', 'gzip'),
+            ('deflate;q=1, gzip;q=0.5', 'deflate'),
+            ('*', 'gzip'),
+            ('gzip;q=0, *', 'deflate'),
+            ('', None),
+            ('br', None),
+            ('gzip;q=0, deflate;q=0', None),
+            ('identity', None)
+        ):
+            assert _choose_encoding(value) == expected, value
+
+
+class TestCompressionMiddleware(PecanTestCase):
+
+    def get(self, app, accept_encoding='gzip', **kw):
+        req = Request.blank('/', **kw)
+        if accept_encoding:
+            req.headers['Accept-Encoding'] = accept_encoding
+        return req.get_response(app)
+
+    def test_gzip(self):
+        resp = self.get(CompressionMiddleware(raw_app()))
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert resp.headers['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(resp.body) == b'x' * 1000
+        assert len(resp.body) < 1000
+
+    def test_deflate(self):
+        resp = self.get(CompressionMiddleware(raw_app()), 'deflate')
+        assert resp.headers['Content-Encoding'] == 'deflate'
+        assert zlib.decompress(resp.body) == b'x' * 1000
+
+    def test_not_accepted(self):
+        resp = self.get(CompressionMiddleware(raw_app()), None)
+        assert 'Content-Encoding' not in resp.headers
+        assert resp.headers['Vary'] == 'Accept-Encoding'
+        assert resp.body == b'x' * 1000
+
+    def test_content_length_is_dropped(self):
+        app = raw_app(headers=[
+            ('Content-Type', 'application/json'),
+            ('Content-Length', '1000'),
+            ('Vary', 'Cookie'),
+            ('ETag', '"abc"')
+        ])
+        resp = self.get(CompressionMiddleware(app))
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert resp.headers['Vary'] == 'Cookie, Accept-Encoding'
+        assert resp.headers['ETag'] == 'W/"abc"'
+        assert resp.content_length != 1000
+        assert gzip.decompress(resp.body) == b'x' * 1000
+
+    def test_responses_which_are_not_compressed(self):
+        for status, headers in (
+            ('200 OK', [('Content-Type', 'image/png')]),
+            ('200 OK', []),
+            ('200 OK', [('Content-Type', 'text/plain'),
+                        ('Content-Length', '10')]),
+            ('200 OK', [('Content-Type', 'text/plain'),
+                        ('Content-Encoding', 'br')]),
+            ('200 OK', [('Content-Type', 'text/plain'),
+                        ('Cache-Control', 'no-transform')]),
+            ('206 Partial Content', [('Content-Type', 'text/plain')]),
+        ):
+            resp = self.get(CompressionMiddleware(raw_app(status, headers)))
+            assert resp.headers.get('Content-Encoding') in (None, 'br')
+            assert 'Vary' not in resp.headers
+            assert resp.body == b'x' * 1000
+
+    def test_minimum_size(self):
+        app = raw_app(headers=[
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', '1000')
+        ])
+        resp = self.get(CompressionMiddleware(app, minimum_size=2000))
+        assert 'Content-Encoding' not in resp.headers
+        assert resp.body == b'x' * 1000
+
+    def test_empty_responses(self):
+        for status in ('204 No Content', '304 Not Modified'):
+            app = raw_app(status, [('Content-Type', 'text/plain')], ())
+            resp = self.get(CompressionMiddleware(app))
+            assert 'Content-Encoding' not in resp.headers
+            assert resp.body == b''
+
+    def test_head(self):
+        def app(environ, start_response):
+            start_response('200 OK', [
+                ('Content-Type', 'text/plain'),
+                ('Content-Length', '1000')
+            ])
+            return []
+
+        resp = self.get(CompressionMiddleware(app), method='HEAD')
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in resp.headers
+        assert resp.body == b''
+
+    def test_streamed_chunks_are_flushed(self):
+        produced = []
+
+        def chunks():
+            for chunk in (b'first ' * 100, b'second ' * 100):
+                produced.append(chunk)
+                yield chunk
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return chunks()
+
+        environ = Request.blank('/', headers={
+            'Accept-Encoding': 'gzip'
+        }).environ
+        app_iter = CompressionMiddleware(app)(environ, lambda *a: None)
+        it = iter(app_iter)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        # each chunk can be decompressed as soon as it's sent
+        assert decompressor.decompress(next(it)) == b'first ' * 100
+        assert len(produced) == 1
+        assert decompressor.decompress(next(it)) == b'second ' * 100
+        decompressor.decompress(b''.join(it))
+        assert decompressor.eof
+        app_iter.close()
+
+    def test_lazy_start_response(self):
+        closed = []
+
+        class Body(object):
+            def __init__(self, start_response):
+                self.start_response = start_response
+
+            def __iter__(self):
+                self.start_response('200 OK', [('Content-Type', 'text/html')])
+                yield b'<p>Hello, World!</p>' * 50
+
+            def close(self):
+                closed.append(True)
+
+        resp = self.get(CompressionMiddleware(
+            lambda environ, start_response: Body(start_response)
+        ))
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(resp.body) == b'<p>Hello, World!</p>' * 50
+        assert closed == [True]
+
+
+class TestCompressedPecanApp(PecanTestCase):
+
+    def setUp(self):
+        super(TestCompressedPecanApp, self).setUp()
+
+        class RootController(object):
+            @expose('json')
+            def index(self):
+                return dict(items=list(range(1000)))
+
+            @expose('json', stream=True)
+            def stream(self):
+                return dict(items=iter(range(1000)))
+
+            @expose()
+            def empty(self):
+                response.status = 204
+                return ''
+
+        self.root = RootController()
+        self.app = make_app(
+            self.root,
+            compress_responses=True,
+            compression_options={'minimum_size': 100}
+        )
+
+    def get(self, path, **kw):
+        # (webtest would decompress the response)
+        return Request.blank(path, **kw).get_response(self.app)
+
+    def test_json(self):
+        for path in ('/', '/stream'):
+            r = self.get(path, headers={'Accept-Encoding': 'gzip'})
+            assert r.headers['Content-Encoding'] == 'gzip'
+            assert json.loads(gzip.decompress(r.body).decode()) == {
+                'items': list(range(1000))
+            }
+
+    def test_uncompressed(self):
+        r = TestApp(self.app).get('/')
+        assert 'Content-Encoding' not in r.headers
+        assert r.headers['Vary'] == 'Accept-Encoding'
+        assert r.json == {'items': list(range(1000))}
+
+    def test_empty(self):
+        r = self.get('/empty', headers={'Accept-Encoding': 'gzip'})
+        assert r.status_int == 204
+        assert 'Content-Encoding' not in r.headers
+        assert r.body == b''
+
+    def test_options_from_config(self):
+        conf = conf_from_dict({'app': {
+            'compress_responses': True,
+            'compression_options': {'minimum_size': 100000}
+        }})
+        app = make_app(self.root, **dict(conf.app))
+        r = Request.blank('/', headers={
+            'Accept-Encoding': 'gzip'
+        }).get_response(app)
+        assert 'Content-Encoding' not in r.headers
+        assert r.json == {'items': list(range(1000))}
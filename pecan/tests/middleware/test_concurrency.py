@@ -0,0 +1,169 @@
+import threading
+import time
+
+from webob import Request
+from webtest import TestApp
+
+from pecan import expose, make_app
+from pecan.middleware.concurrency import (Budget,
+                                          ConcurrencyLimitMiddleware)
+from pecan.tests import PecanTestCase
+
+
+class TestBudget(PecanTestCase):
+
+    def test_acquire_and_release(self):
+        budget = Budget(1)
+        assert budget.acquire(time.monotonic() + 1)
+        assert not budget.acquire(time.monotonic() + 0.01)
+        budget.release()
+        assert budget.acquire(time.monotonic())
+        assert budget.stats() == dict(
+            limit=1, in_flight=1, admitted=2, queued=1, shed=1
+        )
+
+    def test_queued_requests_get_freed_slots(self):
+        budget = Budget(1)
+        budget.acquire(time.monotonic())
+        timer = threading.Timer(0.05, budget.release)
+        timer.start()
+        assert budget.acquire(time.monotonic() + 5)
+        timer.join()
+        assert budget.stats()['queued'] == 1
+        assert budget.stats()['shed'] == 0
+
+    def test_expired_requests_dont_keep_slots_from_others(self):
+        budget = Budget(1)
+        budget.acquire(time.monotonic())
+        admitted = []
+        threads = [
+            threading.Thread(
+                target=lambda t: admitted.append(
+                    budget.acquire(time.monotonic() + t)
+                ),
+                args=(t,)
+            )
+            for t in (0.05, 5)
+        ]
+        for thread in threads:
+            thread.start()
+        threading.Timer(0.05, budget.release).start()
+        for thread in threads:
+            thread.join(5)
+        assert sorted(admitted) == [False, True]
+        assert budget.stats() == dict(
+            limit=1, in_flight=1, admitted=2, queued=2, shed=1
+        )
+
+
+class TestConcurrencyLimitMiddleware(PecanTestCase):
+
+    def setUp(self):
+        super(TestConcurrencyLimitMiddleware, self).setUp()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+        def app(environ, start_response):
+            if environ['PATH_INFO'].endswith('/slow'):
+                self.entered.set()
+                self.release.wait(5)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [environ['PATH_INFO'].encode()]
+
+        self.wrapped = app
+
+    def hold(self, app, path):
+        # start a slow request, and wait until it's in progress
+        self.entered.clear()
+        thread = threading.Thread(
+            target=lambda: Request.blank(path).get_response(app)
+        )
+        thread.start()
+        assert self.entered.wait(5)
+        return thread
+
+    def test_global_limit(self):
+        app = ConcurrencyLimitMiddleware(
+            self.wrapped, max_concurrency=1, queue_timeout=0.01,
+            retry_after=5
+        )
+        thread = self.hold(app, '/slow')
+        resp = Request.blank('/').get_response(app)
+        assert resp.status_int == 503
+        assert resp.headers['Retry-After'] == '5'
+
+        self.release.set()
+        thread.join(5)
+        resp = Request.blank('/').get_response(app)
+        assert resp.status_int == 200
+        assert app.stats() == dict(routes={}, **{'global': dict(
+            limit=1, in_flight=0, admitted=2, queued=1, shed=1
+        )})
+
+    def test_route_limits(self):
+        app = ConcurrencyLimitMiddleware(
+            self.wrapped, max_concurrency=10,
+            routes={'/reports/': 1}, queue_timeout=0.01
+        )
+        thread = self.hold(app, '/reports/slow')
+        assert Request.blank('/reports/x').get_response(app).status_int == \
+            503
+        assert Request.blank('/reports').get_response(app).status_int == 503
+        # other routes aren't affected
+        assert Request.blank('/reportsx').get_response(app).status_int == 200
+        assert Request.blank('/').get_response(app).status_int == 200
+
+        self.release.set()
+        thread.join(5)
+        stats = app.stats()
+        assert stats['routes']['/reports'] == dict(
+            limit=1, in_flight=0, admitted=1, queued=2, shed=2
+        )
+        assert stats['global']['admitted'] == 3
+        assert stats['global']['in_flight'] == 0
+
+    def test_longest_prefix_applies(self):
+        app = ConcurrencyLimitMiddleware(
+            self.wrapped, routes={'/': 5, '/api': 2, '/api/reports': 1}
+        )
+        assert app.route_budget('/api/reports/1') is \
+            app.routes['/api/reports']
+        assert app.route_budget('/api/things') is app.routes['/api']
+        assert app.route_budget('/other') is app.routes['/']
+
+    def test_slots_are_held_until_the_body_is_sent(self):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return iter([b'Hello, ', b'World!'])
+
+        app = ConcurrencyLimitMiddleware(app, max_concurrency=1)
+        app_iter = app(Request.blank('/').environ, lambda *a: None)
+        assert app.stats()['global']['in_flight'] == 1
+        assert b''.join(app_iter) == b'Hello, World!'
+        app_iter.close()
+        app_iter.close()
+        assert app.stats()['global']['in_flight'] == 0
+
+    def test_slots_are_released_on_errors(self):
+        def app(environ, start_response):
+            raise ValueError('broken')
+
+        app = ConcurrencyLimitMiddleware(app, max_concurrency=1)
+        self.assertRaises(ValueError, Request.blank('/').get_response, app)
+        assert app.stats()['global']['in_flight'] == 0
+
+    def test_make_app(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                from pecan import request
+                return str(
+                    request.environ['pecan.concurrency'].stats()['global']
+                    ['in_flight']
+                )
+
+        app = TestApp(make_app(RootController(), concurrency_limits={
+            'max_concurrency': 4,
+            'routes': {'/reports': 1}
+        }))
+        assert app.get('/').body == b'1'
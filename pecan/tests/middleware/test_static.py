@@ -1,8 +1,17 @@
-from pecan.middleware.static import (StaticFileMiddleware, FileWrapper,
-                                     _dump_date)
+from pecan.middleware.static import (StaticFileMiddleware, StaticManifest,
+                                     FileWrapper, fingerprint, _accepts_gzip,
+                                     _dump_date, http_date)
 from pecan.tests import PecanTestCase
 
+import gzip
 import os
+import shutil
+import tempfile
+import time
+import warnings
+from mimetypes import guess_type
+
+from webtest import TestApp
 
 
 class TestStaticFileMiddleware(PecanTestCase):
@@ -22,14 +31,19 @@ class TestStaticFileMiddleware(PecanTestCase):
         self._status = None
         self._response_headers = None
 
-    def _request(self, path):
+    def _request(self, path, **environ):
         def start_response(status, response_headers, exc_info=None):
             self._status = status
             self._response_headers = response_headers
-        return self.app(
-            dict(PATH_INFO=path),
-            start_response
-        )
+        environ['PATH_INFO'] = path
+        return self.app(environ, start_response)
+
+    def _body(self, result):
+        try:
+            return b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
 
     def _get_response_header(self, header):
         for k, v in self._response_headers:
@@ -70,3 +84,435 @@ class TestStaticFileMiddleware(PecanTestCase):
         result = self._request(':static_fixtures:text.txt')
         assert isinstance(result, FileWrapper)
         result.close()
+
+
+class TestStaticFileMiddlewareHTTP(PecanTestCase):
+
+    def setUp(self):
+        super(TestStaticFileMiddlewareHTTP, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.write('small.txt', b'0123456789')
+        self.write('large.bin', b'x' * 100 + b'y' * 100)
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(data)
+
+    def request(self, path, app=None, **environ):
+        if app is None:
+            app = StaticFileMiddleware(
+                self.passthrough,
+                self.directory,
+                memory_cache_file_size=64
+            )
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, dict(headers)]
+
+        environ.setdefault('REQUEST_METHOD', 'GET')
+        environ['PATH_INFO'] = path
+        result = app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started[0], started[1], body
+
+    def passthrough(self, environ, start_response):
+        start_response('404 Not Found', [])
+        return [b'missing']
+
+    def test_validators(self):
+        status, headers, body = self.request('/small.txt')
+        assert status == '200 OK'
+        assert body == b'0123456789'
+        assert headers['Content-Length'] == '10'
+        assert headers['Accept-Ranges'] == 'bytes'
+        assert headers['ETag'].startswith('"')
+        assert headers['Last-Modified'] == http_date(
+            os.path.getmtime(os.path.join(self.directory, 'small.txt'))
+        )
+
+    def test_if_none_match(self):
+        etag = self.request('/small.txt')[1]['ETag']
+        for value in (etag, 'W/%s' % etag, '"other", %s' % etag, '*'):
+            status, headers, body = self.request(
+                '/small.txt', HTTP_IF_NONE_MATCH=value
+            )
+            assert status == '304 Not Modified'
+            assert body == b''
+            assert 'Content-Length' not in headers
+            assert headers['ETag'] == etag
+
+        status = self.request('/small.txt', HTTP_IF_NONE_MATCH='"other"')[0]
+        assert status == '200 OK'
+
+    def test_if_modified_since(self):
+        modified = self.request('/small.txt')[1]['Last-Modified']
+        status = self.request('/small.txt', HTTP_IF_MODIFIED_SINCE=modified)[0]
+        assert status == '304 Not Modified'
+
+        for value in (http_date(0), 'garbage'):
+            status = self.request(
+                '/small.txt', HTTP_IF_MODIFIED_SINCE=value
+            )[0]
+            assert status == '200 OK'
+
+    def test_ranges(self):
+        for path in ('/small.txt', '/large.bin'):
+            size = os.path.getsize(os.path.join(self.directory, path[1:]))
+            full = self.request(path)[2]
+            for value, start, end in (
+                ('bytes=2-5', 2, 6),
+                ('bytes=4-', 4, size),
+                ('bytes=-3', size - 3, size),
+                ('bytes=5-1000', 5, size)
+            ):
+                status, headers, body = self.request(path, HTTP_RANGE=value)
+                assert status == '206 Partial Content'
+                assert body == full[start:end]
+                assert headers['Content-Length'] == str(end - start)
+                assert headers['Content-Range'] == 'bytes %d-%d/%d' % (
+                    start, end - 1, size
+                )
+
+    def test_unsatisfiable_range(self):
+        status, headers, body = self.request(
+            '/small.txt', HTTP_RANGE='bytes=10-'
+        )
+        assert status == '416 Range Not Satisfiable'
+        assert headers['Content-Range'] == 'bytes */10'
+        assert body == b''
+
+    def test_unsupported_ranges_send_the_whole_file(self):
+        for value in ('bytes=0-1,4-5', 'lines=1-2', 'bytes=5-2', 'bytes=a-'):
+            status, _, body = self.request('/small.txt', HTTP_RANGE=value)
+            assert status == '200 OK'
+            assert body == b'0123456789'
+
+    def test_if_range(self):
+        headers = self.request('/small.txt')[1]
+        for value, status in (
+            (headers['ETag'], '206 Partial Content'),
+            (headers['Last-Modified'], '206 Partial Content'),
+            ('"other"', '200 OK'),
+            (http_date(0), '200 OK')
+        ):
+            assert self.request(
+                '/small.txt', HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=value
+            )[0] == status
+
+    def test_head(self):
+        status, headers, body = self.request(
+            '/large.bin', REQUEST_METHOD='HEAD'
+        )
+        assert status == '200 OK'
+        assert headers['Content-Length'] == '200'
+        assert body == b''
+
+    def test_large_files_use_the_server_file_wrapper(self):
+        wrapped = []
+
+        def file_wrapper(f, buffer_size):
+            wrapped.append(f.name)
+            return FileWrapper(f, buffer_size)
+
+        body = self.request('/large.bin', **{
+            'wsgi.file_wrapper': file_wrapper
+        })[2]
+        assert len(body) == 200
+        assert wrapped == [os.path.join(self.directory, 'large.bin')]
+
+        # small files are served from memory
+        self.request('/small.txt', **{'wsgi.file_wrapper': file_wrapper})
+        assert len(wrapped) == 1
+
+    def test_memory_cache_is_refreshed_when_files_change(self):
+        app = StaticFileMiddleware(self.passthrough, self.directory,
+                                   stat_ttl=0)
+        assert self.request('/small.txt', app=app)[2] == b'0123456789'
+        path = os.path.join(self.directory, 'small.txt')
+        self.write('small.txt', b'abc')
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        assert self.request('/small.txt', app=app)[2] == b'abc'
+        assert app.memory_cache.stats()['size'] == 1
+
+    def test_lookups_are_cached(self):
+        app = StaticFileMiddleware(self.passthrough, self.directory,
+                                   stat_ttl=60)
+        assert self.request('/new.txt', app=app)[0] == '404 Not Found'
+        self.write('new.txt', b'new')
+        assert self.request('/new.txt', app=app)[0] == '404 Not Found'
+
+        app.stat_cache.clear()
+        assert self.request('/new.txt', app=app)[2] == b'new'
+
+    def test_lookups_expire(self):
+        app = StaticFileMiddleware(self.passthrough, self.directory,
+                                   stat_ttl=0.01)
+        assert self.request('/new.txt', app=app)[0] == '404 Not Found'
+        self.write('new.txt', b'new')
+        time.sleep(0.02)
+        assert self.request('/new.txt', app=app)[2] == b'new'
+
+    def test_directories_pass_through(self):
+        os.mkdir(os.path.join(self.directory, 'sub'))
+        assert self.request('/sub')[2] == b'missing'
+        assert self.request('/')[2] == b'missing'
+
+    def test_cache_max_age(self):
+        app = StaticFileMiddleware(self.passthrough, self.directory,
+                                   cache_max_age=3600)
+        headers = self.request('/small.txt', app=app)[1]
+        assert headers['Cache-Control'] == 'public, max-age=3600'
+
+    def test_serve_static_without_debug(self):
+        from pecan import make_app
+
+        class RootController(object):
+            pass
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            app = TestApp(make_app(
+                RootController(),
+                static_root=self.directory,
+                serve_static=True,
+                static_options={'cache_max_age': 60}
+            ))
+        assert not w
+        r = app.get('/small.txt')
+        assert r.body == b'0123456789'
+        assert r.headers['Cache-Control'] == 'public, max-age=60'
+        app.get('/small.txt', headers={'If-None-Match': r.headers['ETag']},
+                status=304)
+
+
+class TestStaticFileCompression(PecanTestCase):
+
+    script = b'function hello() { return "Hello, World!"; }\n' * 20
+
+    def setUp(self):
+        super(TestStaticFileCompression, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.write('app.js', self.script)
+        self.write('tiny.css', b'body {}')
+        self.write('data.bin', b'\0' * 1000)
+        self.app = StaticFileMiddleware(
+            lambda environ, start_response: [], self.directory
+        )
+
+    def write(self, name, data, mtime=None):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def request(self, path, accept_encoding='gzip, deflate', **environ):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, dict(headers)]
+
+        environ.update(
+            REQUEST_METHOD='GET',
+            PATH_INFO=path,
+            HTTP_ACCEPT_ENCODING=accept_encoding
+        )
+        result = self.app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started[0], started[1], body
+
+    def test_accepts_gzip(self):
+        for value in ('gzip', 'deflate, gzip', 'GZIP;q=0.5', 'x-gzip', '*',
+                      'gzip;q=1, *;q=0'):
+            assert _accepts_gzip(value), value
+        for value in ('', 'deflate', 'gzip;q=0', '*;q=0', 'gzip;q=0, *',
+                      'br, gzip;q=0.0'):
+            assert not _accepts_gzip(value), value
+
+    def test_compression(self):
+        status, headers, body = self.request('/app.js')
+        assert status == '200 OK'
+        assert headers['Content-Encoding'] == 'gzip'
+        assert headers['Vary'] == 'Accept-Encoding'
+        assert headers['Content-Type'] == guess_type('app.js')[0]
+        assert headers['Content-Length'] == str(len(body))
+        assert gzip.decompress(body) == self.script
+
+        # the compressed copy is reused
+        assert self.request('/app.js')[2] == body
+        assert self.app.compress_cache.stats()['hits'] == 1
+
+        # and has its own ETag
+        _, identity_headers, identity = self.request('/app.js', '')
+        assert identity == self.script
+        assert 'Content-Encoding' not in identity_headers
+        assert identity_headers['Vary'] == 'Accept-Encoding'
+        assert identity_headers['ETag'] != headers['ETag']
+        assert self.request(
+            '/app.js', HTTP_IF_NONE_MATCH=headers['ETag']
+        )[0] == '304 Not Modified'
+        assert self.request(
+            '/app.js', '', HTTP_IF_NONE_MATCH=headers['ETag']
+        )[0] == '200 OK'
+
+    def test_compressed_ranges(self):
+        body = self.request('/app.js')[2]
+        status, _, partial = self.request('/app.js', HTTP_RANGE='bytes=0-9')
+        assert status == '206 Partial Content'
+        assert partial == body[:10]
+
+    def test_changed_files_are_recompressed(self):
+        self.request('/app.js')
+        self.write('app.js', self.script * 2, mtime=time.time() + 10)
+        self.app.stat_cache.clear()
+        body = self.request('/app.js')[2]
+        assert gzip.decompress(body) == self.script * 2
+
+    def test_files_which_are_not_compressed(self):
+        for path in ('/tiny.css', '/data.bin'):
+            status, headers, body = self.request(path)
+            assert status == '200 OK'
+            assert 'Content-Encoding' not in headers
+            assert 'Vary' not in headers
+
+        app = StaticFileMiddleware(
+            lambda environ, start_response: [], self.directory,
+            compress_cache_size=0
+        )
+        self.app = app
+        assert 'Content-Encoding' not in self.request('/app.js')[1]
+
+    def test_precompressed(self):
+        mtime = time.time()
+        self.write('app.js', self.script, mtime=mtime)
+        self.write('app.js.gz', b'precompressed', mtime=mtime)
+        self.write('tiny.css.gz', b'precompressed', mtime=mtime - 10)
+
+        status, headers, body = self.request('/app.js')
+        assert body == b'precompressed'
+        assert headers['Content-Encoding'] == 'gzip'
+        assert headers['Content-Type'] == guess_type('app.js')[0]
+        assert headers['Vary'] == 'Accept-Encoding'
+        assert self.request('/app.js', 'identity')[2] == self.script
+
+        # stale precompressed files are ignored
+        assert self.request('/tiny.css')[2] == b'body {}'
+
+
+class TestStaticFileFingerprinting(PecanTestCase):
+
+    def setUp(self):
+        super(TestStaticFileFingerprinting, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        os.mkdir(os.path.join(self.directory, 'css'))
+        self.write('css/app.css', b'body {}')
+        self.write('css/app.css.gz', b'precompressed')
+        self.write('robots.txt', b'')
+        self.write('LICENSE', b'MIT')
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(data)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def test_fingerprint(self):
+        manifest = fingerprint(self.directory)
+        assert sorted(manifest) == ['LICENSE', 'css/app.css', 'robots.txt']
+        assert manifest['css/app.css'].startswith('css/app.')
+        assert manifest['css/app.css'].endswith('.css')
+        assert len(manifest['css/app.css']) == len('css/app..css') + 12
+        assert manifest['LICENSE'].startswith('LICENSE.')
+
+        for path, fingerprinted in manifest.items():
+            assert self.read(fingerprinted) == self.read(path)
+        assert self.read(manifest['css/app.css'] + '.gz') == b'precompressed'
+        assert StaticManifest(self.directory).paths == manifest
+
+    def test_fingerprint_is_repeatable(self):
+        first = fingerprint(self.directory)
+        self.write('css/app.css', b'body { color: red; }')
+        second = fingerprint(self.directory)
+        assert second['css/app.css'] != first['css/app.css']
+        assert sorted(second) == sorted(first)
+
+        # copies from previous runs are left in place
+        assert self.read(first['css/app.css']) == b'body {}'
+        assert fingerprint(self.directory) == second
+
+    def test_manifest_urls(self):
+        manifest = StaticManifest(self.directory)
+        assert manifest.url('css/app.css') == '/css/app.css'
+
+        paths = fingerprint(self.directory)
+        manifest = StaticManifest(self.directory, prefix='/static/')
+        assert manifest.url('/css/app.css') == '/static/%s' % (
+            paths['css/app.css']
+        )
+        assert manifest.url('missing.js') == '/static/missing.js'
+
+    def test_fingerprinted_files_are_immutable(self):
+        paths = fingerprint(self.directory)
+        app = StaticFileMiddleware(
+            lambda environ, start_response: [],
+            self.directory,
+            manifest=StaticManifest(self.directory)
+        )
+        headers = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            headers.clear()
+            headers.update(response_headers)
+
+        for accept_encoding in ('', 'gzip'):
+            app({
+                'PATH_INFO': '/' + paths['css/app.css'],
+                'HTTP_ACCEPT_ENCODING': accept_encoding
+            }, start_response).close()
+            assert headers['Cache-Control'] == (
+                'public, max-age=31536000, immutable'
+            )
+
+        app({'PATH_INFO': '/css/app.css'}, start_response).close()
+        assert headers['Cache-Control'] == 'public'
+
+    def test_static_url_template_helper(self):
+        from pecan import expose, make_app
+
+        paths = fingerprint(self.directory)
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'unused'
+
+        apps = []
+
+        def wrap_app(app):
+            apps.append(app)
+            return app
+
+        app = make_app(RootController(), static_root=self.directory,
+                       serve_static=True, wrap_app=wrap_app)
+        namespace = apps[0].renderers.extra_vars.make_ns({})
+        assert namespace['static_url']('css/app.css') == (
+            '/' + paths['css/app.css']
+        )
+
+        r = TestApp(app).get('/' + paths['css/app.css'])
+        assert r.body == b'body {}'
+        assert 'immutable' in r.headers['Cache-Control']
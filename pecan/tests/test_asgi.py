@@ -0,0 +1,691 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from webob.exc import HTTPNotFound
+
+from pecan import (AsyncPecan, Response, abort, cached, expose, redirect,
+                   request, response)
+from pecan.cache import SQLiteCache
+from pecan.hooks import PecanHook, RateLimitHook, TransactionHook
+from pecan.ratelimit import SQLiteTokenBuckets
+from pecan.rest import RestController
+from pecan.tests import PecanTestCase
+
+
+async def call(app, path, method='GET', query_string=b'', headers=(),
+               body=b'', messages=None):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode('latin-1'),
+        'query_string': query_string,
+        'root_path': '',
+        'headers': [
+            (name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ],
+        'client': ('127.0.0.1', 50000),
+        'server': ('localhost', 8080)
+    }
+    if messages is None:
+        messages = [
+            {'type': 'http.request', 'body': body, 'more_body': False}
+        ]
+    messages = list(messages)
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    if not sent:
+        return None
+    start = sent[0]
+    assert start['type'] == 'http.response.start'
+    headers = dict(
+        (name.decode('latin-1'), value.decode('latin-1'))
+        for name, value in start['headers']
+    )
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return start['status'], headers, body
+
+
+def get(app, path, **kw):
+    return asyncio.run(call(app, path, **kw))
+
+
+class TestAsyncPecan(PecanTestCase):
+
+    def test_sync_controller_runs_in_thread_pool(self):
+        main_thread = threading.current_thread()
+
+        class RootController(object):
+            @expose()
+            def index(self, name='World'):
+                assert threading.current_thread() is not main_thread
+                assert request.path == '/'
+                return 'Hello, %s!' % name
+
+        app = AsyncPecan(RootController())
+        status, headers, body = get(app, '/', query_string=b'name=Pecan')
+        assert status == 200
+        assert body == b'Hello, Pecan!'
+        assert headers['content-type'].startswith('text/html')
+
+    def test_async_controller(self):
+        class RootController(object):
+            @expose('json')
+            async def index(self, id):
+                await asyncio.sleep(0)
+                response.status = 201
+                return {'id': id, 'path': request.path}
+
+        app = AsyncPecan(RootController())
+        status, headers, body = get(app, '/', query_string=b'id=5')
+        assert status == 201
+        assert headers['content-type'] == 'application/json'
+        assert json.loads(body.decode()) == {'id': '5', 'path': '/'}
+
+    def test_async_controllers_are_concurrent(self):
+        class RootController(object):
+            def __init__(self):
+                self.ready = None
+
+            @expose()
+            async def wait(self):
+                await self.ready.wait()
+                return request.path
+
+            @expose()
+            async def go(self):
+                self.ready.set()
+                return request.path
+
+        root = RootController()
+        app = AsyncPecan(root)
+
+        async def both():
+            root.ready = asyncio.Event()
+            return await asyncio.gather(
+                call(app, '/wait'),
+                call(app, '/go')
+            )
+
+        first, second = asyncio.run(both())
+        assert first[2] == b'/wait'
+        assert second[2] == b'/go'
+
+    def test_post_body(self):
+        class RootController(object):
+            @expose()
+            async def index(self, name):
+                return name
+
+        app = AsyncPecan(RootController())
+        status, _, body = get(
+            app,
+            '/',
+            method='POST',
+            headers=[('Content-Type', 'application/x-www-form-urlencoded')],
+            body=b'name=Pecan'
+        )
+        assert status == 200
+        assert body == b'Pecan'
+
+    def test_rest_controller(self):
+        class ThingsController(RestController):
+            @expose()
+            async def get_all(self):
+                return 'all'
+
+            @expose()
+            def get_one(self, id):
+                return 'one:%s' % id
+
+            @expose()
+            async def post(self):
+                response.status = 201
+                return 'created'
+
+        class RootController(object):
+            things = ThingsController()
+
+        app = AsyncPecan(RootController())
+        assert get(app, '/things')[2] == b'all'
+        assert get(app, '/things/3')[2] == b'one:3'
+        status, _, body = get(app, '/things', method='POST')
+        assert (status, body) == (201, b'created')
+        assert get(app, '/things/3', method='DELETE')[0] == 405
+
+    def test_errors(self):
+        class RootController(object):
+            @expose()
+            async def index(self):
+                abort(403)
+
+        app = AsyncPecan(RootController())
+        assert get(app, '/')[0] == 403
+        assert get(app, '/missing')[0] == 404
+
+        status, headers, body = get(
+            app, '/missing', headers=[('Accept', 'application/json')]
+        )
+        assert status == 404
+        assert headers['content-type'] == 'application/json'
+        assert json.loads(body.decode())['code'] == 404
+
+    def test_unhandled_exceptions_propagate(self):
+        class RootController(object):
+            @expose()
+            async def index(self):
+                raise ValueError('broken')
+
+        app = AsyncPecan(RootController())
+        self.assertRaises(ValueError, get, app, '/')
+
+    def test_internal_redirect(self):
+        class RootController(object):
+            @expose()
+            async def index(self):
+                redirect('/target', internal=True)
+
+            @expose()
+            def target(self):
+                return 'target'
+
+        app = AsyncPecan(RootController())
+        status, _, body = get(app, '/')
+        assert status == 200
+        assert body == b'target'
+
+    def test_async_hooks(self):
+        run_hook = []
+
+        class AsyncHook(PecanHook):
+            async def on_route(self, state):
+                run_hook.append('on_route')
+
+            async def before(self, state):
+                await asyncio.sleep(0)
+                run_hook.append('before')
+
+            async def after(self, state):
+                run_hook.append('after')
+
+        class SyncHook(PecanHook):
+            def before(self, state):
+                run_hook.append('sync before')
+
+        class RootController(object):
+            @expose()
+            async def index(self):
+                run_hook.append('inside')
+                return 'Hello, World!'
+
+        app = AsyncPecan(RootController(), hooks=[AsyncHook(), SyncHook()])
+        assert get(app, '/')[2] == b'Hello, World!'
+        assert run_hook == [
+            'on_route', 'before', 'sync before', 'inside', 'after'
+        ]
+
+    def test_sync_hooks_share_the_controllers_thread(self):
+        local = threading.local()
+        actions = []
+
+        def bind(name):
+            def bind():
+                local.session = name
+            return bind
+
+        def record(action):
+            return lambda: actions.append(
+                (action, getattr(local, 'session', None))
+            )
+
+        def clear():
+            local.__dict__.pop('session', None)
+
+        class RootController(object):
+            @expose(generic=True)
+            def index(self):
+                return 'session=%s' % getattr(local, 'session', None)
+
+            @index.when(method='POST')
+            def index_post(self):
+                return 'session=%s' % getattr(local, 'session', None)
+
+        app = AsyncPecan(RootController(), hooks=[TransactionHook(
+            start=bind('rw-session'),
+            start_ro=bind('ro-session'),
+            commit=record('commit'),
+            rollback=record('rollback'),
+            clear=clear
+        )])
+        assert get(app, '/')[2] == b'session=ro-session'
+        assert get(app, '/', method='POST')[2] == b'session=rw-session'
+        assert actions == [('commit', 'rw-session')]
+
+    def test_async_on_error_hook(self):
+        class ErrorHook(PecanHook):
+            async def on_error(self, state, e):
+                return Response(text='handled %s' % type(e).__name__)
+
+        class RootController(object):
+            @expose()
+            async def index(self):
+                raise HTTPNotFound()
+
+        app = AsyncPecan(RootController(), hooks=[ErrorHook()])
+        status, _, body = get(app, '/')
+        assert status == 200
+        assert body == b'handled HTTPNotFound'
+
+    def test_async_renderer(self):
+        class AsyncRenderer(object):
+            def __init__(self, path, extra_vars):
+                pass
+
+            async def render(self, template_path, namespace):
+                await asyncio.sleep(0)
+                return '%s:%s' % (template_path, namespace['name'])
+
+        class RootController(object):
+            @expose('async:index.html')
+            def index(self):
+                return dict(name='Pecan')
+
+        app = AsyncPecan(
+            RootController(),
+            custom_renderers={'async': AsyncRenderer}
+        )
+        assert get(app, '/')[2] == b'index.html:Pecan'
+
+    def test_streamed_iterables(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                response.app_iter = iter([b'Hello, ', b'World!'])
+                return response
+
+        app = AsyncPecan(RootController())
+        assert get(app, '/')[2] == b'Hello, World!'
+
+    def test_streamed_generators(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                yield 'Hello, '
+                yield 'World!'
+
+            @expose()
+            async def paths(self):
+                def chunks():
+                    for i in range(3):
+                        yield '%s:%d\n' % (request.path, i)
+                return chunks()
+
+        app = AsyncPecan(RootController())
+        status, headers, body = get(app, '/')
+        assert status == 200
+        assert 'content-length' not in headers
+        assert body == b'Hello, World!'
+
+        # pecan.request is still available while the body is streamed
+        assert get(app, '/paths')[2] == b'/paths:0\n/paths:1\n/paths:2\n'
+
+    def test_first_chunk_is_produced_off_the_event_loop(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                time.sleep(0.3)
+                yield 'Hello, World!'
+
+        app = AsyncPecan(RootController())
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def concurrently():
+            ticker = asyncio.ensure_future(tick())
+            try:
+                return await call(app, '/')
+            finally:
+                ticker.cancel()
+
+        status, _, body = asyncio.run(concurrently())
+        assert (status, body) == (200, b'Hello, World!')
+        assert len(ticks) >= 10
+
+    def test_cached_responses(self):
+        calls = []
+
+        class RootController(object):
+            @expose('json')
+            @cached()
+            async def index(self):
+                calls.append('index')
+                return {'path': request.path}
+
+        app = AsyncPecan(RootController())
+        for _ in range(2):
+            status, headers, body = get(app, '/')
+            assert status == 200
+            assert headers['content-type'] == 'application/json'
+            assert json.loads(body.decode()) == {'path': '/'}
+        assert calls == ['index']
+
+    def test_blocking_caches_are_used_off_the_event_loop(self):
+        main_thread = threading.current_thread()
+        threads = []
+
+        class Cache(SQLiteCache):
+            def get(self, *args):
+                threads.append(('get', threading.current_thread()))
+                return super(Cache, self).get(*args)
+
+            def set(self, *args):
+                threads.append(('set', threading.current_thread()))
+                return super(Cache, self).set(*args)
+
+        class RootController(object):
+            @expose()
+            @cached()
+            async def index(self):
+                return 'Hello, World!'
+
+        path = os.path.join(tempfile.mkdtemp(), 'cache.db')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        cache = Cache(path)
+        self.addCleanup(cache.close)
+        app = AsyncPecan(RootController(), response_cache=cache)
+        for _ in range(2):
+            assert get(app, '/')[2] == b'Hello, World!'
+        assert [name for name, _ in threads] == ['get', 'set', 'get']
+        assert main_thread not in [thread for _, thread in threads]
+
+    def test_coalesced_requests(self):
+        calls = []
+
+        class RootController(object):
+            def __init__(self):
+                self.release = None
+
+            @expose('json', coalesce=True)
+            async def index(self):
+                calls.append('index')
+                if len(calls) == 1:
+                    await self.release.wait()
+                return {'path': request.path}
+
+        root = RootController()
+        app = AsyncPecan(root)
+
+        async def release():
+            while not calls or not app._flights or \
+                    list(app._flights.values())[0].followers < 2:
+                await asyncio.sleep(0)
+            root.release.set()
+
+        async def concurrently():
+            root.release = asyncio.Event()
+            results = await asyncio.gather(
+                call(app, '/'), call(app, '/'), call(app, '/'), release()
+            )
+            return results[:3]
+
+        for status, headers, body in asyncio.run(concurrently()):
+            assert status == 200
+            assert headers['content-type'] == 'application/json'
+            assert json.loads(body.decode()) == {'path': '/'}
+        assert calls == ['index']
+        assert app._flights == {}
+
+        # requests stop waiting for one which has hung, and are handled as
+        # usual
+        app.coalesce_timeout = 0.05
+
+        async def hung():
+            root.release = asyncio.Event()
+            leader = asyncio.ensure_future(call(app, '/'))
+            while not app._flights:
+                await asyncio.sleep(0)
+            result = await call(app, '/')
+            root.release.set()
+            await leader
+            return result
+
+        del calls[:]
+        status, _, body = asyncio.run(asyncio.wait_for(hung(), 5))
+        assert status == 200
+        assert calls == ['index', 'index']
+
+    def test_blocking_rate_limit_stores(self):
+        main_thread = threading.current_thread()
+        takers = []
+
+        class Buckets(SQLiteTokenBuckets):
+            def take(self, *args):
+                takers.append(threading.current_thread())
+                return super(Buckets, self).take(*args)
+
+        class RootController(object):
+            @expose()
+            async def index(self):
+                return 'Hello, World!'
+
+        path = os.path.join(tempfile.mkdtemp(), 'buckets.db')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        store = Buckets(path)
+        self.addCleanup(store.close)
+        app = AsyncPecan(
+            RootController(),
+            hooks=[RateLimitHook(rate=0.01, store=store)]
+        )
+        assert get(app, '/')[0] == 200
+        assert get(app, '/')[0] == 429
+        assert len(takers) == 2
+        assert main_thread not in takers
+
+    def test_etags(self):
+        class RootController(object):
+            @expose('json', etag=True)
+            async def index(self):
+                return {'path': request.path}
+
+            @expose(etag=lambda: 'v1')
+            async def versioned(self):
+                raise AssertionError('not reached')
+
+        app = AsyncPecan(RootController())
+        status, headers, _ = get(app, '/')
+        assert status == 200
+        status, headers, body = get(
+            app, '/', headers=[('If-None-Match', headers['etag'])]
+        )
+        assert (status, body) == (304, b'')
+        status, headers, body = get(
+            app, '/versioned', headers=[('If-None-Match', '"v1"')]
+        )
+        assert (status, body) == (304, b'')
+        assert headers['etag'] == '"v1"'
+
+    def test_deadlines(self):
+        cancelled = []
+        release = threading.Event()
+
+        class ErrorHook(PecanHook):
+            def on_error(self, state, e):
+                cancelled.append(type(e).__name__)
+
+            async def after(self, state):
+                if state.request.path == '/slow_after_hook':
+                    await asyncio.sleep(0.1)
+
+        class RootController(object):
+            @expose(timeout=0.05)
+            async def index(self):
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append('index')
+                    raise
+
+            @expose(timeout=0.05)
+            def blocking(self):
+                release.wait(5)
+                return 'too late'
+
+            @expose(timeout=5)
+            async def quick(self):
+                return 'quick'
+
+            @expose(timeout=0.05)
+            async def slow_after_hook(self):
+                return 'too late'
+
+        app = AsyncPecan(RootController(), hooks=[ErrorHook()])
+        assert get(app, '/')[0] == 504
+        assert cancelled == ['index', 'HTTPGatewayTimeout']
+
+        # blocking controllers are abandoned in the thread pool
+        try:
+            assert get(app, '/blocking')[0] == 504
+        finally:
+            release.set()
+        assert get(app, '/quick')[2] == b'quick'
+        # (after hooks may have committed its work)
+        assert get(app, '/slow_after_hook')[0] == 200
+
+    def test_request_bodies(self):
+        calls = []
+
+        class RootController(object):
+            @expose(max_body_size=6000)
+            async def upload(self):
+                calls.append('upload')
+                # (a `tempfile.SpooledTemporaryFile`)
+                spooled = request.body_file_raw._rolled
+                return '%s:%s' % (len(request.body_file.read()), spooled)
+
+        app = AsyncPecan(
+            RootController(), spool_threshold=1000, max_body_size=10000
+        )
+        for size, expected in (
+            (10, (200, b'10:False')),
+            (5000, (200, b'5000:True')),
+            (6001, (413, None)),
+            (10001, (413, None))
+        ):
+            status, _, body = get(
+                app, '/upload', method='POST', body=b'x' * size
+            )
+            assert status == expected[0]
+            if status == 200:
+                assert body == expected[1]
+        assert calls == ['upload', 'upload']
+
+    def test_oversized_bodies_are_not_received(self):
+        chunk = {'type': 'http.request', 'body': b'x' * 6000,
+                 'more_body': True}
+
+        class RootController(object):
+            @expose()
+            async def upload(self):
+                raise AssertionError('not reached')
+
+        app = AsyncPecan(RootController(), max_body_size=10000)
+        # turned away by its Content-Length, before any of it is received
+        status, _, _ = get(
+            app, '/upload', method='POST',
+            headers=[('Content-Length', '20000')], messages=[]
+        )
+        assert status == 413
+
+        # turned away once too much of it has been received
+        messages = [chunk, chunk, chunk]
+        status, _, _ = get(app, '/upload', method='POST', messages=messages)
+        assert status == 413
+
+    def test_truncated_bodies_are_dropped(self):
+        class RootController(object):
+            @expose()
+            async def upload(self):
+                raise AssertionError('not reached')
+
+        app = AsyncPecan(RootController())
+        assert get(app, '/upload', method='POST', messages=[
+            {'type': 'http.request', 'body': b'x' * 10, 'more_body': True},
+            {'type': 'http.disconnect'}
+        ]) is None
+
+    def test_context_locals_are_unbound_after_request(self):
+        class RootController(object):
+            @expose()
+            async def index(self):
+                return 'Hello, World!'
+
+        app = AsyncPecan(RootController())
+        get(app, '/')
+        self.assertRaises(AttributeError, getattr, request, 'path')
+
+    def test_thread_pool(self):
+        app = AsyncPecan(object(), thread_pool_size=2)
+        assert app.executor._max_workers == 2
+
+        executor = ThreadPoolExecutor(1)
+        app = AsyncPecan(object(), executor=executor)
+        assert app.executor is executor
+
+    def test_imported_lazily(self):
+        out = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, pecan; print("pecan.asgi" in sys.modules)'
+        ])
+        assert out.strip() == b'False'
+
+    def test_explicit_context_is_unsupported(self):
+        self.assertRaises(
+            TypeError, AsyncPecan, object(), use_context_locals=False
+        )
+
+    def test_lifespan(self):
+        class RootController(object):
+            pass
+
+        app = AsyncPecan(RootController())
+        messages = [
+            {'type': 'lifespan.startup'},
+            {'type': 'lifespan.shutdown'}
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(app({'type': 'lifespan'}, receive, send))
+        assert sent == [
+            'lifespan.startup.complete', 'lifespan.shutdown.complete'
+        ]
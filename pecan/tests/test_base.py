@@ -2,6 +2,8 @@
 
 import sys
 import os
+import threading
+import time
 import json
 import traceback
 import warnings
@@ -13,15 +15,18 @@ from webtest import TestApp
 
 from pecan import (
     Pecan, Request, Response, expose, request, response, redirect,
-    abort, make_app, override_template, render, route
+    abort, make_app, override_template, render, route, cached
 )
 from pecan.templating import (
     _builtin_renderers as builtin_renderers, error_formatters, MakoRenderer
 )
 from pecan.decorators import accept_noncanonical
+from pecan.hooks import PecanHook
+from pecan.rest import RestController
 from pecan.tests import PecanTestCase
 
 import unittest
+from unittest import mock
 
 
 class SampleRootController(object):
@@ -255,6 +260,183 @@ class TestObjectDispatch(PecanTestCase):
         assert r.status_int == 200
         assert r.body == b'/sub/sub/deeper'
 
+    def test_repeated_requests(self):
+        app = self.app_
+        for _ in range(3):
+            r = app.get('/sub/sub/')
+            assert r.status_int == 200
+            assert r.body == b'/sub/sub/'
+
+
+class TestDynamicObjectDispatch(PecanTestCase):
+
+    def test_instance_attribute_shadows_class(self):
+
+        class SubController(object):
+            pass
+
+        class Handlers(object):
+            @expose()
+            def index(self):
+                return '/sub/'
+
+            @expose()
+            def _lookup(self, *remainder):
+                return SubController(), remainder
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+        handlers = Handlers()
+        sub = SubController()
+        sub.index = handlers.index
+        root = RootController()
+        root.sub = sub
+        root._lookup = handlers._lookup
+
+        app = TestApp(Pecan(root))
+        r = app.get('/')
+        assert r.body == b'/'
+        r = app.get('/sub/')
+        assert r.body == b'/sub/'
+        r = app.get('/missing/', expect_errors=True)
+        assert r.status_int == 404
+
+    def test_getattr_controller(self):
+
+        class SubController(object):
+            @expose()
+            def index(self):
+                return 'sub'
+
+        class RootController(object):
+            def __getattr__(self, name):
+                if name == '_lookup':
+                    return self.lookup
+                raise AttributeError(name)
+
+            @expose()
+            def lookup(self, name, *remainder):
+                return SubController(), remainder
+
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/anything/')
+        assert r.status_int == 200
+        assert r.body == b'sub'
+
+    def test_property_controller(self):
+
+        class Greeter(object):
+            def __init__(self, greeting):
+                self.greeting = greeting
+
+            @expose()
+            def greet(self):
+                return self.greeting
+
+        class RootController(object):
+            def __init__(self, greeting):
+                self.greeter = Greeter(greeting)
+
+            @property
+            def index(self):
+                return self.greeter.greet
+
+        r = TestApp(Pecan(RootController('hello'))).get('/')
+        assert r.body == b'hello'
+        r = TestApp(Pecan(RootController('goodbye'))).get('/')
+        assert r.body == b'goodbye'
+
+
+class TestRouteCache(PecanTestCase):
+
+    def test_static_routes_are_memoized(self):
+
+        class SubController(object):
+            @expose()
+            def index(self):
+                return '/sub/'
+
+            @expose()
+            def echo(self, *args):
+                return '/'.join(args)
+
+        class RootController(object):
+            sub = SubController()
+
+        app = Pecan(RootController(), route_cache_size=10)
+        client = TestApp(app)
+        for _ in range(3):
+            r = client.get('/sub/')
+            assert r.body == b'/sub/'
+            r = client.get('/sub/echo/a/b')
+            assert r.body == b'a/b'
+
+        stats = app.route_cache.stats()
+        assert stats['size'] == 2
+        assert stats['misses'] == 2
+        assert stats['hits'] == 4
+
+    def test_route_cache_is_keyed_on_method(self):
+
+        class RootController(object):
+            @expose(generic=True)
+            def index(self):
+                return 'GET'
+
+            @index.when(method='POST')
+            def index_post(self):
+                return 'POST'
+
+        app = Pecan(RootController(), route_cache_size=10)
+        client = TestApp(app)
+        assert client.get('/').body == b'GET'
+        assert client.post('/').body == b'POST'
+        assert client.get('/').body == b'GET'
+        assert app.route_cache.stats()['size'] == 2
+
+    def test_dynamic_routes_are_not_memoized(self):
+
+        class LookupController(object):
+            def __init__(self, name):
+                self.name = name
+
+            @expose()
+            def index(self):
+                return self.name
+
+        class RoutedController(object):
+            @expose()
+            def _route(self, args, request):
+                return LookupController('routed').index, []
+
+        class RootController(object):
+            routed = RoutedController()
+
+            @expose()
+            def _lookup(self, name, *remainder):
+                return LookupController(name), remainder
+
+        app = Pecan(RootController(), route_cache_size=10)
+        client = TestApp(app)
+        assert client.get('/foo/').body == b'foo'
+        assert client.get('/bar/').body == b'bar'
+        assert client.get('/routed/').body == b'routed'
+        assert len(app.route_cache) == 0
+
+    def test_route_cache_disabled_by_default(self):
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+        app = Pecan(RootController())
+        assert TestApp(app).get('/').body == b'/'
+        assert app.route_cache is None
+
 
 class TestUnicodePathSegments(PecanTestCase):
 
@@ -347,6 +529,59 @@ class TestLookups(PecanTestCase):
                           app.get,
                           '/foo/bar', expect_errors=True)
 
+    def test_patched_lookup(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+        app = TestApp(Pecan(RootController()))
+        assert app.get('/').body == b'/'
+        assert app.get('/100/', expect_errors=True).status_int == 404
+
+        def _lookup(self, someID, *remainder):
+            return self.__class__(), remainder
+
+        def index(self):
+            return '/patched'
+
+        RootController._lookup = expose()(_lookup)
+        RootController.index = expose()(index)
+
+        from pecan.routing import reset_route_nodes
+        reset_route_nodes()
+        assert app.get('/').body == b'/patched'
+        assert app.get('/100/').body == b'/patched'
+
+    def test_patched_lookup_is_seen_without_reset(self):
+        class BaseController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+        class RootController(BaseController):
+            pass
+
+        app = TestApp(Pecan(RootController()))
+        assert app.get('/').body == b'/'
+        assert app.get('/100/', expect_errors=True).status_int == 404
+
+        def _lookup(self, someID, *remainder):
+            return self.__class__(), remainder
+
+        def index(self):
+            return '/patched'
+
+        BaseController._lookup = expose()(_lookup)
+        assert app.get('/100/').body == b'/'
+
+        BaseController.index = expose()(index)
+        assert app.get('/').body == b'/patched'
+        assert app.get('/100/').body == b'/patched'
+
+        del BaseController._lookup
+        assert app.get('/100/', expect_errors=True).status_int == 404
+
 
 class TestCanonicalLookups(PecanTestCase):
 
@@ -1070,6 +1305,173 @@ class TestControllerArguments(PecanTestCase):
         assert r.body == b'eater: 10, dummy, day=12, month=1'
 
 
+class TestLazyParameterParsing(PecanTestCase):
+
+    @property
+    def app_(self):
+        class RootController(object):
+            @expose()
+            def stream(self):
+                return request.body_file.read()
+
+            @expose()
+            def item(self, id):
+                return 'item: %s' % id
+
+            @expose()
+            def named(self, id, name=None):
+                return 'named: %s, %s' % (id, name)
+
+            @expose()
+            def kwargs(self, **kw):
+                return 'kwargs: %s' % ', '.join(sorted(kw))
+
+        return TestApp(Pecan(RootController()))
+
+    def test_params_are_not_parsed_without_arguments(self):
+        app = self.app_
+        with mock.patch.object(
+            Pecan, 'get_params', side_effect=AssertionError
+        ):
+            r = app.post(
+                '/stream', '{"huge": "payload"}',
+                headers={'Content-Type': 'application/json'}
+            )
+            assert r.body == b'{"huge": "payload"}'
+
+            r = app.post('/item/5', {'ignored': 'value'})
+            assert r.body == b'item: 5'
+
+    def test_params_are_parsed_when_consumable(self):
+        app = self.app_
+        r = app.post('/named/5', {'name': 'pecan'})
+        assert r.body == b'named: 5, pecan'
+
+        r = app.post_json('/item', {'id': 7})
+        assert r.body == b'item: 7'
+
+        r = app.get('/kwargs?a=1&b=2')
+        assert r.body == b'kwargs: a, b'
+
+
+class TestRequestBodies(PecanTestCase):
+
+    def app_(self, **kw):
+        class RootController(object):
+            @expose()
+            def stream(self):
+                return request.body_file.read()
+
+            @expose()
+            def form(self, name):
+                return name
+
+            @expose(max_body_size=10000)
+            def upload(self, file):
+                spooled = not isinstance(request.body_file_raw, BytesIO)
+                return '%s:%s:%s' % (
+                    file.filename, len(file.file.read()), spooled
+                )
+
+            @expose(max_body_size=10)
+            def small(self, name):
+                return name
+
+        return Pecan(RootController(), **kw)
+
+    def test_oversized_bodies_are_rejected(self):
+        app = TestApp(self.app_(max_body_size=100))
+        r = app.post('/form', {'name': 'x' * 50})
+        assert r.body == b'x' * 50
+
+        with mock.patch.object(
+            Pecan, 'get_params', side_effect=AssertionError
+        ):
+            r = app.post('/form', {'name': 'x' * 100}, expect_errors=True)
+            assert r.status_int == 413
+            r = app.post('/stream', 'x' * 101, expect_errors=True)
+            assert r.status_int == 413
+
+    def test_bodies_are_rejected_before_routing(self):
+        run_hook = []
+
+        class RouteHook(PecanHook):
+            def on_route(self, state):
+                run_hook.append('on_route')
+
+        class ThingsController(RestController):
+            @expose()
+            def post(self, name):
+                return name
+
+        class RootController(object):
+            things = ThingsController()
+
+        app = TestApp(Pecan(
+            RootController(), hooks=[RouteHook()], max_body_size=10
+        ))
+        # RestController looks at the request's parameters (for `_method`)
+        # while routing
+        with mock.patch.object(
+            webob.request.BaseRequest, 'POST',
+            new_callable=mock.PropertyMock, side_effect=AssertionError
+        ):
+            r = app.post('/things', {'name': 'x' * 10000}, expect_errors=True)
+            assert r.status_int == 413
+        assert run_hook == []
+
+    def test_controller_limits(self):
+        app = TestApp(self.app_())
+        r = app.post(
+            '/upload', upload_files=[('file', 'data.bin', b'x' * 5000)]
+        )
+        assert r.body.startswith(b'data.bin:5000:')
+
+        r = app.post(
+            '/upload',
+            upload_files=[('file', 'data.bin', b'x' * 10000)],
+            expect_errors=True
+        )
+        assert r.status_int == 413
+
+        with mock.patch.object(
+            Pecan, 'get_params', side_effect=AssertionError
+        ):
+            r = app.post('/small', {'name': 'x' * 10}, expect_errors=True)
+            assert r.status_int == 413
+
+    def test_controller_limits_cannot_raise_the_application_limit(self):
+        app = TestApp(self.app_(max_body_size=100))
+        r = app.post(
+            '/upload',
+            upload_files=[('file', 'data.bin', b'x' * 5000)],
+            expect_errors=True
+        )
+        assert r.status_int == 413
+
+    def test_bodies_of_unknown_length(self):
+        app = self.app_(max_body_size=100)
+        for size, status in ((100, 200), (101, 413)):
+            req = webob.Request.blank('/stream', method='POST')
+            req.environ['wsgi.input'] = BytesIO(b'x' * size)
+            req.environ['wsgi.input_terminated'] = True
+            req.environ.pop('CONTENT_LENGTH', None)
+            r = req.get_response(app)
+            assert r.status_int == status
+            if status == 200:
+                assert r.body == b'x' * size
+
+    def test_large_bodies_are_spooled(self):
+        app = TestApp(self.app_(spool_threshold=1000))
+        r = app.post(
+            '/upload', upload_files=[('file', 'data.bin', b'x' * 5000)]
+        )
+        assert r.body == b'data.bin:5000:True'
+
+        r = app.post('/upload', upload_files=[('file', 'data.bin', b'x')])
+        assert r.body == b'data.bin:1:False'
+
+
 class TestDefaultErrorRendering(PecanTestCase):
 
     def test_plain_error(self):
@@ -1297,6 +1699,92 @@ class TestStreamedResponse(PecanTestCase):
         assert r.content_type == 'text/plain'
         assert r.body == b'plain text'
 
+    @property
+    def app_(self):
+        class RootController(object):
+
+            def __init__(self):
+                self.produced = []
+                self.closed = False
+
+            @expose(content_type='text/csv')
+            def report(self):
+                try:
+                    for i in range(3):
+                        self.produced.append(i)
+                        yield '%d,%s\n' % (i, chr(0x2603))
+                finally:
+                    self.closed = True
+
+            @expose()
+            def lines(self):
+                return iter([b'Hello, ', b'World!'])
+
+            @expose()
+            def empty(self):
+                return iter([])
+
+            @expose(content_type='text/plain')
+            def paths(self):
+                try:
+                    for i in range(3):
+                        yield '%s:%d\n' % (request.path, i)
+                finally:
+                    self.closed = request.path
+
+        return Pecan(RootController())
+
+    def test_generator_result(self):
+        r = TestApp(self.app_).get('/report')
+        assert r.status_int == 200
+        assert r.content_type == 'text/csv'
+        assert r.body == '0,\u2603\n1,\u2603\n2,\u2603\n'.encode('utf-8')
+
+        # the length of a streamed body isn't known up front
+        start_response = mock.Mock()
+        self.app_(webob.Request.blank('/report').environ, start_response)
+        headers = dict(start_response.call_args[0][1])
+        assert 'Content-Length' not in headers
+
+    def test_iterator_result(self):
+        r = TestApp(self.app_).get('/lines')
+        assert r.status_int == 200
+        assert r.body == b'Hello, World!'
+
+    def test_empty_iterator_result(self):
+        r = TestApp(self.app_).get('/empty')
+        assert r.status_int == 204
+        assert r.body == b''
+
+    def test_generator_is_consumed_lazily(self):
+        app = self.app_
+        start_response = mock.Mock()
+        app_iter = app(webob.Request.blank('/report').environ, start_response)
+
+        # only the first chunk has been produced (to check for an empty body)
+        assert app.root.produced == [0]
+        chunks = iter(app_iter)
+        assert next(chunks) == '0,\u2603\n'.encode('utf-8')
+        assert app.root.produced == [0]
+        assert next(chunks) == '1,\u2603\n'.encode('utf-8')
+        assert app.root.produced == [0, 1]
+
+        app_iter.close()
+        assert app.root.closed is True
+
+    def test_context_locals_while_streaming(self):
+        app = self.app_
+        start_response = mock.Mock()
+        app_iter = app(webob.Request.blank('/paths').environ, start_response)
+
+        # the request has been handled (and its context unbound) before the
+        # rest of the body is produced
+        self.assertRaises(AttributeError, getattr, request, 'path')
+        assert b''.join(app_iter) == b'/paths:0\n/paths:1\n/paths:2\n'
+        app_iter.close()
+        assert app.root.closed == '/paths'
+        self.assertRaises(AttributeError, getattr, request, 'path')
+
 
 class TestManualResponse(PecanTestCase):
 
@@ -1314,6 +1802,360 @@ class TestManualResponse(PecanTestCase):
         assert r.body == b'Hello, World!'
 
 
+class TestCoalescedRequests(PecanTestCase):
+
+    def setUp(self):
+        super(TestCoalescedRequests, self).setUp()
+        self.release = release = threading.Event()
+        self.calls = calls = []
+
+        class RootController(object):
+            @expose('json', coalesce=True)
+            @expose(content_type='text/plain', coalesce=True)
+            def index(self, page=1):
+                calls.append((page, request.pecan['content_type']))
+                release.wait(5)
+                return 'page %s' % page
+
+            @expose(coalesce=True)
+            def cookie(self):
+                calls.append('cookie')
+                release.wait(5)
+                response.set_cookie('session', str(len(calls)))
+                return 'cookie'
+
+            @expose(coalesce=True)
+            def broken(self):
+                calls.append('broken')
+                release.wait(5)
+                raise ValueError('broken')
+
+            @expose(coalesce=True)
+            def hung(self):
+                calls.append('hung')
+                if len(calls) == 1:
+                    release.wait(5)
+                return 'hung %d' % len(calls)
+
+        self.app = Pecan(RootController())
+
+    def get_concurrently(self, *paths, **kw):
+        # the first request is handled, and the others are all waiting for
+        # it (if they're coalesced) before it returns
+        responses = {}
+        errors = []
+
+        def get(i, path):
+            try:
+                responses[i] = webob.Request.blank(path, **kw).get_response(
+                    self.app
+                )
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=get, args=(i, path))
+            for i, path in enumerate(paths)
+        ]
+        threads[0].start()
+        while not self.calls:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            flights = list(self.app._flights.values())
+            waiting = sum(flight.followers for flight in flights)
+            if waiting + len(self.calls) >= len(paths):
+                break
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return [responses.get(i) for i in range(len(paths))], errors
+
+    def test_identical_requests_are_coalesced(self):
+        responses, _ = self.get_concurrently('/', '/', '/', '/')
+        assert self.calls == [(1, 'application/json')]
+        for resp in responses:
+            assert resp.status_int == 200
+            assert resp.json == 'page 1'
+            assert resp.content_type == 'application/json'
+        assert self.app._flights == {}
+
+    def test_different_requests_are_not_coalesced(self):
+        responses, _ = self.get_concurrently('/', '/?page=2', '/index.txt')
+        assert sorted(self.calls, key=str) == [
+            ('2', 'application/json'), (1, 'application/json'),
+            (1, 'text/plain')
+        ]
+        assert [r.text for r in responses] == [
+            '"page 1"', '"page 2"', 'page 1'
+        ]
+
+    def test_responses_with_cookies_are_not_shared(self):
+        responses, _ = self.get_concurrently('/cookie', '/cookie')
+        assert self.calls == ['cookie', 'cookie']
+        assert responses[0].headers['Set-Cookie'] != \
+            responses[1].headers['Set-Cookie']
+
+    def test_failures_are_not_shared(self):
+        responses, errors = self.get_concurrently('/broken', '/broken')
+        assert self.calls == ['broken', 'broken']
+        assert len(errors) == 2
+        assert self.app._flights == {}
+
+    def test_requests_stop_waiting_for_hung_requests(self):
+        self.app.coalesce_timeout = 0.05
+        leader = threading.Thread(
+            target=webob.Request.blank('/hung').get_response,
+            args=(self.app,)
+        )
+        leader.start()
+        while not self.calls:
+            time.sleep(0.001)
+        try:
+            resp = webob.Request.blank('/hung').get_response(self.app)
+            assert resp.text == 'hung 2'
+        finally:
+            self.release.set()
+            leader.join(5)
+        assert self.calls == ['hung', 'hung']
+        assert self.app._flights == {}
+
+    def test_other_methods_are_not_coalesced(self):
+        self.release.set()
+        webob.Request.blank('/', method='POST').get_response(self.app)
+        assert self.app._flights == {}
+
+
+class TestETags(PecanTestCase):
+
+    def setUp(self):
+        super(TestETags, self).setUp()
+        self.calls = calls = []
+
+        def version(id):
+            calls.append('version')
+            return 'v%s' % id
+
+        class RootController(object):
+            @expose('json', etag=True)
+            def index(self):
+                calls.append('index')
+                response.cache_control.max_age = 60
+                return dict(items=list(range(10)))
+
+            @expose(etag=version)
+            def thing(self, id):
+                calls.append('thing')
+                return 'Thing %s' % id
+
+            @expose(etag=True)
+            def stream(self):
+                yield 'Hello, '
+                yield 'World!'
+
+            @expose(etag=True, generic=True)
+            def form(self):
+                return 'form'
+
+            @form.when(method='POST', etag=True)
+            def form_post(self):
+                return 'posted'
+
+            @expose()
+            def plain(self):
+                return 'plain'
+
+            @expose(etag=False)
+            def opted_out(self):
+                return 'opted out'
+
+        self.root = RootController()
+        self.app = TestApp(Pecan(self.root))
+
+    def test_etag_is_a_hash_of_the_body(self):
+        r = self.app.get('/')
+        etag = r.headers['ETag']
+        assert etag.startswith('"') and len(etag) == 34
+        assert self.app.get('/').headers['ETag'] == etag
+        assert 'ETag' not in self.app.get('/plain').headers
+
+    def test_not_modified(self):
+        etag = self.app.get('/').headers['ETag']
+        r = self.app.get('/', headers={'If-None-Match': etag}, status=304)
+        assert r.body == b''
+        assert r.headers['ETag'] == etag
+        assert r.headers['Cache-Control'] == 'max-age=60'
+        assert 'Content-Type' not in r.headers
+
+        r = self.app.get('/', headers={'If-None-Match': '"other"'})
+        assert r.status_int == 200
+        assert r.json == dict(items=list(range(10)))
+
+        self.app.get('/', headers={'If-None-Match': 'W/' + etag}, status=304)
+        self.app.head('/', headers={'If-None-Match': etag}, status=304)
+
+    def test_version_callable_skips_the_controller(self):
+        r = self.app.get('/thing/1')
+        assert r.headers['ETag'] == '"v1"'
+        assert r.body == b'Thing 1'
+        assert self.calls == ['version', 'thing']
+
+        r = self.app.get('/thing/1', headers={'If-None-Match': '"v1"'},
+                         status=304)
+        assert r.headers['ETag'] == '"v1"'
+        assert self.calls == ['version', 'thing', 'version']
+
+        r = self.app.get('/thing/2', headers={'If-None-Match': '"v1"'})
+        assert r.headers['ETag'] == '"v2"'
+        assert r.body == b'Thing 2'
+
+    def test_streamed_responses_have_no_etag(self):
+        r = self.app.get('/stream')
+        assert r.body == b'Hello, World!'
+        assert 'ETag' not in r.headers
+
+    def test_only_get_and_head_requests(self):
+        assert 'ETag' in self.app.get('/form').headers
+        assert 'ETag' not in self.app.post('/form').headers
+
+    def test_application_setting(self):
+        app = TestApp(Pecan(self.root, etag=True))
+        etag = app.get('/plain').headers['ETag']
+        app.get('/plain', headers={'If-None-Match': etag}, status=304)
+        assert 'ETag' not in app.get('/opted_out').headers
+
+    def test_cached_responses(self):
+        class RootController(object):
+            @expose(etag=True)
+            @cached()
+            def index(self):
+                return 'Hello, World!'
+
+        app = Pecan(RootController())
+        client = TestApp(app)
+        etag = client.get('/').headers['ETag']
+        client.get('/', headers={'If-None-Match': etag}, status=304)
+        assert client.get('/').headers['ETag'] == etag
+        assert app.response_cache.stats()['hits'] == 2
+
+
+class TestDeadlines(PecanTestCase):
+
+    def setUp(self):
+        super(TestDeadlines, self).setUp()
+        self.now = [100]
+        patcher = mock.patch('pecan.core.monotonic', lambda: self.now[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = calls = []
+        now = self.now
+
+        class DeadlineHook(PecanHook):
+            def before(self, state):
+                calls.append('before')
+                if state.request.path == '/slow_hook':
+                    now[0] += 10
+
+            def after(self, state):
+                calls.append('after')
+                if state.request.path == '/slow_after_hook':
+                    now[0] += 10
+
+            def on_error(self, state, e):
+                calls.append(type(e).__name__)
+
+        class RootController(object):
+            @expose(timeout=5)
+            def index(self, seconds=0):
+                calls.append('index')
+                now[0] += float(seconds)
+                return 'Hello, World!'
+
+            @expose(timeout=5)
+            def slow_hook(self):
+                calls.append('slow_hook')
+                return 'Hello, World!'
+
+            @expose(timeout=5)
+            def slow_after_hook(self):
+                return 'Hello, World!'
+
+            @expose()
+            def default(self):
+                now[0] += 2
+                return 'default'
+
+            @expose(timeout=None)
+            def unlimited(self):
+                now[0] += 100
+                return 'unlimited'
+
+        self.root = RootController()
+        self.hook = DeadlineHook()
+
+    def app(self, **kw):
+        return TestApp(Pecan(self.root, hooks=[self.hook], **kw))
+
+    def test_within_deadline(self):
+        r = self.app().get('/?seconds=4')
+        assert r.body == b'Hello, World!'
+        assert self.calls == ['before', 'index', 'after']
+
+    def test_slow_controller(self):
+        r = self.app().get('/?seconds=5', status=504)
+        assert r.status_int == 504
+        assert self.calls == [
+            'before', 'index', 'HTTPGatewayTimeout', 'after'
+        ]
+
+    def test_slow_before_hook(self):
+        self.app().get('/slow_hook', status=504)
+        assert 'slow_hook' not in self.calls
+        assert self.calls == ['before', 'HTTPGatewayTimeout', 'after']
+
+    def test_slow_after_hook(self):
+        # after hooks may have committed the request's work, so it isn't
+        # turned into an error once they've run
+        r = self.app().get('/slow_after_hook')
+        assert r.body == b'Hello, World!'
+        assert self.calls == ['before', 'after']
+
+    def test_application_timeout(self):
+        app = self.app(request_timeout=1)
+        app.get('/default', status=504)
+        assert app.get('/unlimited').body == b'unlimited'
+        # the controller's own timeout takes precedence
+        assert app.get('/?seconds=4').body == b'Hello, World!'
+
+        app = self.app(request_timeout=3)
+        assert app.get('/default').body == b'default'
+
+    def test_slow_rendering(self):
+        now = self.now
+
+        class SlowRenderer(object):
+            def __init__(self, path, extra_vars):
+                pass
+
+            def render(self, template_path, namespace):
+                now[0] += 10
+                return 'rendered'
+
+        class RootController(object):
+            @expose('slow:index.html', timeout=5)
+            def index(self):
+                return dict()
+
+        app = TestApp(Pecan(
+            RootController(),
+            custom_renderers={'slow': SlowRenderer}
+        ))
+        app.get('/', status=504)
+
+
 class TestCustomResponseandRequest(PecanTestCase):
 
     def test_custom_objects(self):
@@ -1387,6 +2229,93 @@ class TestThreadLocalState(PecanTestCase):
 
         assert state.__dict__ == {}
 
+    def test_context_local_is_the_default(self):
+        from pecan.core import ContextLocal
+        Pecan(SampleRootController())
+
+        from pecan.core import state
+        assert isinstance(state, ContextLocal)
+
+    def test_threading_local_factory(self):
+        import threading
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return request.path
+
+        app = TestApp(Pecan(
+            RootController(),
+            context_local_factory=threading.local
+        ))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.body == b'/'
+
+        from pecan.core import state
+        assert state.__dict__ == {}
+
+    def test_context_is_carried_into_thread_pools(self):
+        import contextvars
+        from concurrent.futures import ThreadPoolExecutor
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                with ThreadPoolExecutor(1) as executor:
+                    return executor.submit(
+                        contextvars.copy_context().run,
+                        lambda: request.path
+                    ).result()
+
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.body == b'/'
+
+
+class TestContextLocal(PecanTestCase):
+
+    def test_attributes(self):
+        from pecan.core import ContextLocal
+        local = ContextLocal()
+        self.assertRaises(AttributeError, getattr, local, 'value')
+
+        local.value = 1
+        assert local.value == 1
+        assert local.__dict__ == {'value': 1}
+
+        del local.value
+        self.assertRaises(AttributeError, getattr, local, 'value')
+
+    def test_bind_and_unbind(self):
+        from pecan.core import ContextLocal
+        local = ContextLocal()
+        local.value = 'outer'
+
+        token = local.bind(value='inner')
+        assert local.value == 'inner'
+        local.unbind(token)
+        assert local.value == 'outer'
+
+    def test_threads_are_isolated(self):
+        import threading
+        from pecan.core import ContextLocal
+        local = ContextLocal()
+        local.value = 'main'
+
+        seen = []
+
+        def target():
+            seen.append(hasattr(local, 'value'))
+            local.value = 'thread'
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        assert seen == [False]
+        assert local.value == 'main'
+
 
 class TestFileTypeExtensions(PecanTestCase):
 
@@ -1574,6 +2503,32 @@ class TestContentTypeByAcceptHeaders(PecanTestCase):
         assert r.status_int == 200
         assert r.content_type == 'text/html'
 
+    def test_negotiation_is_cached(self):
+        from pecan.core import negotiate_content_type
+        negotiate_content_type.cache_clear()
+        app = self.app_
+        for _ in range(3):
+            r = app.get('/', headers={
+                'Accept': 'application/json;q=0.9,text/html;q=0.5'
+            })
+            assert r.content_type == 'application/json'
+        info = negotiate_content_type.cache_info()
+        assert info.misses == 1
+        assert info.hits == 2
+
+    def test_offers_are_precomputed(self):
+        from pecan.util import _cfg
+
+        class RootController(object):
+            @expose('json')
+            @expose(content_type='text/html')
+            def index(self):
+                return {}
+
+        assert _cfg(RootController.index)['offers'] == (
+            'text/html', 'application/json'
+        )
+
 
 class TestCanonicalRouting(PecanTestCase):
 
@@ -1857,6 +2812,60 @@ class TestEngines(PecanTestCase):
         assert b"<h1>Hello, World!</h1>" in r.body
 
     @unittest.skipIf('jinja' not in builtin_renderers, 'Jinja not installed')
+    @unittest.skipIf('genshi' not in builtin_renderers, 'Genshi not installed')
+    def test_genshi_stream(self):
+
+        class RootController(object):
+            @expose('genshi:genshi.html', stream=True)
+            def index(self, name='Jonathan'):
+                return dict(name=name)
+
+        app = Pecan(RootController(), template_path=self.template_path)
+        r = TestApp(app).get('/')
+        assert r.status_int == 200
+        assert b"<h1>Hello, Jonathan!</h1>" in r.body
+
+        start_response = mock.Mock()
+        app_iter = app(webob.Request.blank('/').environ, start_response)
+        assert 'Content-Length' not in dict(start_response.call_args[0][1])
+        chunks = list(app_iter)
+        assert len(chunks) > 1
+        assert b''.join(chunks) == r.body
+
+    @unittest.skipIf('jinja' not in builtin_renderers, 'Jinja not installed')
+    def test_jinja_stream(self):
+
+        class RootController(object):
+            @expose('jinja:jinja.html', stream=True)
+            def index(self, name='Jonathan'):
+                return dict(name=name)
+
+        app = Pecan(RootController(), template_path=self.template_path)
+        r = TestApp(app).get('/')
+        assert r.status_int == 200
+        assert b"<h1>Hello, Jonathan!</h1>" in r.body
+
+        start_response = mock.Mock()
+        app_iter = app(webob.Request.blank('/').environ, start_response)
+        assert 'Content-Length' not in dict(start_response.call_args[0][1])
+        chunks = list(app_iter)
+        assert len(chunks) > 1
+        assert b''.join(chunks) == r.body
+
+    def test_stream_without_renderer_support(self):
+
+        class RootController(object):
+            @expose('mako.html', stream=True)
+            def index(self, name='Jonathan'):
+                return dict(name=name)
+
+        app = TestApp(
+            Pecan(RootController(), template_path=self.template_path)
+        )
+        r = app.get('/')
+        assert r.status_int == 200
+        assert b"<h1>Hello, Jonathan!</h1>" in r.body
+
     def test_jinja(self):
 
         class RootController(object):
@@ -2077,6 +3086,73 @@ class TestExplicitRoute(PecanTestCase):
         r = app.get('/some_path/', expect_errors=True)
         assert r.status_int == 404
 
+    def test_custom_routes_are_detected_once_per_class(self):
+
+        class RootController(object):
+
+            @expose(route='some-path')
+            def some_path(self):
+                return 'Hello, World!'
+
+        app = TestApp(Pecan(RootController()))
+        assert app.get('/some-path/').body == b'Hello, World!'
+
+        from pecan import routing
+        with mock.patch.object(
+            routing, 'getmembers', side_effect=AssertionError
+        ):
+            for _ in range(3):
+                r = app.get('/some-path/')
+                assert r.body == b'Hello, World!'
+
+    def test_custom_routes_can_be_reset(self):
+
+        class RootController(object):
+
+            @expose(route='some-path')
+            def some_path(self):
+                return 'Hello, World!'
+
+        app = TestApp(Pecan(RootController()))
+        assert app.get('/some-path/').body == b'Hello, World!'
+
+        @expose(route='other-path')
+        def other_path(self):
+            return 'Goodbye, World!'
+
+        RootController.other_path = other_path
+
+        @expose(route='renamed-path')
+        def some_path(self):
+            return 'Renamed, World!'
+
+        RootController.some_path = some_path
+        from pecan.routing import reset_route_nodes
+        reset_route_nodes(RootController)
+        assert app.get('/other-path/').body == b'Goodbye, World!'
+        assert app.get('/renamed-path/').body == b'Renamed, World!'
+        r = app.get('/some-path/', expect_errors=True)
+        assert r.status_int == 404
+
+    def test_new_custom_routes_are_seen_without_reset(self):
+
+        class RootController(object):
+
+            @expose(route='some-path')
+            def some_path(self):
+                return 'Hello, World!'
+
+        app = TestApp(Pecan(RootController()))
+        assert app.get('/some-path/').body == b'Hello, World!'
+
+        @expose(route='other-path')
+        def other_path(self):
+            return 'Goodbye, World!'
+
+        RootController.other_path = other_path
+        assert app.get('/other-path/').body == b'Goodbye, World!'
+        assert app.get('/some-path/').body == b'Hello, World!'
+
     def test_manual_route(self):
 
         class SubController(object):
@@ -0,0 +1,395 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock
+
+from webtest import TestApp
+
+from pecan import Pecan, cached, expose, request, response
+from pecan.cache import LRUCache, SQLiteCache, TTLCache, cache_from_config
+from pecan.configuration import Config
+from pecan.hooks import PecanHook
+from pecan.tests import PecanTestCase
+
+
+class TestLRUCache(PecanTestCase):
+
+    def test_get_and_set(self):
+        cache = LRUCache(2)
+        assert cache.get('a') is None
+        assert cache.get('a', 'default') == 'default'
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert 'a' in cache
+        assert len(cache) == 1
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+
+    def test_stats(self):
+        cache = LRUCache(1)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        cache.set('b', 2)
+        assert cache.stats() == dict(
+            hits=1, misses=1, evictions=1, size=1, maxsize=1
+        )
+
+    def test_delete_and_clear(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.delete('a')
+        cache.delete('missing')
+        assert 'a' not in cache
+        cache.clear()
+        assert len(cache) == 0
+
+
+class TestTTLCache(PecanTestCase):
+
+    def test_entries_expire(self):
+        cache = TTLCache(2)
+        with mock.patch('time.monotonic', return_value=100):
+            cache.set('a', 1, ttl=10)
+            cache.set('b', 2)
+        with mock.patch('time.monotonic', return_value=109):
+            assert cache.get('a') == 1
+        with mock.patch('time.monotonic', return_value=110):
+            assert cache.get('a') is None
+            assert cache.get('b') == 2
+        assert 'a' not in cache
+        assert cache.stats()['hits'] == 2
+        assert cache.stats()['misses'] == 1
+
+
+class TestCachedControllers(PecanTestCase):
+
+    def setUp(self):
+        super(TestCachedControllers, self).setUp()
+        self.calls = calls = []
+
+        class CountingHook(PecanHook):
+            def before(self, state):
+                calls.append('before')
+
+            def after(self, state):
+                calls.append('after')
+
+        class RootController(object):
+            @expose()
+            @cached(ttl=60)
+            def index(self, name='World'):
+                calls.append('index')
+                return 'Hello, %s!' % name
+
+            @cached(vary=('Accept',))
+            @expose('json')
+            @expose(content_type='text/plain')
+            def negotiated(self):
+                calls.append('negotiated')
+                return 'World'
+
+            @cached()
+            @expose('json')
+            @expose(content_type='text/plain')
+            def unvaried(self):
+                calls.append('unvaried')
+                return 'World'
+
+            @expose()
+            @cached()
+            def missing(self):
+                calls.append('missing')
+                response.status = 404
+                return 'Missing'
+
+            @expose()
+            @cached()
+            def cookie(self):
+                calls.append('cookie')
+                response.set_cookie('session', 'secret')
+                return 'Cookie'
+
+            @expose()
+            @cached(key=lambda req: req.path)
+            def keyed(self, page=1):
+                calls.append('keyed')
+                return 'Page %s' % page
+
+            @expose(generic=True)
+            @cached()
+            def form(self):
+                calls.append('form')
+                return request.method
+
+            @form.when(method='POST')
+            def form_post(self):
+                calls.append('form_post')
+                return request.method
+
+        self.app = Pecan(RootController(), hooks=[CountingHook()])
+        self.client = TestApp(self.app)
+
+    def test_hits_skip_hooks_and_controller(self):
+        r = self.client.get('/')
+        assert r.body == b'Hello, World!'
+        assert self.calls == ['before', 'index', 'after']
+
+        r = self.client.get('/')
+        assert r.status_int == 200
+        assert r.body == b'Hello, World!'
+        assert r.content_type == 'text/html'
+        assert self.calls == ['before', 'index', 'after']
+        assert self.app.response_cache.stats()['hits'] == 1
+
+    def test_query_string_is_part_of_the_key(self):
+        assert self.client.get('/?name=Pecan').body == b'Hello, Pecan!'
+        assert self.client.get('/').body == b'Hello, World!'
+        assert self.client.get('/?name=Pecan').body == b'Hello, Pecan!'
+        assert self.calls.count('index') == 2
+
+    def test_head_is_served_from_cache(self):
+        self.client.get('/')
+        r = self.client.head('/')
+        assert r.status_int == 200
+        assert r.body == b''
+        assert self.calls.count('index') == 1
+
+    def test_head_is_not_stored(self):
+        self.client.head('/')
+        self.client.get('/')
+        assert self.calls.count('index') == 2
+
+    def test_vary(self):
+        r = self.client.get('/negotiated', headers={
+            'Accept': 'application/json'
+        })
+        assert r.json == 'World'
+        assert r.headers['Vary'] == 'Accept'
+        r = self.client.get('/negotiated', headers={
+            'Accept': 'application/json'
+        })
+        assert r.json == 'World'
+        assert r.headers['Vary'] == 'Accept'
+        assert self.calls.count('negotiated') == 1
+
+        r = self.client.get('/negotiated', headers={'Accept': 'text/plain'})
+        assert r.body == b'World'
+        assert self.calls.count('negotiated') == 2
+
+    def test_content_types_are_cached_separately(self):
+        for _ in range(2):
+            r = self.client.get('/unvaried', headers={
+                'Accept': 'application/json'
+            })
+            assert r.content_type == 'application/json'
+            assert r.json == 'World'
+            r = self.client.get('/unvaried', headers={'Accept': 'text/plain'})
+            assert r.content_type == 'text/plain'
+            assert r.body == b'World'
+        assert self.calls.count('unvaried') == 2
+
+    def test_uncacheable_responses(self):
+        for path in ('/missing', '/cookie'):
+            for _ in range(2):
+                self.client.get(path, expect_errors=True)
+            assert self.calls.count(path[1:]) == 2
+
+    def test_custom_key(self):
+        assert self.client.get('/keyed?page=1').body == b'Page 1'
+        assert self.client.get('/keyed?page=2').body == b'Page 1'
+        assert self.calls.count('keyed') == 1
+
+    def test_other_methods_are_not_cached(self):
+        for _ in range(2):
+            assert self.client.post('/form').body == b'POST'
+        assert self.client.get('/form').body == b'GET'
+        assert self.client.get('/form').body == b'GET'
+        assert self.calls.count('form_post') == 2
+        assert self.calls.count('form') == 1
+
+    def test_ttl(self):
+        with mock.patch('time.monotonic', return_value=100):
+            self.client.get('/')
+        with mock.patch('time.monotonic', return_value=159):
+            self.client.get('/')
+        with mock.patch('time.monotonic', return_value=160):
+            self.client.get('/')
+        assert self.calls.count('index') == 2
+
+    def test_custom_backend(self):
+        backend = TTLCache(8)
+
+        class RootController(object):
+            @expose()
+            @cached(backend=backend)
+            def index(self):
+                return 'Hello, World!'
+
+        app = TestApp(Pecan(RootController()))
+        app.get('/')
+        app.get('/')
+        assert backend.stats()['hits'] == 1
+        assert len(backend) == 1
+
+    def test_application_backend(self):
+        backend = TTLCache(8)
+
+        class RootController(object):
+            @expose()
+            @cached()
+            def index(self):
+                return 'Hello, World!'
+
+        app = Pecan(RootController(), response_cache=backend)
+        assert app.response_cache is backend
+        TestApp(app).get('/')
+        assert len(backend) == 1
+
+
+class TestSQLiteCache(PecanTestCase):
+
+    def setUp(self):
+        super(TestSQLiteCache, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(TestSQLiteCache, self).tearDown()
+
+    def test_get_and_set(self):
+        cache = SQLiteCache(self.path)
+        assert cache.get('a') is None
+        assert cache.get('a', 'default') == 'default'
+        cache.set('a', ('200 OK', [('Content-Type', 'text/plain')], b'x'))
+        assert cache.get('a') == (
+            '200 OK', [('Content-Type', 'text/plain')], b'x'
+        )
+        assert 'a' in cache
+        assert len(cache) == 1
+        cache.delete('a')
+        assert 'a' not in cache
+
+    def test_shared_between_instances(self):
+        # (as it would be between processes)
+        first = SQLiteCache(self.path)
+        second = SQLiteCache(self.path)
+        first.set('a', 1)
+        assert second.get('a') == 1
+        second.clear()
+        assert first.get('a') is None
+
+    def test_entries_expire(self):
+        cache = SQLiteCache(self.path)
+        with mock.patch('time.time', return_value=100):
+            cache.set('a', 1, ttl=10)
+            cache.set('b', 2)
+        with mock.patch('time.time', return_value=109):
+            assert cache.get('a') == 1
+        with mock.patch('time.time', return_value=110):
+            assert cache.get('a') is None
+            assert 'a' not in cache
+            assert cache.get('b') == 2
+            # expired entries are purged when others are stored
+            cache.set('c', 3)
+        assert len(cache) == 2
+
+    def test_oldest_entries_are_evicted(self):
+        cache = SQLiteCache(self.path, maxsize=2)
+        for i, key in enumerate('abc'):
+            with mock.patch('time.time', return_value=100 + i):
+                cache.set(key, i)
+        assert 'a' not in cache
+        assert cache.get('b') == 1
+        assert cache.get('c') == 2
+        cache.get('a')
+        assert cache.stats() == dict(
+            hits=2, misses=1, evictions=1, size=2, maxsize=2
+        )
+
+    def test_values(self):
+        cache = SQLiteCache(self.path)
+        for value in (
+            ('200 OK', [('Content-Type', 'text/plain')], b'x'),
+            b'\x00bytes',
+            '<p>Hello, World!</p>',
+            {'items': [1, 2]},
+            None
+        ):
+            cache.set('a', value)
+            assert cache.get('a', 'default') == value
+        self.assertRaises(TypeError, cache.set, 'a', object())
+
+    def test_values_are_not_pickled(self):
+        cache = SQLiteCache(self.path)
+        cache.set('a', ('200 OK', [('Content-Type', 'text/plain')], b'x'))
+        row = sqlite3.connect(self.path).execute(
+            'SELECT status, data, body FROM pecan_cache'
+        ).fetchone()
+        assert row == ('200 OK', '[["Content-Type", "text/plain"]]', b'x')
+
+    def test_close(self):
+        cache = SQLiteCache(self.path)
+        connection = cache._connection()
+        cache.close()
+        self.assertRaises(
+            sqlite3.ProgrammingError, connection.execute, 'SELECT 1'
+        )
+        # a new connection is opened when it's used again
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert cache._connection() is not connection
+        cache.close()
+
+    def test_reconnects_after_fork(self):
+        cache = SQLiteCache(self.path)
+        connection = cache._connection()
+        assert cache._connection() is connection
+        with mock.patch('os.getpid', return_value=-1):
+            assert cache._connection() is not connection
+
+    def test_from_config(self):
+        cache = cache_from_config(Config({
+            'backend': 'sqlite',
+            'path': self.path,
+            'maxsize': 10
+        }))
+        assert isinstance(cache, SQLiteCache)
+        assert cache.maxsize == 10
+
+        cache = cache_from_config({'maxsize': 10})
+        assert isinstance(cache, TTLCache)
+        assert cache.maxsize == 10
+
+        self.assertRaises(ValueError, cache_from_config, {'backend': 'x'})
+
+    def test_cached_controllers(self):
+        calls = []
+
+        class RootController(object):
+            @expose('json')
+            @cached()
+            def index(self):
+                calls.append('index')
+                return dict(hello='World')
+
+        config = {'backend': 'sqlite', 'path': self.path}
+        for _ in range(2):
+            # each app (like each worker process) has its own connection
+            app = Pecan(RootController(), response_cache=config)
+            assert isinstance(app.response_cache, SQLiteCache)
+            r = TestApp(app).get('/')
+            assert r.json == {'hello': 'World'}
+            assert r.content_type == 'application/json'
+        assert calls == ['index']
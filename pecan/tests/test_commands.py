@@ -4,24 +4,29 @@ from pecan.tests import PecanTestCase
 class TestCommandManager(PecanTestCase):
 
     def test_commands(self):
-        from pecan.commands import ServeCommand, ShellCommand, CreateCommand
+        from pecan.commands import (
+            ServeCommand, ShellCommand, CreateCommand, FingerprintCommand
+        )
         from pecan.commands.base import CommandManager
         m = CommandManager()
         assert m.commands['serve'] == ServeCommand
         assert m.commands['shell'] == ShellCommand
         assert m.commands['create'] == CreateCommand
+        assert m.commands['fingerprint'] == FingerprintCommand
 
 
 class TestCommandRunner(PecanTestCase):
 
     def test_commands(self):
         from pecan.commands import (
-            ServeCommand, ShellCommand, CreateCommand, CommandRunner
+            ServeCommand, ShellCommand, CreateCommand, FingerprintCommand,
+            CommandRunner
         )
         runner = CommandRunner()
         assert runner.commands['serve'] == ServeCommand
         assert runner.commands['shell'] == ShellCommand
         assert runner.commands['create'] == CreateCommand
+        assert runner.commands['fingerprint'] == FingerprintCommand
 
     def test_run(self):
         from pecan.commands import CommandRunner
@@ -54,3 +59,40 @@ class TestCreateCommand(PecanTestCase):
         c = CreateCommand()
         c.manager = FakeManager()
         c.run(FakeArg())
+
+
+class TestFingerprintCommand(PecanTestCase):
+
+    def test_run(self):
+        import json
+        import os
+        import shutil
+        import tempfile
+        from pecan.commands import FingerprintCommand
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        static_root = os.path.join(directory, 'public')
+        os.mkdir(static_root)
+        with open(os.path.join(static_root, 'app.css'), 'w') as f:
+            f.write('body {}')
+        config = os.path.join(directory, 'config.py')
+        with open(config, 'w') as f:
+            f.write("app = {'static_root': %r}\n" % static_root)
+
+        class FakeArg(object):
+            config_file = config
+
+        FingerprintCommand().run(FakeArg())
+        with open(os.path.join(static_root, 'static-manifest.json')) as f:
+            manifest = json.load(f)
+        assert list(manifest) == ['app.css']
+        assert os.path.isfile(os.path.join(static_root, manifest['app.css']))
+
+    def test_static_root_is_required(self):
+        from pecan.commands import FingerprintCommand
+
+        class FakeArg(object):
+            config_file = {'app': {'static_root': None}}
+
+        self.assertRaises(RuntimeError, FingerprintCommand().run, FakeArg())
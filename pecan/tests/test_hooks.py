@@ -1,12 +1,14 @@
 import inspect
 import operator
 from io import StringIO
+from unittest import mock
 
 from webtest import TestApp
 
 from pecan import make_app, expose, redirect, abort, rest, Request, Response
 from pecan.hooks import (
-    PecanHook, TransactionHook, HookController, RequestViewerHook
+    PecanHook, TransactionHook, HookController, RequestViewerHook,
+    RateLimitHook
 )
 from pecan.configuration import Config
 from pecan.decorators import transactional, after_commit, after_rollback
@@ -1728,3 +1730,158 @@ class TestRestControllerWithHooks(PecanTestCase):
         assert response.status_int == 200
         assert response.body == b'Deleting 100'
         assert response.headers['X-Testing'] == 'XYZ'
+
+
+class TestHookChains(PecanTestCase):
+
+    def test_hooks_are_filtered_per_phase(self):
+        run_hook = []
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                run_hook.append('inside')
+                return 'Hello, World!'
+
+        class BeforeHook(PecanHook):
+            def before(self, state):
+                run_hook.append('before')
+
+        class AfterHook(PecanHook):
+            def after(self, state):
+                run_hook.append('after')
+
+        before, after = BeforeHook(), AfterHook()
+        app = make_app(RootController(), hooks=[before, after])
+        assert app.application.hooks.phases == {
+            'on_route': [],
+            'before': [before],
+            'after': [after],
+            'on_error': []
+        }
+
+        response = TestApp(app).get('/')
+        assert response.status_int == 200
+        assert run_hook == ['before', 'inside', 'after']
+
+    def test_instance_level_phase_override(self):
+        run_hook = []
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'Hello, World!'
+
+        hook = PecanHook()
+        hook.after = lambda state: run_hook.append('after')
+
+        app = TestApp(make_app(RootController(), hooks=[hook]))
+        app.get('/')
+        assert run_hook == ['after']
+
+    def test_controller_hook_chains_are_cached(self):
+        run_hook = []
+
+        class SimpleHook(PecanHook):
+            def __init__(self, id, priority):
+                self.id = str(id)
+                self.priority = priority
+
+            def before(self, state):
+                run_hook.append('before' + self.id)
+
+        class RootController(HookController):
+            __hooks__ = [SimpleHook(2, 2)]
+
+            @expose()
+            def index(self):
+                run_hook.append('inside')
+                return 'Hello, World!'
+
+        root = RootController()
+        app = make_app(root, hooks=[SimpleHook(1, 1), SimpleHook(3, 3)])
+        pecan_app = app.application
+        hooks = pecan_app.determine_hooks(root.index)
+        assert [h.id for h in hooks] == ['1', '2', '3']
+        assert pecan_app.determine_hooks(root.index) is hooks
+
+        TestApp(app).get('/')
+        assert run_hook == ['before1', 'before2', 'before3', 'inside']
+
+
+class TestRateLimitHook(PecanTestCase):
+
+    def setUp(self):
+        super(TestRateLimitHook, self).setUp()
+        self.now = [1000.0]
+        patcher = mock.patch('time.monotonic', lambda: self.now[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.routed = routed = []
+
+        class RootController(object):
+            @expose()
+            def index(self, name='World'):
+                routed.append(name)
+                return 'Hello, %s!' % name
+
+        self.root = RootController()
+
+    def app(self, *args, **kw):
+        return TestApp(make_app(self.root, hooks=[RateLimitHook(*args, **kw)]))
+
+    def get(self, app, ip='10.0.0.1', **kw):
+        return app.get(
+            '/', extra_environ={'REMOTE_ADDR': ip}, expect_errors=True, **kw
+        )
+
+    def test_rejects_requests_beyond_the_rate(self):
+        app = self.app(rate=0.5, burst=2)
+        assert self.get(app).status_int == 200
+        assert self.get(app).status_int == 200
+        r = self.get(app)
+        assert r.status_int == 429
+        assert r.headers['Retry-After'] == '2'
+        assert len(self.routed) == 2
+
+        # other clients have their own buckets
+        assert self.get(app, ip='10.0.0.2').status_int == 200
+
+        # and tokens are refilled over time
+        self.now[0] += 2
+        assert self.get(app).status_int == 200
+        assert self.get(app).status_int == 429
+
+    def test_rejected_before_parameters_are_parsed(self):
+        app = self.app(rate=1)
+        self.get(app)
+        with mock.patch('pecan.core.PecanBase._resolve_controller') as route:
+            assert self.get(app).status_int == 429
+            assert not route.called
+
+    def test_keyed_by_header(self):
+        app = self.app(rate=1, header='X-Api-Key')
+        assert self.get(app, headers={'X-Api-Key': 'a'}).status_int == 200
+        assert self.get(app, headers={'X-Api-Key': 'b'}).status_int == 200
+        assert self.get(app, headers={'X-Api-Key': 'a'}).status_int == 429
+        # requests without the header are limited by IP address
+        assert self.get(app).status_int == 200
+        assert self.get(app).status_int == 429
+
+    def test_keyed_by_function(self):
+        app = self.app(
+            rate=1,
+            key=lambda req: None if req.params.get('name') == 'admin'
+            else 'everyone'
+        )
+        assert self.get(app).status_int == 200
+        assert self.get(app, ip='10.0.0.2').status_int == 429
+        for _ in range(3):
+            r = app.get('/?name=admin')
+            assert r.status_int == 200
+
+    def test_invalid_rates(self):
+        self.assertRaises(ValueError, RateLimitHook, rate=0)
+        self.assertRaises(ValueError, RateLimitHook, rate=-1)
+        self.assertRaises(ValueError, RateLimitHook, rate=1, burst=0)
+        assert RateLimitHook(rate=0.5).burst == 1
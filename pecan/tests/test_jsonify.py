@@ -1,6 +1,15 @@
+import dataclasses
+import enum
+import unittest
+import warnings
 from datetime import datetime, date
 from decimal import Decimal
 from json import loads
+from uuid import UUID
+try:
+    import orjson
+except ImportError:
+    orjson = None  # noqa
 try:
     from sqlalchemy import orm, schema, types
     from sqlalchemy.engine import create_engine
@@ -11,7 +20,10 @@ except ImportError:
 from webtest import TestApp
 from webob.multidict import MultiDict
 
-from pecan.jsonify import jsonify, encode, ResultProxy, RowProxy
+from pecan import jsonify as jsonify_module
+from pecan.jsonify import (jsonify, encode, decode, iterencode,
+                           register_fields, set_backend, get_backend,
+                           JSONBackend, ResultProxy, RowProxy)
 from pecan import Pecan, expose
 from pecan.tests import PecanTestCase
 
@@ -116,6 +128,355 @@ class TestJsonifyGenericEncoder(PecanTestCase):
         self.assertRaises(TypeError, encode, Foo())
 
 
+class TestJsonifyEncoderCache(PecanTestCase):
+
+    def test_rules_registered_after_encoding_are_used(self):
+        Person = make_person()
+        p = Person('Jonathan', 'LaCour')
+        self.assertRaises(TypeError, encode, p)
+
+        @jsonify.register(Person)
+        def jsonify_person(obj):
+            return dict(name=obj.name)
+
+        assert loads(encode(p)) == {'name': 'Jonathan LaCour'}
+
+        # rules for a base class apply to subclasses which haven't been
+        # encoded yet, too
+        class Employee(Person):
+            pass
+
+        jsonify.when_type(Employee)(lambda obj: dict(employee=obj.name))
+        assert loads(encode(Employee('Ryan', 'Petrello'))) == {
+            'employee': 'Ryan Petrello'
+        }
+        assert loads(encode(p)) == {'name': 'Jonathan LaCour'}
+
+    def test_rules_registered_for_unions_are_used(self):
+        Person, Employee = make_person(), make_person()
+        p = Person('Jonathan', 'LaCour')
+        self.assertRaises(TypeError, encode, p)
+
+        register = jsonify.register(Person | Employee)
+        self.assertRaises(TypeError, encode, p)
+
+        @register
+        def jsonify_person(obj):
+            return dict(name=obj.name)
+
+        assert loads(encode(p)) == {'name': 'Jonathan LaCour'}
+
+    def test_json_attribute_is_checked_per_instance(self):
+        class Foo(object):
+            pass
+
+        foo, bar = Foo(), Foo()
+        bar.__json__ = lambda: 'bar'
+        assert loads(encode([bar])) == ['bar']
+        self.assertRaises(TypeError, encode, foo)
+        assert loads(encode(bar)) == 'bar'
+
+
+class TestRegisterFields(PecanTestCase):
+
+    def test_dataclass(self):
+        @register_fields
+        @dataclasses.dataclass
+        class Point(object):
+            x: int
+            y: int
+
+        assert loads(encode([Point(1, 2)])) == [{'x': 1, 'y': 2}]
+
+    def test_slots(self):
+        class Named(object):
+            __slots__ = ('name', '__weakref__')
+
+            def __init__(self, name):
+                self.name = name
+
+        class Account(Named):
+            __slots__ = ('__balance',)
+
+            def __init__(self, name, balance):
+                super(Account, self).__init__(name)
+                self.__balance = balance
+
+        register_fields(Account)
+        assert loads(encode(Account('Jonathan', Decimal('1.5')))) == {
+            'name': 'Jonathan',
+            '__balance': 1.5
+        }
+
+    def test_private_slots_of_base_classes(self):
+        class Account(object):
+            __slots__ = ('__balance',)
+
+            def __init__(self, balance):
+                self.__balance = balance
+
+        class SavingsAccount(Account):
+            __slots__ = ('rate', '__months')
+
+            def __init__(self, balance, rate, months):
+                super(SavingsAccount, self).__init__(balance)
+                self.rate = rate
+                self.__months = months
+
+        register_fields(SavingsAccount)
+        assert loads(encode(SavingsAccount(10, 2, 12))) == {
+            '__balance': 10,
+            'rate': 2,
+            '__months': 12
+        }
+
+    def test_single_field(self):
+        Person = make_person()
+        register_fields(Person, fields=['first_name'])
+        assert loads(encode(Person('Jonathan', 'LaCour'))) == {
+            'first_name': 'Jonathan'
+        }
+
+    def test_explicit_fields(self):
+        Person = make_person()
+
+        @register_fields(fields=['first_name', 'name'])
+        class Employee(Person):
+            pass
+
+        assert loads(encode(Employee('Jonathan', 'LaCour'))) == {
+            'first_name': 'Jonathan',
+            'name': 'Jonathan LaCour'
+        }
+
+    def test_invalid_fields(self):
+        Person = make_person()
+        self.assertRaises(TypeError, register_fields, Person)
+        self.assertRaises(
+            ValueError, register_fields, Person, fields=['first-name']
+        )
+        self.assertRaises(
+            ValueError, register_fields, Person, fields=['class']
+        )
+        self.assertRaises(
+            ValueError, register_fields, Person, fields=['first_name.upper']
+        )
+
+
+class TestJSONBackends(PecanTestCase):
+
+    def setUp(self):
+        super(TestJSONBackends, self).setUp()
+        self.addCleanup(set_backend, get_backend())
+
+    def test_default_backend(self):
+        assert get_backend().name == 'json'
+        assert decode('{"a": [1, 2]}') == {'a': [1, 2]}
+        assert decode(b'{"a": [1, 2]}') == {'a': [1, 2]}
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, set_backend, 'missing')
+
+    def test_uninstalled_backend_falls_back_to_stdlib(self):
+        class UninstalledBackend(JSONBackend):
+            def __init__(self):
+                raise ImportError('No module named uninstalled')
+
+        self.addCleanup(jsonify_module._backends.pop, 'uninstalled')
+        jsonify_module._backends['uninstalled'] = UninstalledBackend
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            backend = set_backend('uninstalled')
+        assert backend.name == 'json'
+        assert get_backend() is backend
+        assert issubclass(w[0].category, RuntimeWarning)
+
+    def test_custom_backend(self):
+        class RecordingBackend(JSONBackend):
+            encoded = []
+            decoded = []
+
+            def encode(self, obj):
+                self.encoded.append(obj)
+                return super(RecordingBackend, self).encode(obj)
+
+            def decode(self, data):
+                self.decoded.append(data)
+                return super(RecordingBackend, self).decode(data)
+
+        class RootController(object):
+            @expose('json')
+            def index(self, name):
+                return dict(name=name)
+
+        backend = RecordingBackend()
+        app = TestApp(Pecan(RootController(), json_backend=backend))
+        assert get_backend() is backend
+
+        r = app.post_json('/', {'name': 'Pecan'})
+        assert loads(r.body.decode()) == {'name': 'Pecan'}
+        assert backend.decoded == [b'{"name": "Pecan"}']
+        assert backend.encoded == [{'name': 'Pecan'}]
+
+    @unittest.skipIf(orjson is None, 'orjson not installed')
+    def test_orjson(self):
+        Person = make_person()
+
+        @jsonify.register(Person)
+        def jsonify_person(obj):
+            return dict(name=obj.name)
+
+        now = datetime.now()
+        value = {
+            'person': Person('Jonathan', 'LaCour'),
+            'when': now,
+            'amount': Decimal('1.5'),
+            'big': 2 ** 70,
+            1: None
+        }
+        expected = loads(encode(value))
+
+        assert set_backend('orjson').name == 'orjson'
+        assert loads(encode(value)) == expected
+        assert expected['when'] == str(now)
+        assert decode(b'{"a": 1}') == {'a': 1}
+        self.assertRaises(TypeError, encode, object())
+        self.assertRaises(ValueError, decode, b'{')
+
+    @unittest.skipIf(orjson is None, 'orjson not installed')
+    def test_orjson_respects_rules_for_native_types(self):
+        class Color(enum.Enum):
+            RED = 1
+
+        @jsonify.register(Color)
+        def jsonify_color(obj):
+            return obj.name.lower()
+
+        @jsonify.register(UUID)
+        def jsonify_uuid(obj):
+            return 'uuid:%s' % obj.hex[:4]
+
+        value = {'id': UUID(int=0), 'c': Color.RED, 'n': [1, 'é']}
+        expected = encode(value)
+        assert loads(expected) == {
+            'id': 'uuid:0000', 'c': 'red', 'n': [1, 'é']
+        }
+
+        set_backend('orjson')
+        assert loads(encode(value)) == loads(expected)
+        assert encode(value) == '{"id":"uuid:0000","c":"red","n":[1,"é"]}'
+        # (regardless of whether anything else in it needs the fallback)
+        value['big'] = 2 ** 70
+        assert loads(encode(value))['c'] == 'red'
+
+
+class TestJsonifyIterencode(PecanTestCase):
+
+    values = (
+        {},
+        [],
+        'text',
+        [1, 2.5, None, True, [], {}],
+        {'a': [1, (2, 3)], 1: 'int', 1.5: 'float', None: 'none'},
+        {'nested': [{'a': 1}, {'b': [{'c': 'd'}]}]},
+        {'when': date(2012, 1, 1), 'multi': MultiDict(a=1)}
+    )
+
+    def test_output_matches_encode(self):
+        for obj in self.values:
+            assert ''.join(iterencode(obj)) == encode(obj)
+
+    @unittest.skipIf(orjson is None, 'orjson not installed')
+    def test_output_matches_orjson(self):
+        self.addCleanup(set_backend, get_backend())
+        set_backend('orjson')
+        for obj in self.values:
+            assert ''.join(iterencode(obj)) == encode(obj)
+
+        class FakeResultProxy(ResultProxy):
+            def __init__(self, rows):
+                self.rowcount = len(rows)
+                self.rows = rows
+
+            def fetchmany(self, size):
+                rows, self.rows = self.rows[:size], self.rows[size:]
+                return rows
+
+        result = FakeResultProxy([{'id': 1}, {'id': 2}])
+        assert ''.join(iterencode({'result': result})) == (
+            '{"result":{"rows":[{"id":1},{"id":2}],"count":2}}'
+        )
+
+    def test_iterators(self):
+        result = ''.join(iterencode({
+            'numbers': (i for i in range(3)),
+            'empty': iter([])
+        }))
+        assert loads(result) == {'numbers': [0, 1, 2], 'empty': []}
+
+    def test_iterators_are_consumed_lazily(self):
+        produced = []
+
+        def numbers():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        chunks = iterencode({'numbers': numbers()}, chunk_size=10)
+        next(chunks)
+        assert len(produced) < 10
+
+        result = ''.join(chunks)
+        assert len(produced) == 1000
+        assert result.endswith('998, 999]}')
+
+    def test_result_proxy_rows_are_fetched_in_batches(self):
+        class BatchedResultProxy(ResultProxy):
+            def __init__(self, rows):
+                self.rowcount = -1
+                self.rows = list(rows)
+                self.fetches = []
+
+            def fetchmany(self, size):
+                self.fetches.append(size)
+                rows, self.rows = self.rows[:size], self.rows[size:]
+                return rows
+
+        result = BatchedResultProxy({'id': i} for i in range(5))
+        assert loads(''.join(iterencode(result, batch_size=2))) == {
+            'count': 5,
+            'rows': [{'id': i} for i in range(5)]
+        }
+        assert result.fetches == [2, 2, 2, 2]
+
+    def test_jsonify_rules_are_respected(self):
+        class Countdown(object):
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                raise StopIteration
+
+        @jsonify.register(Countdown)
+        def jsonify_countdown(obj):
+            return 'liftoff'
+
+        assert ''.join(iterencode([Countdown()])) == '["liftoff"]'
+
+    def test_streamed_json_renderer(self):
+        class RootController(object):
+            @expose('json', stream=True)
+            def index(self):
+                return dict(rows=({'id': i} for i in range(3)))
+
+        r = TestApp(Pecan(RootController())).get('/')
+        assert r.status_int == 200
+        assert r.content_type == 'application/json'
+        assert loads(r.body.decode()) == {
+            'rows': [{'id': 0}, {'id': 1}, {'id': 2}]
+        }
+
+
 class TestJsonifySQLAlchemyGenericEncoder(PecanTestCase):
 
     def setUp(self):
@@ -224,6 +585,13 @@ class TestJsonifySQLAlchemyGenericEncoder(PecanTestCase):
             {'id': 2, 'first_name': 'Ryan', 'last_name': 'Petrello'}
         ]}
 
+    def test_result_proxy_iterencode(self):
+        result = ''.join(iterencode({'users': self.result_proxy}))
+        assert loads(result) == {'users': {'count': 2, 'rows': [
+            {'id': 1, 'first_name': 'Jonathan', 'last_name': 'LaCour'},
+            {'id': 2, 'first_name': 'Ryan', 'last_name': 'Petrello'}
+        ]}}
+
     def test_row_proxy(self):
         result = encode(self.row_proxy)
         assert loads(result) == {
@@ -41,7 +41,8 @@ class TestThreadingLocalUsage(PecanTestCase):
         return RootController
 
     def test_locals_are_not_used(self):
-        with mock.patch('threading.local', side_effect=AssertionError()):
+        with mock.patch('pecan.core.ContextLocal',
+                        side_effect=AssertionError()):
 
             app = TestApp(Pecan(self.root(), use_context_locals=False))
             r = app.get('/')
@@ -51,7 +52,8 @@ class TestThreadingLocalUsage(PecanTestCase):
             self.assertRaises(AssertionError, Pecan, self.root)
 
     def test_threadlocal_argument_warning(self):
-        with mock.patch('threading.local', side_effect=AssertionError()):
+        with mock.patch('pecan.core.ContextLocal',
+                        side_effect=AssertionError()):
 
             app = TestApp(Pecan(self.root(), use_context_locals=False))
             self.assertRaises(
@@ -61,7 +63,8 @@ class TestThreadingLocalUsage(PecanTestCase):
             )
 
     def test_threadlocal_argument_warning_on_generic(self):
-        with mock.patch('threading.local', side_effect=AssertionError()):
+        with mock.patch('pecan.core.ContextLocal',
+                        side_effect=AssertionError()):
 
             app = TestApp(Pecan(self.root(), use_context_locals=False))
             self.assertRaises(
@@ -71,7 +74,8 @@ class TestThreadingLocalUsage(PecanTestCase):
             )
 
     def test_threadlocal_argument_warning_on_generic_delegate(self):
-        with mock.patch('threading.local', side_effect=AssertionError()):
+        with mock.patch('pecan.core.ContextLocal',
+                        side_effect=AssertionError()):
 
             app = TestApp(Pecan(self.root(), use_context_locals=False))
             self.assertRaises(
@@ -1411,7 +1415,8 @@ class TestGeneric(PecanTestCase):
 
     def test_generics_with_im_self_default(self):
         uniq = str(time.time())
-        with mock.patch('threading.local', side_effect=AssertionError()):
+        with mock.patch('pecan.core.ContextLocal',
+                        side_effect=AssertionError()):
             app = TestApp(Pecan(self.root(uniq), use_context_locals=False))
             r = app.get('/', headers={'X-Unique': uniq})
             assert r.status_int == 200
@@ -1420,7 +1425,8 @@ class TestGeneric(PecanTestCase):
 
     def test_generics_with_im_self_with_method(self):
         uniq = str(time.time())
-        with mock.patch('threading.local', side_effect=AssertionError()):
+        with mock.patch('pecan.core.ContextLocal',
+                        side_effect=AssertionError()):
             app = TestApp(Pecan(self.root(uniq), use_context_locals=False))
             r = app.post_json('/', {'foo': 'bar'}, headers={'X-Unique': uniq})
             assert r.status_int == 200
@@ -1429,7 +1435,8 @@ class TestGeneric(PecanTestCase):
 
     def test_generics_with_im_self_with_path(self):
         uniq = str(time.time())
-        with mock.patch('threading.local', side_effect=AssertionError()):
+        with mock.patch('pecan.core.ContextLocal',
+                        side_effect=AssertionError()):
             app = TestApp(Pecan(self.root(uniq), use_context_locals=False))
             r = app.post_json('/echo/', {'foo': 'bar'},
                               headers={'X-Unique': uniq})
@@ -1439,7 +1446,8 @@ class TestGeneric(PecanTestCase):
 
     def test_generics_with_im_self_with_extra_args(self):
         uniq = str(time.time())
-        with mock.patch('threading.local', side_effect=AssertionError()):
+        with mock.patch('pecan.core.ContextLocal',
+                        side_effect=AssertionError()):
             app = TestApp(Pecan(self.root(uniq), use_context_locals=False))
             r = app.get('/extra/123/456', headers={'X-Unique': uniq})
             assert r.status_int == 200
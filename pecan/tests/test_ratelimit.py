@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from pecan.ratelimit import SQLiteTokenBuckets, TokenBuckets
+from pecan.tests import PecanTestCase
+
+
+class TestTokenBuckets(PecanTestCase):
+
+    def test_take(self):
+        buckets = TokenBuckets()
+        with mock.patch('time.monotonic', return_value=100):
+            assert buckets.take('a', rate=1, burst=2) == 0
+            assert buckets.take('a', rate=1, burst=2) == 0
+            assert buckets.take('a', rate=1, burst=2) == 1
+            assert buckets.take('b', rate=1, burst=2) == 0
+        with mock.patch('time.monotonic', return_value=100.5):
+            assert buckets.take('a', rate=1, burst=2) == 0.5
+        with mock.patch('time.monotonic', return_value=101):
+            assert buckets.take('a', rate=1, burst=2) == 0
+        with mock.patch('time.monotonic', return_value=200):
+            # buckets never hold more than `burst` tokens
+            assert buckets.take('a', rate=1, burst=2, cost=2) == 0
+            assert buckets.take('a', rate=1, burst=2) == 1
+
+    def test_least_recently_used_buckets_are_evicted(self):
+        buckets = TokenBuckets(maxsize=2, shards=1)
+        with mock.patch('time.monotonic', return_value=100):
+            buckets.take('a', rate=1, burst=1)
+            buckets.take('b', rate=1, burst=1)
+            buckets.take('c', rate=1, burst=1)
+            # (so 'a' has a full bucket again)
+            assert buckets.take('a', rate=1, burst=1) == 0
+            assert buckets.take('c', rate=1, burst=1) == 1
+
+
+class TestSQLiteTokenBuckets(PecanTestCase):
+
+    def setUp(self):
+        super(TestSQLiteTokenBuckets, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'buckets.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(TestSQLiteTokenBuckets, self).tearDown()
+
+    def test_shared_between_instances(self):
+        # (as they would be between processes)
+        first = SQLiteTokenBuckets(self.path)
+        second = SQLiteTokenBuckets(self.path)
+        with mock.patch('time.time', return_value=100):
+            assert first.take('a', rate=1, burst=2) == 0
+            assert second.take('a', rate=1, burst=2) == 0
+            assert first.take('a', rate=1, burst=2) == 1
+        with mock.patch('time.time', return_value=101):
+            assert second.take('a', rate=1, burst=2) == 0
+
+    def test_full_buckets_are_purged(self):
+        buckets = SQLiteTokenBuckets(self.path, purge_interval=2)
+        with mock.patch('time.time', return_value=100):
+            buckets.take('a', rate=1, burst=2)
+        with mock.patch('time.time', return_value=200):
+            buckets.take('b', rate=1, burst=2)
+        count = buckets._connection().execute(
+            'SELECT COUNT(*) FROM pecan_buckets'
+        ).fetchone()[0]
+        assert count == 1
@@ -136,3 +136,96 @@ class TestArgSpec(unittest.TestCase):
 
         argspec = util._cfg(RootController.index)['argspec']
         assert argspec.args == ['self', 'a', 'b', 'c']
+
+
+class TestArgumentBinder(unittest.TestCase):
+
+    @property
+    def binder(self):
+
+        class RootController(object):
+
+            @expose()
+            def index(self, a, b, c=1, *args, **kwargs):
+                return 'Hello, World!'
+
+        return util._cfg(RootController.index)['binder']
+
+    def test_binder_is_compiled_by_expose(self):
+        binder = self.binder
+        assert binder.argspec.args == ['self', 'a', 'b', 'c']
+        assert binder.method_args == ['a', 'b', 'c']
+        assert binder.defaults == {'c': 1}
+        assert binder.varargs is True
+        assert binder.keywords is True
+
+    def test_bind_remainder_and_params(self):
+        params = {'b': 'B', 'd': 'D'}
+        args, varargs, kwargs = self.binder.bind(params, ['A'])
+        assert args == ['A', 'B', 1]
+        assert varargs == []
+        assert kwargs == {'d': 'D'}
+        assert params == {'d': 'D'}
+
+    def test_bind_varargs(self):
+        args, varargs, kwargs = self.binder.bind({}, ['A', 'B', 'C', 'D'])
+        assert args == ['A', 'B', 'C']
+        assert varargs == ['D']
+
+    def test_bind_unexpected_remainder(self):
+        from webob.exc import HTTPNotFound
+
+        class RootController(object):
+
+            @expose()
+            def index(self, a):
+                return 'Hello, World!'
+
+        binder = util._cfg(RootController.index)['binder']
+        self.assertRaises(HTTPNotFound, binder.bind, {}, ['A', 'B'])
+
+    def test_explicit_binder(self):
+
+        class RootController(object):
+
+            @expose()
+            def index(self, req, resp, a):
+                return 'Hello, World!'
+
+            @expose()
+            def short(self, req):
+                return 'Hello, World!'
+
+        binder = util._cfg(RootController.index)['binder'].explicit()
+        assert binder.argspec.args == ['self', 'a']
+        assert binder is util._cfg(RootController.index)['binder'].explicit()
+        self.assertRaises(
+            IndexError, util._cfg(RootController.short)['binder'].explicit
+        )
+
+    def test_consumes_params(self):
+
+        class RootController(object):
+
+            @expose()
+            def none(self):
+                pass
+
+            @expose()
+            def one(self, a, *args):
+                pass
+
+            @expose()
+            def kwargs(self, **kw):
+                pass
+
+        def binder(f):
+            return util._cfg(f)['binder']
+
+        assert binder(RootController.none).consumes_params([]) is False
+        assert binder(RootController.one).consumes_params([]) is True
+        assert binder(RootController.one).consumes_params(['A']) is False
+        assert binder(RootController.one).consumes_params(
+            ['A', 'B']
+        ) is False
+        assert binder(RootController.kwargs).consumes_params(['A']) is True
@@ -1,3 +1,5 @@
+from webob import exc
+
 from pecan.compat import getargspec as _getargspec
 
 
@@ -50,6 +52,120 @@ def getargspec(method):
     return getargspec(method)
 
 
+class ArgumentBinder(object):
+    '''
+    Maps the path remainder and GET/POST parameters of a request onto the
+    arguments of a controller.  Compiled once from the controller's argspec
+    (by ``@expose``) and cached in its ``_pecan`` config, so that binding
+    doesn't need to re-inspect the argspec on every request.
+
+    :param argspec: The argspec of the controller, as returned by
+                    :func:`getargspec`.
+    '''
+
+    def __init__(self, argspec):
+        self.argspec = argspec
+        self.args = list(argspec.args)
+        self.method_args = self.args[1:]
+        self.names = frozenset(self.args)
+        self.varargs = bool(argspec.varargs)
+        self.keywords = bool(argspec.keywords)
+        self.defaults = {}
+        if argspec.defaults:
+            self.defaults = dict(zip(
+                self.args[-len(argspec.defaults):],
+                argspec.defaults
+            ))
+        self._explicit = None
+
+    def explicit(self):
+        '''
+        Returns a binder which ignores the explicit ``(req, resp)`` arguments
+        that follow ``self`` when ``use_context_locals`` is ``False``.
+
+        Raises an ``IndexError`` if the argspec is too short to contain them.
+        '''
+        if self._explicit is None:
+            positional = self.args[:]
+            positional.pop(1)  # req
+            positional.pop(1)  # resp
+            self._explicit = ArgumentBinder(
+                self.argspec._replace(args=positional)
+            )
+        return self._explicit
+
+    def consumes_params(self, remainder, im_self=None, skip_self=True):
+        '''
+        Returns ``False`` if binding can't possibly use any GET/POST
+        parameters, i.e., the controller doesn't accept ``**kwargs`` and all
+        of its named arguments are satisfied by the path remainder, so that
+        parsing the request's parameters can be skipped.
+
+        Takes the same arguments as :meth:`bind`.
+        '''
+        if self.keywords:
+            return True
+        valid_args = self.method_args if skip_self else self.args
+        if valid_args and remainder:
+            consumed = min(len(remainder), len(valid_args))
+            if im_self is not None:
+                consumed += 1
+            valid_args = valid_args[consumed:]
+        return bool(valid_args)
+
+    def bind(self, all_params, remainder, im_self=None, skip_self=True):
+        '''
+        Returns the ``(args, varargs, kwargs)`` to call the controller with.
+
+        :param all_params: A dictionary of GET/POST parameters.  Parameters
+                           which are bound to a named argument are popped
+                           from it.
+        :param remainder: The (non-empty) path segments left over by routing.
+        :param im_self: The instance for generic controllers, which is passed
+                        explicitly as the first argument.
+        :param skip_self: Whether the first argument in the argspec is
+                          ``self`` (and so not bound from the request).
+        '''
+        args = []
+        varargs = []
+        kwargs = dict()
+        valid_args = self.method_args if skip_self else self.args
+
+        if im_self is not None:
+            args.append(im_self)
+
+        # handle positional arguments
+        if valid_args and remainder:
+            args.extend(remainder[:len(valid_args)])
+            remainder = remainder[len(valid_args):]
+            valid_args = valid_args[len(args):]
+
+        # handle wildcard arguments
+        if any(remainder):
+            if not self.varargs:
+                raise exc.HTTPNotFound()
+            varargs.extend(remainder)
+
+        # handle positional GET/POST params
+        defaults = self.defaults
+        for name in valid_args:
+            if name in all_params:
+                args.append(all_params.pop(name))
+            elif name in defaults:
+                args.append(defaults[name])
+            else:
+                break
+
+        # handle wildcard GET/POST params
+        if self.keywords:
+            names = self.names
+            for name, value in all_params.items():
+                if name not in names:
+                    kwargs[name] = value
+
+        return args, varargs, kwargs
+
+
 def _cfg(f):
     if not hasattr(f, '_pecan'):
         f._pecan = {}
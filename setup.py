@@ -66,6 +66,7 @@ setup(
     serve = pecan.commands:ServeCommand
     shell = pecan.commands:ShellCommand
     create = pecan.commands:CreateCommand
+    fingerprint = pecan.commands:FingerprintCommand
     [pecan.scaffold]
     base = pecan.scaffolds:BaseScaffold
     rest-api = pecan.scaffolds:RestAPIScaffold